@@ -7,19 +7,50 @@ from fastapi import Depends
 from modules import crud, schemas, database
 import os
 import json
+import asyncio
+import subprocess
 from PIL import Image
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from modules import security
 from modules import crud, schemas, database, security
-from modules.document_parser import DocumentParser
-from modules.ai_core import AICore
+from modules import document_parser
+from modules.document_parser import DOC_MAX_PAGES, PARSER_VERSION, DocumentParser
+from modules.llm_cache import LLMCache
+from modules.ai_core import AI_BACKEND, AI_CONTEXT_CHARS, OFFLINE_BACKENDS, AICore
+from modules.image_hash import dhash_file
+from modules.ocr_engine import OCRError, build_ocr_engine
+from modules import image_preprocess
+from modules.sheet_reader import InvalidSheet, SheetReader
+from modules.resilience import AIServiceError, AIServiceUnavailable
+from modules.question_items import split_numbered
+from modules.retrieval import AI_RETRIEVAL, RETRIEVAL_CONTEXT_CHARS, passages_for_questions
+from modules.uploads import UPLOAD_MAX_REQUEST_MB, UploadTooLarge, check_upload_size, save_upload, temp_upload
+from modules.telemetry import DOC_CACHE_LOOKUPS, HTTP_REQUEST_SECONDS, REGISTRY
 from modules import database
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+import hashlib
+import time
+import uuid
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
+# Grade numbered papers question by question (concurrently, cached per question)
+PER_QUESTION_GRADING = os.getenv("AI_PER_QUESTION_GRADING", "1") == "1"
+# Return the stored result when the same student's sheet is re-uploaded byte for byte; sheets that only
+# look alike (perceptual hash within SHEET_HASH_MAX_DISTANCE) are graded and flagged, never reused unconfirmed
+SHEET_DEDUPE = os.getenv("SHEET_DEDUPE", "1") == "1"
+SHEET_HASH_MAX_DISTANCE = int(os.getenv("SHEET_HASH_MAX_DISTANCE", "24"))  # differing bits out of 256
+# Extracted text of uploaded sources, keyed by SHA-256 of the file bytes and the parser version
+DOC_CACHE_ENABLED = os.getenv("DOC_CACHE_ENABLED", "1") == "1"
+DOC_CACHE_PATH = os.getenv("DOC_CACHE_PATH", os.path.join(".cache", "parsed_documents.sqlite3"))
+DOC_CACHE_MAX_MB = int(os.getenv("DOC_CACHE_MAX_MB", "512"))
+DOC_CACHE_MEMORY_ENTRIES = int(os.getenv("DOC_CACHE_MEMORY_ENTRIES", "32"))
+DOC_CACHE_TTL_SECONDS = int(os.getenv("DOC_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+
 # --- A single class to manage the application's state and logic ---
 class AppState:
    # In app.py, replace the __init__ function inside the AppState class
@@ -33,11 +64,23 @@ class AppState:
         api_key = os.getenv("GEMINI_API_KEY")
     
         try:
-            if not api_key:
+            if not api_key and AI_BACKEND not in OFFLINE_BACKENDS:
                 raise ValueError("GEMINI_API_KEY environment variable not found.")
             self.ai_core = AICore(api_key=api_key)
         except (FileNotFoundError, ValueError) as e:
             print(f"CRITICAL ERROR: {e}. The AI Core could not be initialized.")
+        self.ocr = None
+        try:
+            self.ocr = build_ocr_engine(self.ai_core)
+        except OCRError as e:
+            print(f"CRITICAL ERROR: {e} Image uploads cannot be transcribed.")
+        self.sheet_reader = SheetReader(self.ai_core, self.ocr)
+        self.doc_cache = None
+        if DOC_CACHE_ENABLED:
+            try:
+                self.doc_cache = LLMCache(DOC_CACHE_PATH, max_memory_entries=DOC_CACHE_MEMORY_ENTRIES, max_disk_bytes=DOC_CACHE_MAX_MB * 1024 * 1024, ttl_seconds=DOC_CACHE_TTL_SECONDS)
+            except Exception as e:
+                print(f"⚠️  Parsed-document cache disabled: {e}")
     
         self.question_bank = self._load_question_bank()
 
@@ -58,17 +101,57 @@ class AppState:
 
 # --- Create a single global instance of our app state ---
 state = AppState()
+REGISTRY.register_collector(lambda: state.ai_core.metric_families() if state.ai_core else [])
 
 # --- FastAPI Application ---
 app = FastAPI(title="Nextgen Ed API")
 database.create_db_and_tables() # <-- ADD THIS LINE
 
+@app.on_event("shutdown")
+def shutdown_ai_core():
+    if state.ai_core:
+        state.ai_core.shutdown()
+    image_preprocess.shutdown()
+    document_parser.shutdown()
+
+@app.exception_handler(AIServiceError)
+async def ai_service_error_handler(request, exc: AIServiceError):
+    """Model failures surface as 503/502 with the circuit state, never as graded text"""
+    content = {"detail": str(exc), "retryable": exc.retryable}
+    headers = {}
+    if state.ai_core:
+        content["ai_status"] = state.ai_core.resilience_state()
+    if isinstance(exc, AIServiceUnavailable) and exc.retry_after:
+        headers["Retry-After"] = str(max(1, int(exc.retry_after)))
+    return JSONResponse(status_code=503 if exc.retryable else 502, content=content, headers=headers)
+
+@app.exception_handler(InvalidSheet)
+async def invalid_sheet_handler(request, exc: InvalidSheet):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large_handler(request, exc: UploadTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+@app.middleware("http")
+async def limit_request_size(request, call_next):
+    # Refuse oversized bodies from the declared length, before the multipart parser spools them to disk
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > UPLOAD_MAX_REQUEST_MB * 1024 * 1024:
+        return JSONResponse(status_code=413, content={"detail": f"Request body is larger than the {UPLOAD_MAX_REQUEST_MB:g} MB limit."})
+    return await call_next(request)
+
 # Add request logging middleware
 @app.middleware("http")
 async def log_requests(request, call_next):
     print(f"🔍 Request: {request.method} {request.url}")
     print(f"🔍 Headers: {dict(request.headers)}")
+    started = time.perf_counter()
     response = await call_next(request)
+    # Labelled by route template (e.g. /assignments/{assignment_id}) to keep cardinality bounded;
+    # for streamed responses this is the time to the first byte
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, getattr(route, "path", "unmatched"), str(response.status_code))
     print(f"🔍 Response: {response.status_code}")
     return response
 
@@ -122,15 +205,134 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return user
         
 # --- Helper Function ---
-def parse_any_file(file_path: str) -> str:
-    file_type = file_path.split('.')[-1].lower()
-    if file_type in ['pdf', 'pptx']:
-        return state.doc_parser.parse(file_path, file_type)
-    elif file_type in ['png', 'jpg', 'jpeg', 'webp']:
-        img = Image.open(file_path)
-        return state.ai_core.extract_text_from_image(img)
-    else:
-        return f"Error: Unsupported file type '.{file_type}'."
+def file_sha256(source) -> str:
+    """SHA-256 of a file path or an open binary file (read from the start)."""
+    digest = hashlib.sha256()
+    f = open(source, "rb") if isinstance(source, str) else source
+    try:
+        f.seek(0)
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    finally:
+        if f is not source:
+            f.close()
+    return digest.hexdigest()
+
+def parse_any_file(source, filename: str = None) -> str:
+    """
+    Extracted text of an uploaded source: a path or an open binary file such as an upload's
+    spooled file, parsed in place. The parser is picked by sniffing the content; repeat uploads
+    of the same bytes are served from the parsed-document cache.
+    """
+    kind = state.doc_parser.sniff(source, filename)
+    if kind is None:
+        return f"Error: Unsupported file type{f' ({filename})' if filename else ''}."
+    if kind == "image" and state.ocr is None:
+        return "Error: No OCR engine is available to transcribe images."
+    if not state.doc_cache:
+        return parse_file_uncached(source, kind)
+    key = doc_cache_key(kind, file_sha256(source))
+    cached = cached_document(key)
+    if cached is not None:
+        return cached
+    return parse_and_cache(source, kind, key)
+
+def doc_cache_key(kind: str, sha256: str) -> str:
+    # Images are transcribed by the OCR engine, so its name is part of the parser identity
+    parser = f"{PARSER_VERSION}|max_pages={DOC_MAX_PAGES}|ocr={getattr(state.ocr, 'name', None)}"
+    return LLMCache.make_key(kind, parser, sha256)
+
+def cached_document(key: str) -> Optional[str]:
+    cached = state.doc_cache.get(key)
+    DOC_CACHE_LOOKUPS.inc("miss" if cached is None else "hit")
+    return cached
+
+def parse_and_cache(source, kind: str, key: Optional[str]) -> str:
+    text = parse_file_uncached(source, kind)
+    if key and not text.startswith("Error"):
+        state.doc_cache.set(key, text)
+    return text
+
+def parse_file_uncached(source, kind: str) -> str:
+    if kind != "image":
+        return state.doc_parser.parse(source, kind)
+    if not isinstance(source, str):
+        source.seek(0)
+    try:
+        with Image.open(source) as img:
+            return state.ocr.recognize(img).text
+    except (OSError, subprocess.SubprocessError, OCRError) as e:
+        return f"Error: OCR failed: {e}"
+
+async def parse_upload(upload: UploadFile) -> str:
+    """Extracted text of an uploaded file. Most formats parse in place from the upload's spooled
+    buffer; PDFs are copied in chunks to a private temp file first, so PyMuPDF (and the page
+    workers) read pages from disk instead of holding the whole document in memory. The cache is
+    checked against a hash of the spooled upload before that copy, so repeat PDFs are never copied."""
+    check_upload_size(upload)
+    kind = await run_in_threadpool(state.doc_parser.sniff, upload.file, upload.filename)
+    if kind != "pdf":
+        return await run_in_threadpool(parse_any_file, upload.file, upload.filename)
+    key = None
+    if state.doc_cache:
+        key = doc_cache_key(kind, await run_in_threadpool(file_sha256, upload.file))
+        cached = cached_document(key)
+        if cached is not None:
+            return cached
+    async with temp_upload(upload, suffix=".pdf") as path:
+        return await run_in_threadpool(parse_and_cache, path, kind, key)
+
+async def parse_source_upload(source_file: UploadFile) -> str:
+    context = await parse_upload(source_file)
+    if "Error" in context: raise HTTPException(status_code=400, detail=context)
+    return context
+
+async def save_student_sheet(student_sheet: UploadFile, user_id: int, suffix: str = "") -> str:
+    uploads_dir = os.path.join('uploads', 'submissions')
+    os.makedirs(uploads_dir, exist_ok=True)
+    file_ext = os.path.splitext(student_sheet.filename or 'submission.jpg')[1] or '.jpg'
+    # The random part keeps two sheets from the same user in the same second apart
+    saved_path = os.path.join(uploads_dir, f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{user_id}{suffix}_{uuid.uuid4().hex[:8]}{file_ext}")
+    await save_upload(student_sheet, saved_path)
+    return saved_path
+
+async def find_duplicate_sheet(db: Session, user_id: int, assignment_id: int, student_id: Optional[int], saved_path: str, fresh: bool = False, confirm_duplicate_of: Optional[int] = None):
+    """
+    Returns (hashes, duplicate, similar) for a saved sheet. hashes holds the columns to store
+    (sheet_hash, sheet_sha256). duplicate is an earlier graded submission of the same student whose
+    result may be returned instead of grading: a byte-identical upload, or the submission the caller
+    confirmed with confirm_duplicate_of. similar is a perceptually close submission, only reported.
+    """
+    hashes = {"sheet_hash": None, "sheet_sha256": None}
+    try:
+        hashes["sheet_sha256"] = await run_in_threadpool(file_sha256, saved_path)
+        hashes["sheet_hash"] = await run_in_threadpool(dhash_file, saved_path)
+    except Exception as e:
+        print(f"WARN: Could not hash answer sheet: {e}")
+    if fresh or not SHEET_DEDUPE:
+        return hashes, None, None
+    if confirm_duplicate_of is not None:
+        confirmed = crud.get_graded_submission(db, user_id, assignment_id, student_id, confirm_duplicate_of)
+        if not confirmed:
+            raise HTTPException(status_code=400, detail=f"Submission {confirm_duplicate_of} is not a graded submission of this student for this assignment.")
+        return hashes, confirmed, None
+    duplicate = crud.find_duplicate_submission(db, user_id, assignment_id, student_id, hashes["sheet_sha256"]) if hashes["sheet_sha256"] else None
+    if duplicate or not hashes["sheet_hash"]:
+        return hashes, duplicate, None
+    return hashes, None, crud.find_similar_submission(db, user_id, assignment_id, student_id, hashes["sheet_hash"], SHEET_HASH_MAX_DISTANCE)
+
+def discard_duplicate_sheet(saved_path: str, duplicate) -> dict:
+    """Drops the re-uploaded copy of a sheet and returns the stored grading result of the original."""
+    print(f"♻️  Sheet is a duplicate of submission {duplicate.id}; returning its stored result without grading")
+    remove_sheet(saved_path)
+    return json.loads(duplicate.result_json)
+
+def remove_sheet(saved_path: str):
+    """Deletes a saved sheet that no submission will refer to (a duplicate, or one that was not graded)."""
+    try:
+        os.remove(saved_path)
+    except OSError:
+        pass
 
 # --- API Endpoints ---
 @app.get("/", tags=["Status"])
@@ -142,26 +344,54 @@ async def cors_test():
     return {"message": "CORS is working!", "timestamp": datetime.now().isoformat()}
 
 @app.get("/ai-test", tags=["Debug"])
-async def ai_test():
-    """Test AI Core functionality"""
+async def ai_test(live: bool = False):
+    """Reports the cached model probe. Pass live=true to re-run the (paid) probe in the background."""
     if not state.ai_core:
         return {"status": "error", "message": "AI Core not initialized"}
     
-    try:
-        # Test basic AI functionality
-        test_response = state.ai_core.text_model.generate_content("Hello, this is a test.")
-        return {
-            "status": "success", 
-            "message": "AI Core is working",
-            "test_response": test_response.text[:100],
-            "model_info": str(state.ai_core.text_model)
-        }
-    except Exception as e:
-        return {
-            "status": "error", 
-            "message": f"AI Core test failed: {str(e)}",
-            "error_type": type(e).__name__
-        }
+    if live:
+        state.ai_core.start_probe()
+    probe = state.ai_core.probe_state()
+    return {
+        "status": "success" if probe["verified"] else probe["status"],
+        "message": "AI Core is working" if probe["verified"] else "AI Core model probe has not succeeded yet",
+        "probe": probe,
+        "model_info": str(state.ai_core.text_model)
+    }
+
+@app.get("/ready", tags=["Status"])
+async def readiness():
+    """Readiness probe for load balancers; reads the cached probe state, no model call"""
+    if not state.ai_core:
+        return JSONResponse(status_code=503, content={"ready": False, "status": "not_initialized"})
+    probe = state.ai_core.probe_state()
+    return JSONResponse(status_code=200 if probe["ready"] else 503, content=probe)
+
+@app.get("/ai-status", tags=["Debug"])
+async def ai_status():
+    """Circuit breaker, rate limiter and retry counters for Gemini calls"""
+    if not state.ai_core:
+        return {"status": "error", "message": "AI Core not initialized"}
+    return state.ai_core.resilience_state()
+
+@app.get("/ai-routes", tags=["Debug"])
+async def ai_routes():
+    """Task-to-model routing table with per-route latency, token and cost statistics"""
+    if not state.ai_core:
+        return {"status": "error", "message": "AI Core not initialized"}
+    return state.ai_core.route_stats()
+
+@app.get("/ai-cache", tags=["Debug"])
+async def ai_cache_stats():
+    """Hit/miss counters and size of the AI response cache"""
+    if not state.ai_core or not state.ai_core.cache:
+        return {"enabled": False}
+    return {"enabled": True, **state.ai_core.cache.stats()}
+
+@app.get("/metrics", tags=["Debug"])
+async def metrics():
+    """Prometheus text-format metrics: model latency histograms, tokens, image bytes, errors, retries, cache and HTTP latency"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.options("/{path:path}", tags=["CORS"])
 async def options_handler(path: str):
@@ -204,21 +434,49 @@ async def verify_password_endpoint(password: str = Form(...), db: Session = Depe
 @app.post("/generate-assignment", response_model=schemas.GenerationResponse, tags=["Teacher Workbench"])
 async def generate_assignment_endpoint(source_file: UploadFile = File(...)):
     if not state.ai_core: raise HTTPException(status_code=500, detail="AI Core not initialized.")
-    temp_file_path = f"temp_{source_file.filename}"
-    with open(temp_file_path, "wb") as buffer: buffer.write(await source_file.read())
-    context = parse_any_file(temp_file_path)
-    os.remove(temp_file_path)
-    if "Error" in context: raise HTTPException(status_code=400, detail=context)
-    assignment_json = state.ai_core.generate_assignment(context)
+    context = await parse_source_upload(source_file)
+    assignment_json = await state.ai_core.generate_assignment_async(context)
     if not assignment_json: raise HTTPException(status_code=500, detail="AI failed to generate content.")
     return schemas.GenerationResponse(questions=assignment_json.get("questions", ""), answers=assignment_json.get("answers", ""))
 
-@app.post("/refine-content", response_model=schemas.GenerationResponse, tags=["Teacher Workbench"])
+@app.post("/refine-content", response_model=schemas.RefineResponse, tags=["Teacher Workbench"])
 async def refine_content_endpoint(request: schemas.RefineRequest):
     if not state.ai_core: raise HTTPException(status_code=500, detail="AI Core not initialized.")
-    refined_questions = state.ai_core.refine_content(request.previous_questions, f"Refine the questions: {request.feedback}")
-    refined_answers = state.ai_core.refine_content(request.previous_answers, f"Refine the answers: {request.feedback}")
-    return schemas.GenerationResponse(questions=refined_questions, answers=refined_answers)
+    refined = await state.ai_core.refine_assignment_async(request.previous_questions, request.previous_answers, request.feedback)
+    if not refined: raise HTTPException(status_code=500, detail="AI failed to refine content.")
+    return schemas.RefineResponse(**refined)
+
+# --- Streaming (server-sent events) variants of the workbench endpoints ---
+def sse_response(events) -> StreamingResponse:
+    """Streams (event, payload) pairs as SSE. The final "result" event carries a GenerationResponse;
+    failures after the stream has started are reported as an "error" event."""
+    async def body():
+        try:
+            async for event, payload in events:
+                if event == "result":
+                    if not payload:
+                        yield sse_event("error", {"detail": "AI failed to generate content."})
+                        return
+                    response_model = schemas.RefineResponse if "changes" in payload else schemas.GenerationResponse
+                    payload = response_model(**payload).model_dump()
+                yield sse_event(event, payload)
+        except AIServiceError as e:
+            yield sse_event("error", {"detail": str(e), "retryable": e.retryable})
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.post("/generate-assignment/stream", tags=["Teacher Workbench"])
+async def generate_assignment_stream_endpoint(source_file: UploadFile = File(...)):
+    if not state.ai_core: raise HTTPException(status_code=500, detail="AI Core not initialized.")
+    context = await parse_source_upload(source_file)
+    return sse_response(state.ai_core.stream_assignment_async(context))
+
+@app.post("/refine-content/stream", tags=["Teacher Workbench"])
+async def refine_content_stream_endpoint(request: schemas.RefineRequest):
+    if not state.ai_core: raise HTTPException(status_code=500, detail="AI Core not initialized.")
+    return sse_response(state.ai_core.stream_refinement_async(request.previous_questions, request.previous_answers, request.feedback))
 
 @app.post("/save-assignment", tags=["Teacher Workbench"])
 async def save_assignment_endpoint(request: schemas.SaveRequest, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
@@ -232,7 +490,7 @@ async def get_assignments_endpoint(db: Session = Depends(get_db), current_user:
     return {"assignments": [a.name for a in assignments]}
 
 @app.post("/grade-submission", response_model=schemas.GradeResponse, tags=["Student Grader"])
-async def grade_submission_endpoint(assignment_name: str = Form(...), student_sheet: UploadFile = File(...), class_id: Optional[int] = Form(None), student_id: Optional[int] = Form(None), remarks: Optional[str] = Form(None), db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+async def grade_submission_endpoint(assignment_name: str = Form(...), student_sheet: UploadFile = File(...), class_id: Optional[int] = Form(None), student_id: Optional[int] = Form(None), remarks: Optional[str] = Form(None), fresh: bool = Form(False), per_question: Optional[bool] = Form(None), confirm_duplicate_of: Optional[int] = Form(None), db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
     print(f"DEBUG: Grade submission request received from user {current_user.email}")
     if not state.ai_core: raise HTTPException(status_code=500, detail="AI Core not initialized.")
     
@@ -241,47 +499,46 @@ async def grade_submission_endpoint(assignment_name: str = Form(...), student_sh
     if not assignment_row: raise HTTPException(status_code=404, detail="Assignment not found.")
     
     # Save uploaded/captured student sheet to disk for later viewing
-    uploads_dir = os.path.join('uploads', 'submissions')
-    os.makedirs(uploads_dir, exist_ok=True)
-    file_ext = os.path.splitext(student_sheet.filename or 'submission.jpg')[1] or '.jpg'
-    saved_path = os.path.join(uploads_dir, f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{current_user.id}{file_ext}")
-    with open(saved_path, 'wb') as f:
-        f.write(await student_sheet.read())
-
-    # Re-open for processing
-    student_img_pil = Image.open(saved_path)
-    legibility_report = state.ai_core.get_handwriting_legibility(student_img_pil)
-    student_answers_text = state.ai_core.extract_text_from_image(student_img_pil)
+    saved_path = await save_student_sheet(student_sheet, current_user.id)
+
+    try:
+        # Exact re-uploads of this student's graded sheet (or a re-photograph the teacher confirmed with
+        # confirm_duplicate_of) cost no model calls; fresh=True skips this check and bypasses the response cache
+        hashes, duplicate, similar = await find_duplicate_sheet(db, current_user.id, assignment_row.id, student_id, saved_path, fresh, confirm_duplicate_of)
+        if duplicate:
+            return schemas.GradeResponse(**discard_duplicate_sheet(saved_path, duplicate), duplicate_of=duplicate.id)
+        use_cache = not fresh
+        legibility_report, student_answers_text = await state.sheet_reader.read(saved_path, use_cache)
     
-    # Use assignment data from database
-    model_answers, questions = assignment_row.answers, assignment_row.questions
-    print(f"🔍 Starting AI evaluation...")
-    print(f"📚 Model answers: {model_answers[:200]}...")
-    print(f"❓ Questions: {questions[:200]}...")
-    print(f"👤 Student answers: {student_answers_text[:200]}...")
+        # Use assignment data from database
+        model_answers, questions = assignment_row.answers, assignment_row.questions
+        print(f"🔍 Starting AI evaluation...")
+        print(f"📚 Model answers: {model_answers[:200]}...")
+        print(f"❓ Questions: {questions[:200]}...")
+        print(f"👤 Student answers: {student_answers_text[:200]}...")
     
-    eval_result = state.ai_core.evaluate_student_answer(student_answers_text, model_answers, questions, max_marks=100)
-    
-    if not eval_result: 
-        print("❌ AI evaluation failed - no result returned")
-        print("🔄 Attempting fallback evaluation...")
-        
-        # Fallback: Create a basic evaluation result
-        eval_result = {
-            "marks": 50,  # Default score
-            "max_marks": 100,
-            "feedback": "AI evaluation temporarily unavailable. Please review manually.",
-            "key_concepts_missed": "Unable to analyze due to AI service issues",
-            "details": {"Rationale": "Fallback evaluation due to AI service unavailability"}
-        }
-        print(f"⚠️ Using fallback evaluation: {eval_result}")
+        if PER_QUESTION_GRADING if per_question is None else per_question:
+            eval_result = await state.ai_core.evaluate_by_question_async(student_answers_text, model_answers, questions, max_marks=100, use_cache=use_cache)
+        else:
+            eval_result = await state.ai_core.evaluate_student_answer_async(student_answers_text, model_answers, questions, max_marks=100, use_cache=use_cache)
     
+        if not eval_result: 
+            # Never record a made-up score; the teacher can retry the sheet
+            print("❌ AI evaluation failed - no result returned")
+            raise HTTPException(status_code=502, detail="AI evaluation failed to return a usable result. Nothing was recorded; please try again.")
+    except BaseException:
+        # Nothing refers to a sheet that was not graded
+        remove_sheet(saved_path)
+        raise
+
     print(f"✅ AI evaluation successful: {eval_result}")
-    fairness_report = state.ai_core.analyze_feedback_fairness(eval_result.get('feedback', ''))
+    # Start the fairness check now; it runs on the AI worker pool while the submission is persisted
+    fairness_task = asyncio.ensure_future(state.ai_core.analyze_feedback_fairness_async(eval_result.get('feedback', ''), use_cache=use_cache))
     
     # Persist submission for the logged-in user
+    submission = None
     try:
-        crud.create_submission(
+        submission = crud.create_submission(
             db,
             user_id=current_user.id,
             assignment_name=assignment_name,
@@ -294,14 +551,138 @@ async def grade_submission_endpoint(assignment_name: str = Form(...), student_sh
             student_id=student_id,
             student_sheet_path=saved_path,
             remarks=remarks,
+            **hashes,
         )
     except Exception as e:
         print(f"WARN: Failed to record submission: {e}")
+        remove_sheet(saved_path)
 
-    response_data = schemas.GradeResponse(legibility_report=legibility_report, ocr_text=student_answers_text, evaluation=eval_result, fairness_check=fairness_report)
+    try:
+        fairness_report = await fairness_task
+    except AIServiceError as e:
+        # The grade stands on its own; skip the advisory check rather than fail the request
+        fairness_report = f"Fairness Check: Skipped ({e})"
+    response_data = schemas.GradeResponse(legibility_report=legibility_report, ocr_text=student_answers_text, evaluation=eval_result, fairness_check=fairness_report, possible_duplicate_of=similar.id if similar else None)
+    if submission:
+        crud.set_submission_result(db, submission.id, response_data.model_dump_json(exclude={"duplicate_of", "possible_duplicate_of"}))
     print(f"DEBUG: Returning grade response: {response_data}")
     return response_data
 
+@app.post("/grade-submissions-batch", response_model=schemas.BatchGradeResponse, tags=["Student Grader"])
+async def grade_submissions_batch_endpoint(assignment_name: str = Form(...), student_sheets: list[UploadFile] = File(...), student_ids: Optional[str] = Form(None), class_id: Optional[int] = Form(None), fresh: bool = Form(False), per_question: Optional[bool] = Form(None), db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    """Grades a whole class: one vision pass per sheet, then evaluation in a few batched requests.
+    student_ids is an optional comma-separated list aligned with student_sheets. Grading follows
+    the same per_question switch as /grade-submission, so a sheet gets the same marks from both."""
+    if not state.ai_core: raise HTTPException(status_code=500, detail="AI Core not initialized.")
+    assignment_row = crud.get_assignment_by_name_for_user(db, current_user.id, assignment_name)
+    if not assignment_row: raise HTTPException(status_code=404, detail="Assignment not found.")
+    try:
+        ids = [int(x) if x.strip() else None for x in student_ids.split(',')] if student_ids else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="student_ids must be a comma-separated list of integer student ids.")
+    if ids and len(ids) != len(student_sheets):
+        raise HTTPException(status_code=400, detail="student_ids must have one entry per uploaded sheet.")
+    ids = ids or [None] * len(student_sheets)
+
+    for sheet in student_sheets:
+        check_upload_size(sheet)  # reject the batch before any sheet is written
+    saved_paths, recorded = [], {}  # recorded: sheet index -> id of the submission recorded for it
+    try:
+        for i, sheet in enumerate(student_sheets):
+            saved_paths.append(await save_student_sheet(sheet, current_user.id, suffix=f"_{i}"))
+        results = await grade_saved_sheets(db, current_user.id, assignment_row, student_sheets, saved_paths, ids, class_id, fresh, per_question, recorded)
+    finally:
+        # Nothing refers to a sheet that was not graded and recorded (or whose stored duplicate was returned)
+        for i, path in enumerate(saved_paths):
+            if i not in recorded:
+                remove_sheet(path)
+    for i, item in enumerate(results):
+        if i not in recorded:
+            item.student_sheet_path = None
+    return schemas.BatchGradeResponse(results=results)
+
+async def grade_saved_sheets(db: Session, user_id: int, assignment_row, student_sheets: list, saved_paths: list, ids: list, class_id: Optional[int], fresh: bool, per_question: Optional[bool], recorded: dict) -> list:
+    """Grades the saved sheets of a class batch and records them, filling recorded[index] = submission id."""
+    use_cache = not fresh
+    hashes, duplicates, similar = [], {}, {}
+    copies, first_copy = {}, {}  # later identical sheets of one student in this batch -> index of the first
+    for i, path in enumerate(saved_paths):
+        sheet_hashes, duplicate, match = await find_duplicate_sheet(db, user_id, assignment_row.id, ids[i], path, fresh)
+        hashes.append(sheet_hashes)
+        if duplicate:
+            duplicates[i] = (duplicate.id, json.loads(duplicate.result_json))
+            print(f"♻️  Sheet {i} is a duplicate of submission {duplicate.id}; returning its stored result without grading")
+            continue
+        key = (ids[i], sheet_hashes["sheet_sha256"])
+        if SHEET_DEDUPE and sheet_hashes["sheet_sha256"] and key in first_copy:
+            copies[i] = first_copy[key]
+            print(f"♻️  Sheet {i} is identical to sheet {copies[i]} of this batch; grading it once")
+            continue
+        first_copy.setdefault(key, i)
+        if match:
+            similar[i] = match.id
+    skipped = duplicates.keys() | copies.keys()
+    readings = await asyncio.gather(*[state.sheet_reader.read(path, use_cache) for i, path in enumerate(saved_paths) if i not in skipped], return_exceptions=True)
+    readings = iter(readings)
+    readings = [None if i in skipped else next(readings) for i in range(len(saved_paths))]
+
+    to_grade = [{"id": i, "answer": reading[1]} for i, reading in enumerate(readings) if reading is not None and not isinstance(reading, Exception)]
+    evaluate = state.ai_core.evaluate_students_by_question_async if (PER_QUESTION_GRADING if per_question is None else per_question) else state.ai_core.evaluate_students_batch_async
+    evaluations = await evaluate(to_grade, assignment_row.answers, assignment_row.questions, max_marks=100, use_cache=use_cache) if to_grade else {}
+
+    # A failed evaluation request only fails its own students; everyone else is still graded and recorded
+    graded = {i: evaluations.get(str(i)) for i in range(len(student_sheets))}
+    eval_errors = {i: graded.pop(i) for i in list(graded) if isinstance(graded[i], AIServiceError)}
+    # One fairness request for the whole class rather than one per student
+    try:
+        fairness = await state.ai_core.analyze_fairness_batch_async([{"id": i, "feedback": r.get('feedback', '')} for i, r in graded.items() if r], use_cache=use_cache)
+    except AIServiceError as e:
+        fairness = {str(i): f"Fairness Check: Skipped ({e})" for i, r in graded.items() if r}
+
+    results = []
+    for i, (sheet, path, reading) in enumerate(zip(student_sheets, saved_paths, readings)):
+        item = schemas.BatchGradeItem(filename=sheet.filename, student_id=ids[i], student_sheet_path=path, possible_duplicate_of=similar.get(i))
+        if i in duplicates:
+            item.duplicate_of, stored = duplicates[i]
+            item.legibility_report, item.ocr_text = stored.get("legibility_report"), stored.get("ocr_text")
+            item.evaluation, item.fairness_check = stored.get("evaluation"), stored.get("fairness_check")
+        elif i in copies:
+            first = results[copies[i]]
+            item.duplicate_of, item.possible_duplicate_of = recorded.get(copies[i]), first.possible_duplicate_of
+            item.legibility_report, item.ocr_text, item.evaluation, item.fairness_check, item.error = first.legibility_report, first.ocr_text, first.evaluation, first.fairness_check, first.error
+        elif isinstance(reading, Exception):
+            item.error = f"Could not read answer sheet: {reading}"
+        elif i in eval_errors:
+            item.error = f"AI evaluation failed: {eval_errors[i]}. Nothing was recorded; please retry this sheet."
+        elif not graded[i]:
+            item.error = "AI evaluation failed to return a usable result. Nothing was recorded."
+        else:
+            item.legibility_report, item.ocr_text = reading
+            item.evaluation, item.fairness_check = graded[i], fairness.get(str(i))
+            try:
+                result_json = schemas.GradeResponse(legibility_report=item.legibility_report or "", ocr_text=item.ocr_text or "", evaluation=item.evaluation, fairness_check=item.fairness_check).model_dump_json(exclude={"duplicate_of", "possible_duplicate_of"})
+                submission = crud.create_submission(
+                    db,
+                    user_id=user_id,
+                    assignment_name=assignment_row.name,
+                    student_name=None,
+                    score=graded[i].get('marks'),
+                    max_score=graded[i].get('max_marks', 100),
+                    created_at=datetime.utcnow().isoformat(),
+                    assignment_id=assignment_row.id,
+                    class_id=class_id,
+                    student_id=ids[i],
+                    student_sheet_path=path,
+                    **hashes[i],
+                    result_json=result_json,
+                )
+                recorded[i] = submission.id
+            except Exception as e:
+                print(f"WARN: Failed to record submission: {e}")
+        results.append(item)
+    return results
+
+
 # --- Profile Endpoints ---
 @app.get("/me", response_model=schemas.ProfileResponse, tags=["Profile"]) 
 async def read_profile(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
@@ -398,15 +779,13 @@ async def upload_assignment_assets(assignment_name: str = Form(...), question_pa
 
     qp_ext = os.path.splitext(question_paper.filename or 'paper.pdf')[1] or '.pdf'
     qp_path = os.path.join(base_dir, f"{assignment_name}_paper{qp_ext}")
-    with open(qp_path, 'wb') as f:
-        f.write(await question_paper.read())
+    await save_upload(question_paper, qp_path)
 
     ref_path = None
     if reference_answers is not None:
         ra_ext = os.path.splitext(reference_answers.filename or 'answers.pdf')[1] or '.pdf'
         ref_path = os.path.join(base_dir, f"{assignment_name}_ref{ra_ext}")
-        with open(ref_path, 'wb') as f:
-            f.write(await reference_answers.read())
+        await save_upload(reference_answers, ref_path)
 
     # Upsert assignment for this user
     existing = crud.get_assignment_by_name_for_user(db, current_user.id, assignment_name)
@@ -422,107 +801,76 @@ async def upload_assignment_assets(assignment_name: str = Form(...), question_pa
 
     return {"status": "success", "message": "Files uploaded and assignment recorded.", "question_paper_path": qp_path, "reference_answers_path": ref_path}
 
+async def parse_question_paper_uploads(question_paper: UploadFile, source_material: Optional[UploadFile], feedback: Optional[str] = None) -> tuple[str, int | None]:
+    """
+    Parses a question paper and optional reference material into one generation context.
+    Returns (context, context_chars). With AI_RETRIEVAL, long reference material is replaced by
+    the passages retrieved for each question (and the feedback), and context_chars is set so the
+    whole question paper is sent rather than being cut down again, up to AI_CONTEXT_CHARS +
+    RETRIEVAL_CONTEXT_CHARS so an oversized paper cannot blow the prompt budget.
+    """
+    # Parse question paper
+    qp_context = await parse_upload(question_paper)
+    if "Error" in qp_context:
+        raise HTTPException(status_code=400, detail=qp_context)
+    
+    # Parse source material if provided
+    source_context = ""
+    if source_material and source_material.filename:
+        source_context = await parse_upload(source_material)
+        if "Error" in source_context:
+            print(f"Warning: Could not parse source material: {source_context}")
+            source_context = ""
+    
+    if source_context and AI_RETRIEVAL:
+        queries = [item["text"] for item in split_numbered(qp_context)] + ([feedback] if feedback else [])
+        source_context = await run_in_threadpool(passages_for_questions, source_context, queries)
+
+    # Combine contexts for better answer generation
+    combined_context = qp_context
+    if source_context:
+        combined_context += f"\n\nReference Material:\n{source_context}"
+    
+    # Add refinement feedback
+    if feedback:
+        combined_context += f"\n\nRefinement Feedback: {feedback}"
+    if not AI_RETRIEVAL:
+        return combined_context, None
+    max_chars = AI_CONTEXT_CHARS + RETRIEVAL_CONTEXT_CHARS
+    if len(combined_context) > max_chars:
+        print(f"⚠️  Question paper context is {len(combined_context)} chars; sending the first {max_chars}")
+    return combined_context, min(len(combined_context), max_chars)
+
 @app.post("/generate-answers-from-upload", response_model=schemas.GenerationResponse, tags=["Teacher Workbench"]) 
 async def generate_answers_from_upload(question_paper: UploadFile = File(...), source_material: UploadFile = File(None)):
     if not state.ai_core:
         raise HTTPException(status_code=500, detail="AI Core not initialized.")
-    
-    # Save question paper
-    qp_path = os.path.join('uploads', 'temp', question_paper.filename)
-    os.makedirs(os.path.dirname(qp_path), exist_ok=True)
-    with open(qp_path, 'wb') as f:
-        f.write(await question_paper.read())
-    
-    # Save source material if provided
-    source_path = None
-    if source_material and source_material.filename:
-        source_path = os.path.join('uploads', 'temp', f"source_{source_material.filename}")
-        with open(source_path, 'wb') as f:
-            f.write(await source_material.read())
-    
-    try:
-        # Parse question paper
-        qp_context = parse_any_file(qp_path)
-        if "Error" in qp_context:
-            raise HTTPException(status_code=400, detail=qp_context)
-        
-        # Parse source material if provided
-        source_context = ""
-        if source_path:
-            source_context = parse_any_file(source_path)
-            if "Error" in source_context:
-                print(f"Warning: Could not parse source material: {source_context}")
-                source_context = ""
-        
-        # Combine contexts for better answer generation
-        combined_context = qp_context
-        if source_context:
-            combined_context += f"\n\nReference Material:\n{source_context}"
-        
-        assignment_json = state.ai_core.generate_assignment(combined_context)
-        if not assignment_json:
-            raise HTTPException(status_code=500, detail="AI failed to generate content.")
-        
-        return schemas.GenerationResponse(questions=assignment_json.get("questions", ""), answers=assignment_json.get("answers", ""))
-    finally:
-        # Clean up temporary files
-        try:
-            os.remove(qp_path)
-            if source_path:
-                os.remove(source_path)
-        except Exception:
-            pass
+    combined_context, context_chars = await parse_question_paper_uploads(question_paper, source_material)
+    assignment_json = await state.ai_core.generate_assignment_async(combined_context, context_chars=context_chars)
+    if not assignment_json:
+        raise HTTPException(status_code=500, detail="AI failed to generate content.")
+    return schemas.GenerationResponse(questions=assignment_json.get("questions", ""), answers=assignment_json.get("answers", ""))
 
 @app.post("/refine-answers-from-upload", response_model=schemas.GenerationResponse, tags=["Teacher Workbench"]) 
 async def refine_answers_from_upload(question_paper: UploadFile = File(...), feedback: str = Form(...), source_material: UploadFile = File(None)):
     if not state.ai_core:
         raise HTTPException(status_code=500, detail="AI Core not initialized.")
-    
-    # Save question paper
-    qp_path = os.path.join('uploads', 'temp', question_paper.filename)
-    os.makedirs(os.path.dirname(qp_path), exist_ok=True)
-    with open(qp_path, 'wb') as f:
-        f.write(await question_paper.read())
-    
-    # Save source material if provided
-    source_path = None
-    if source_material and source_material.filename:
-        source_path = os.path.join('uploads', 'temp', f"source_{source_material.filename}")
-        with open(source_path, 'wb') as f:
-            f.write(await source_material.read())
-    
-    try:
-        # Parse question paper
-        qp_context = parse_any_file(qp_path)
-        if "Error" in qp_context:
-            raise HTTPException(status_code=400, detail=qp_context)
-        
-        # Parse source material if provided
-        source_context = ""
-        if source_path:
-            source_context = parse_any_file(source_path)
-            if "Error" in source_context:
-                print(f"Warning: Could not parse source material: {source_context}")
-                source_context = ""
-        
-        # Combine contexts for refinement
-        combined_context = qp_context
-        if source_context:
-            combined_context += f"\n\nReference Material:\n{source_context}"
-        
-        # Add refinement feedback
-        combined_context += f"\n\nRefinement Feedback: {feedback}"
-        
-        assignment_json = state.ai_core.generate_assignment(combined_context)
-        if not assignment_json:
-            raise HTTPException(status_code=500, detail="AI failed to refine content.")
-        
-        return schemas.GenerationResponse(questions=assignment_json.get("questions", ""), answers=assignment_json.get("answers", ""))
-    finally:
-        # Clean up temporary files
-        try:
-            os.remove(qp_path)
-            if source_path:
-                os.remove(source_path)
-        except Exception:
-            pass
\ No newline at end of file
+    combined_context, context_chars = await parse_question_paper_uploads(question_paper, source_material, feedback)
+    assignment_json = await state.ai_core.generate_assignment_async(combined_context, context_chars=context_chars)
+    if not assignment_json:
+        raise HTTPException(status_code=500, detail="AI failed to refine content.")
+    return schemas.GenerationResponse(questions=assignment_json.get("questions", ""), answers=assignment_json.get("answers", ""))
+
+@app.post("/generate-answers-from-upload/stream", tags=["Teacher Workbench"])
+async def generate_answers_from_upload_stream(question_paper: UploadFile = File(...), source_material: UploadFile = File(None)):
+    if not state.ai_core:
+        raise HTTPException(status_code=500, detail="AI Core not initialized.")
+    combined_context, context_chars = await parse_question_paper_uploads(question_paper, source_material)
+    return sse_response(state.ai_core.stream_assignment_async(combined_context, context_chars=context_chars))
+
+@app.post("/refine-answers-from-upload/stream", tags=["Teacher Workbench"])
+async def refine_answers_from_upload_stream(question_paper: UploadFile = File(...), feedback: str = Form(...), source_material: UploadFile = File(None)):
+    if not state.ai_core:
+        raise HTTPException(status_code=500, detail="AI Core not initialized.")
+    combined_context, context_chars = await parse_question_paper_uploads(question_paper, source_material, feedback)
+    return sse_response(state.ai_core.stream_assignment_async(combined_context, context_chars=context_chars))
@@ -1,9 +1,89 @@
 # modules/ai_core.py (Corrected Version)
 
 import google.generativeai as genai
+import asyncio
+import functools
 import json
-import re
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .fake_backend import FakeModel
+from .llm_cache import LLMCache, content_hash
+from .replay_backend import RecordingModel, ReplayModel
+from .model_router import ModelRouter
+from .nlp_evaluator import NLP_PRESCORE, AnswerEvaluator
+from .retrieval import AI_RETRIEVAL, RETRIEVAL_CONTEXT_CHARS, representative_passages
+from .question_items import align_items, allocate_marks, merge_items, pair_items, rebuild_numbered, referenced_numbers
+from .text_chunks import chunk_text
+from .structured_output import RESPONSE_SCHEMAS, conforms, parse_json_response, partial_json_array, partial_json_strings
+from .resilience import AIServiceError, AIServiceUnavailable, CircuitBreaker, CircuitOpen, TokenBucket, backoff_delay, is_retryable
+from .telemetry import AI_CACHE_LOOKUPS, AI_ERRORS, AI_IMAGE_BYTES, AI_INPUT_TOKENS, AI_OUTPUT_TOKENS, AI_REQUEST_SECONDS, AI_RETRIES
+
+# Upper bound on Gemini requests in flight per process. Each call blocks a worker
+# thread (the SDK is synchronous), never the event loop.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "32"))
+
+# Client-side protection around Gemini calls: rate limit sized to the API quota,
+# retries for transient errors and a circuit breaker per model that fails fast during outages
+AI_RATE_LIMIT_RPM = float(os.getenv("AI_RATE_LIMIT_RPM", "150"))
+AI_RATE_LIMIT_MAX_WAIT = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT", "30"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+# Batched evaluation: character budget per prompt and a hard cap on students per request
+AI_BATCH_PROMPT_CHARS = int(os.getenv("AI_BATCH_PROMPT_CHARS", "60000"))
+AI_BATCH_MAX_STUDENTS = int(os.getenv("AI_BATCH_MAX_STUDENTS", "20"))
+
+# Source material budget for generation (~4 chars per token). Longer documents are
+# map-reduced: key facts are extracted per chunk concurrently, then the assignment is
+# generated from the reduced notes. With AI_LONG_DOC_MODE=0, AI_RETRIEVAL picks passages instead.
+AI_CONTEXT_CHARS = int(os.getenv("AI_CONTEXT_CHARS", "4000"))
+AI_LONG_DOC_MODE = os.getenv("AI_LONG_DOC_MODE", "1") == "1"
+AI_MAP_CHUNK_CHARS = int(os.getenv("AI_MAP_CHUNK_CHARS", "12000"))
+AI_MAP_CONCURRENCY = int(os.getenv("AI_MAP_CONCURRENCY", "8"))
+AI_REDUCE_CHARS = int(os.getenv("AI_REDUCE_CHARS", "16000"))
+
+# Ask Gemini for schema-constrained JSON on tasks that declare a response schema
+AI_STRUCTURED_OUTPUT = os.getenv("AI_STRUCTURED_OUTPUT", "1") == "1"
+
+# Model backend: "gemini" calls the API, "fake" uses the local stand-in in modules/fake_backend.py,
+# "record" calls the API and saves every response as a fixture, "replay" serves only recorded fixtures
+AI_BACKEND = os.getenv("AI_BACKEND", "gemini")
+MODEL_BACKENDS = {"gemini": genai.GenerativeModel, "fake": FakeModel, "record": RecordingModel, "replay": ReplayModel}
+OFFLINE_BACKENDS = {"fake", "replay"}
+
+# Candidate models in order of preference
+MODEL_CANDIDATES = ['gemini-2.5-pro', 'gemini-2.0-flash-exp', 'gemini-2.0-flash', 'gemini-1.5-pro-latest', 'gemini-1.5-pro', 'gemini-1.5-flash', 'gemini-1.0-pro']
+
+# Where the background model probe is persisted and how long it is trusted
+AI_PROBE_PATH = os.getenv("AI_PROBE_PATH", os.path.join(".cache", "model_probe.json"))
+AI_PROBE_TTL_SECONDS = int(os.getenv("AI_PROBE_TTL_SECONDS", str(6 * 3600)))  # also when a running process re-probes
+AI_PROBE_TIMEOUT_SECONDS = float(os.getenv("AI_PROBE_TIMEOUT_SECONDS", "20"))  # per candidate model
+AI_PROBE_RETRY_SECONDS = float(os.getenv("AI_PROBE_RETRY_SECONDS", "300"))  # after a failed probe
+
+# Response cache settings (set AI_CACHE_ENABLED=0 to disable globally)
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "1") == "1"
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "512"))
+AI_CACHE_MAX_MB = int(os.getenv("AI_CACHE_MAX_MB", "256"))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Bump a task's version whenever its prompt changes so stale cached responses are not reused
+PROMPT_VERSIONS = {
+    "legibility": "1",
+    "ocr": "1",
+    "read_sheet": "2",
+    "assignment": "2",
+    "key_facts": "1",
+    "evaluation": "2",
+    "evaluation_batch": "2",
+    "json_repair": "1",
+    "fairness": "1",
+    "fairness_batch": "1",
+    "refine_items": "2",
+}
 
 # Force Google AI SDK usage (not Vertex AI) by clearing all cloud environment variables
 def force_google_ai_sdk():
@@ -32,8 +112,59 @@ def force_google_ai_sdk():
     os.environ['GOOGLE_AI_SDK_FORCE_DIRECT'] = 'true'
     print("✅ Forced Google AI SDK usage (not Vertex AI)")
 
+
+def long_source_mode(context: str, context_chars: int = None):
+    """
+    How generation fits a source into its prompt: None if it fits or the caller already fitted it
+    (context_chars), "reduce" to map-reduce it (AI_LONG_DOC_MODE), else "retrieval" for its most
+    representative passages (AI_RETRIEVAL). Map-reduce wins when both are on: its notes cover the
+    whole document, while retrieval keeps at most RETRIEVAL_CONTEXT_CHARS of it.
+    """
+    if context_chars or len(context) <= AI_CONTEXT_CHARS:
+        return None
+    if AI_LONG_DOC_MODE:
+        return "reduce"
+    if AI_RETRIEVAL:
+        return "retrieval"
+    return None
+
 class AICore:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrency: int = None, backend: str = None):
+        self.max_concurrency = max_concurrency or AI_MAX_CONCURRENCY
+        self.backend = backend or AI_BACKEND
+        if self.backend not in MODEL_BACKENDS:
+            raise ValueError(f"Unknown AI_BACKEND '{self.backend}'; expected one of {sorted(MODEL_BACKENDS)}.")
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+        self.cache = None
+        # Recording must see every request and replays should be independent runs, so both bypass the cache
+        if AI_CACHE_ENABLED and self.backend not in ("record", "replay"):
+            try:
+                self.cache = LLMCache(AI_CACHE_PATH, max_memory_entries=AI_CACHE_MEMORY_ENTRIES, max_disk_bytes=AI_CACHE_MAX_MB * 1024 * 1024, ttl_seconds=AI_CACHE_TTL_SECONDS)
+            except Exception as e:
+                print(f"⚠️  Response cache disabled: {e}")
+        self.limiter = TokenBucket(AI_RATE_LIMIT_RPM, max_wait=AI_RATE_LIMIT_MAX_WAIT)
+        # One breaker per model so an outage on one model does not block its fallbacks
+        self.breakers = {}
+        self.retry_count = 0
+        self.parse_stats = {}
+        self._stats_lock = threading.Lock()
+        self.router = ModelRouter()
+        # Local TF-IDF/key-term scorer: clear matches and misses skip the model entirely
+        self.prescorer = AnswerEvaluator() if NLP_PRESCORE else None
+        self._models = {}
+        self.default_model_name = None
+        self.vision_model = None
+        self.text_model = None
+        self._probe_lock = threading.Lock()
+        self._probe_thread = None
+        self._probe_timer = None
+        self.probe = {"status": "pending", "model": None, "checked_at": None, "errors": {}}
+        if self.backend in OFFLINE_BACKENDS:
+            # No API behind these backends: nothing to configure or probe
+            self._use_model(MODEL_CANDIDATES[0])
+            self.probe = {"status": "ready", "model": MODEL_CANDIDATES[0], "checked_at": time.time(), "errors": {}}
+            print(f"✅ Using '{self.backend}' model backend")
+            return
         try:
             # Force Google AI SDK configuration (not Vertex AI)
             force_google_ai_sdk()
@@ -41,115 +172,494 @@ class AICore:
             # Force the use of Google AI SDK by setting explicit configuration
             # This ensures we use the direct Google AI API, not Vertex AI
             genai.configure(api_key=api_key)
-            print("Initializing Gemini models with Google AI SDK...")
-            print("Forcing Google AI SDK (not Vertex AI) configuration...")
-            
-            # Additional configuration to ensure Google AI SDK is used
-            # This prevents automatic switching to Vertex AI in cloud environments
-            try:
-                # Force the use of the direct Google AI API
-                import google.generativeai as genai
-                # Ensure we're using the direct API, not Vertex AI
-                print("✅ Google AI SDK configured successfully (not Vertex AI)")
-            except Exception as e:
-                print(f"⚠️  Warning: {e}")
-            
-            # Try different model names to find the best available one
-            # Prioritize Gemini 2.5 Pro (latest and most advanced) then fallback to 2.0 and 1.5 models
-            model_names = ['gemini-2.5-pro', 'gemini-2.0-flash-exp', 'gemini-2.0-flash', 'gemini-1.5-pro-latest', 'gemini-1.5-pro', 'gemini-1.5-flash', 'gemini-1.0-pro']
-            
-            self.vision_model = None
-            self.text_model = None
-            
-            for model_name in model_names:
-                try:
-                    print(f"Testing model: {model_name}")
-                    test_model = genai.GenerativeModel(model_name)
-                    # Test if the model works by making a simple request
-                    test_response = test_model.generate_content("Hello, this is a test.")
-                    self.vision_model = test_model
-                    self.text_model = test_model
-                    print(f"✅ Successfully initialized with model: {model_name}")
-                    break
-                except Exception as model_error:
-                    print(f"❌ Model {model_name} failed: {model_error}")
-                    continue
-            
-            if not self.vision_model:
-                raise Exception("No working Gemini model found")
-                
+            print("✅ Google AI SDK configured successfully (not Vertex AI)")
         except Exception as e:
             print(f"❌ Error initializing Gemini: {e}")
-            self.vision_model = None
-            self.text_model = None
-
-    def _extract_json(self, text: str) -> dict:
-        match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-        if match:
-            json_str = match.group(1)
-        elif text.strip().startswith('{'):
-            json_str = text
+            self.probe = {"status": "failed", "model": None, "checked_at": time.time(), "errors": {"configure": str(e)}}
+            return
+
+        # No network calls here: reuse a recent probe result if one was persisted,
+        # otherwise start on the preferred model and verify it in the background.
+        cached = self._load_probe()
+        if cached:
+            self.probe = {**cached, "status": "cached"}
+            self._use_model(cached["model"])
+            self._schedule_probe(cached["checked_at"] + AI_PROBE_TTL_SECONDS - time.time())
+            print(f"✅ Using cached model probe: {cached['model']}")
         else:
+            self._use_model(MODEL_CANDIDATES[0])
+            self.start_probe()
+
+    def _use_model(self, model_name: str):
+        """Sets the default model, the last resort of every task route."""
+        model = self._get_model(model_name)
+        self.default_model_name = model_name
+        self.vision_model = model
+        self.text_model = model
+
+    def _load_probe(self):
+        try:
+            with open(AI_PROBE_PATH, "r") as f:
+                cached = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
             return None
+        if not cached.get("model") or time.time() - cached.get("checked_at", 0) > AI_PROBE_TTL_SECONDS:
+            return None
+        return cached
+
+    def _save_probe(self):
         try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            print("AI response was not valid JSON.")
+            os.makedirs(os.path.dirname(AI_PROBE_PATH) or ".", exist_ok=True)
+            with open(AI_PROBE_PATH, "w") as f:
+                json.dump(self.probe, f, indent=4)
+        except OSError as e:
+            print(f"⚠️  Could not persist model probe: {e}")
+
+    def _schedule_probe(self, delay: float):
+        """Re-runs the probe after delay seconds (a failed probe is retried, a good one refreshed after the TTL)."""
+        with self._probe_lock:
+            if self._probe_timer:
+                self._probe_timer.cancel()
+            self._probe_timer = threading.Timer(max(delay, 0), self.start_probe)
+            self._probe_timer.daemon = True
+            self._probe_timer.start()
+
+    def start_probe(self):
+        """Probes the candidate models on a daemon thread; returns immediately."""
+        with self._probe_lock:
+            if self._probe_thread and self._probe_thread.is_alive():
+                return
+            self.probe = {**self.probe, "status": "probing"}
+            self._probe_thread = threading.Thread(target=self._probe_models, name="gemini-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_models(self):
+        # Try different model names to find the best available one
+        # Prioritize Gemini 2.5 Pro (latest and most advanced) then fallback to 2.0 and 1.5 models
+        errors = {}
+        for model_name in MODEL_CANDIDATES:
+            try:
+                print(f"Testing model: {model_name}")
+                test_model = self._get_model(model_name)
+                # Test if the model works by making a simple request
+                self._probe_call(test_model)
+                self._use_model(model_name)
+                self.probe = {"status": "ready", "model": model_name, "checked_at": time.time(), "errors": errors}
+                self._save_probe()
+                self._schedule_probe(AI_PROBE_TTL_SECONDS)
+                print(f"✅ Successfully initialized with model: {model_name}")
+                return
+            except Exception as model_error:
+                print(f"❌ Model {model_name} failed: {model_error}")
+                errors[model_name] = str(model_error)
+        # Keep the optimistic model so requests still get a real error from the API
+        self.probe = {"status": "failed", "model": None, "checked_at": time.time(), "errors": errors}
+        self._schedule_probe(AI_PROBE_RETRY_SECONDS)
+        print(f"❌ No working Gemini model found; probing again in {AI_PROBE_RETRY_SECONDS:g}s")
+
+    @staticmethod
+    def _probe_call(model):
+        """One test request, abandoned after AI_PROBE_TIMEOUT_SECONDS even if the client hangs (e.g. offline)."""
+        outcome = {}
+
+        def call():
+            try:
+                model.generate_content("Hello, this is a test.", request_options={"timeout": AI_PROBE_TIMEOUT_SECONDS})
+            except Exception as e:
+                outcome["error"] = e
+
+        worker = threading.Thread(target=call, name="gemini-probe-call", daemon=True)
+        worker.start()
+        worker.join(AI_PROBE_TIMEOUT_SECONDS)
+        if worker.is_alive():
+            raise TimeoutError(f"no response within {AI_PROBE_TIMEOUT_SECONDS:g}s")
+        if "error" in outcome:
+            raise outcome["error"]
+
+    def probe_state(self) -> dict:
+        """
+        Cached probe result; never calls the model. "ready" is also true while probing or after a
+        failed probe, as long as the optimistic first model is set ("optimistic": true): requests
+        then get real errors from the API rather than the instance being taken out of rotation.
+        """
+        probe = dict(self.probe)
+        probe["age_seconds"] = round(time.time() - probe["checked_at"], 1) if probe.get("checked_at") else None
+        probe["verified"] = probe["status"] in ("ready", "cached")
+        probe["ready"] = probe["verified"] or self.default_model_name is not None
+        probe["optimistic"] = probe["ready"] and not probe["verified"]
+        probe["active_model"] = self.default_model_name
+        return probe
+
+    def _breaker(self, model_name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(model_name)
+        if breaker is None:
+            with self._stats_lock:
+                breaker = self.breakers.setdefault(model_name, CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_RESET_SECONDS))
+        return breaker
+
+    def _get_model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models.setdefault(model_name, MODEL_BACKENDS[self.backend](model_name))
+        return model
+
+    def _generate(self, task: str, contents, use_cache: bool = True, response_schema: dict = None, cache_if=None) -> str:
+        """Single choke point for model calls so every task goes through the same path.
+        Walks the task's model fallback chain and returns the response text, served
+        from the response cache when possible. Fresh responses are cached only if
+        `cache_if(text)` accepts them."""
+        request_hash = content_hash(contents) if self.cache and use_cache else None
+        last_error = None
+        for model_name in self.router.chain(task, self.default_model_name):
+            key = None
+            if request_hash:
+                key = LLMCache.make_key(model_name, f"{task}:{PROMPT_VERSIONS.get(task, '0')}", request_hash)
+                cached = self.cache.get(key)
+                AI_CACHE_LOOKUPS.inc(task, "miss" if cached is None else "hit")
+                if cached is not None:
+                    return cached
+            try:
+                text = self._call_with_retry(task, model_name, contents, response_schema)
+            except CircuitOpen as e:
+                last_error = e  # this model's circuit is open; its fallbacks have their own
+                continue
+            except AIServiceUnavailable:
+                raise
+            except AIServiceError as e:
+                print(f"⚠️  {task}: {model_name} failed, trying next model in route: {e}")
+                last_error = e
+                continue
+            if key and (cache_if is None or cache_if(text)):
+                self.cache.set(key, text)
+            return text
+        raise last_error or AIServiceError(f"No model configured for task '{task}'.")
+
+    def _call_with_retry(self, task: str, model_name: str, contents, response_schema: dict = None) -> str:
+        """Rate-limited, retried, circuit-protected model call. Raises AIServiceError on failure."""
+        model = self._get_model(model_name)
+        kwargs = self._generation_kwargs(response_schema)
+        breaker = self._breaker(model_name)
+        for attempt in range(AI_MAX_RETRIES + 1):
+            breaker.before_call()
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = model.generate_content(contents, **kwargs)
+                text = response.text
+            except Exception as e:
+                retryable = is_retryable(e)
+                self._record_call(task, model_name, contents, time.perf_counter() - started, retryable=retryable)
+                breaker.record_failure(counts_towards_open=retryable)
+                if retryable and attempt < AI_MAX_RETRIES:
+                    self.retry_count += 1
+                    AI_RETRIES.inc(task, model_name)
+                    delay = backoff_delay(attempt)
+                    print(f"⚠️  Retryable AI error ({type(e).__name__}), retrying in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                    continue
+                raise AIServiceError(f"AI request failed: {e}", retryable=retryable) from e
+            self._record_call(task, model_name, contents, time.perf_counter() - started, usage=getattr(response, "usage_metadata", None))
+            breaker.record_success()
+            return text
+
+    def _record_call(self, task: str, model_name: str, contents, latency: float, usage=None, retryable: bool = None):
+        """Per-attempt accounting: route stats plus the Prometheus metrics. retryable is None on success."""
+        ok = retryable is None
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        self.router.record(task, model_name, latency, ok=ok, input_tokens=input_tokens, output_tokens=output_tokens)
+        AI_REQUEST_SECONDS.observe(latency, task, model_name, "ok" if ok else "error")
+        image_bytes = self._image_bytes(contents)
+        if image_bytes:
+            AI_IMAGE_BYTES.inc(task, model_name, amount=image_bytes)
+        if ok:
+            AI_INPUT_TOKENS.inc(task, model_name, amount=input_tokens)
+            AI_OUTPUT_TOKENS.inc(task, model_name, amount=output_tokens)
+        else:
+            AI_ERRORS.inc(task, model_name, str(retryable).lower())
+
+    @staticmethod
+    def _image_bytes(contents) -> int:
+        """Size of the image payloads in a request (file size for PIL images opened from disk)."""
+        total = 0
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, (bytes, bytearray)):
+                total += len(part)
+            elif isinstance(part, dict) and "data" in part:
+                total += len(part["data"])
+            elif hasattr(part, "tobytes"):
+                filename = getattr(part, "filename", "")
+                total += os.path.getsize(filename) if filename and os.path.exists(filename) else len(part.tobytes())
+        return total
+
+    @staticmethod
+    def _generation_kwargs(response_schema: dict = None) -> dict:
+        if response_schema and AI_STRUCTURED_OUTPUT:
+            return {"generation_config": genai.GenerationConfig(response_mime_type="application/json", response_schema=response_schema)}
+        return {}
+
+    def _stream_generate(self, task: str, contents, emit, use_cache: bool = True, response_schema: dict = None, cache_if=None) -> str:
+        """Streaming counterpart of _generate: passes text chunks to emit() as they arrive and
+        returns the full text. Falls back along the route only before the first chunk."""
+        request_hash = content_hash(contents) if self.cache and use_cache else None
+        last_error = None
+        for model_name in self.router.chain(task, self.default_model_name):
+            key = None
+            if request_hash:
+                key = LLMCache.make_key(model_name, f"{task}:{PROMPT_VERSIONS.get(task, '0')}", request_hash)
+                cached = self.cache.get(key)
+                AI_CACHE_LOOKUPS.inc(task, "miss" if cached is None else "hit")
+                if cached is not None:
+                    emit(cached)
+                    return cached
+            pieces = []
+            try:
+                for piece in self._stream_with_retry(task, model_name, contents, response_schema):
+                    pieces.append(piece)
+                    emit(piece)
+            except CircuitOpen as e:
+                last_error = e  # this model's circuit is open; its fallbacks have their own
+                continue
+            except AIServiceUnavailable:
+                raise
+            except AIServiceError as e:
+                if pieces:
+                    raise
+                print(f"⚠️  {task}: {model_name} failed, trying next model in route: {e}")
+                last_error = e
+                continue
+            text = "".join(pieces)
+            if key and (cache_if is None or cache_if(text)):
+                self.cache.set(key, text)
+            return text
+        raise last_error or AIServiceError(f"No model configured for task '{task}'.")
+
+    def _stream_with_retry(self, task: str, model_name: str, contents, response_schema: dict = None):
+        """Generator over streamed text chunks with the same protections as _call_with_retry.
+        A failed attempt is retried only if nothing was yielded yet."""
+        model = self._get_model(model_name)
+        kwargs = self._generation_kwargs(response_schema)
+        breaker = self._breaker(model_name)
+        for attempt in range(AI_MAX_RETRIES + 1):
+            breaker.before_call()
+            self.limiter.acquire()
+            started = time.perf_counter()
+            received = False
+            try:
+                response = model.generate_content(contents, stream=True, **kwargs)
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue  # chunk without text parts (e.g. safety metadata only)
+                    received = True
+                    yield text
+            except Exception as e:
+                retryable = is_retryable(e)
+                self._record_call(task, model_name, contents, time.perf_counter() - started, retryable=retryable)
+                breaker.record_failure(counts_towards_open=retryable)
+                if retryable and not received and attempt < AI_MAX_RETRIES:
+                    self.retry_count += 1
+                    AI_RETRIES.inc(task, model_name)
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                raise AIServiceError(f"AI request failed: {e}", retryable=retryable) from e
+            self._record_call(task, model_name, contents, time.perf_counter() - started, usage=getattr(response, "usage_metadata", None))
+            breaker.record_success()
+            return
+
+    async def _stream_async(self, task: str, contents, use_cache: bool = True, response_schema: dict = None, cache_if=None):
+        """Async generator over response chunks; the blocking stream runs on the worker pool."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def emit(piece):
+            loop.call_soon_threadsafe(queue.put_nowait, piece)
+
+        future = loop.run_in_executor(self._executor, functools.partial(self._stream_generate, task, contents, emit, use_cache, response_schema, cache_if))
+        future.add_done_callback(lambda _: queue.put_nowait(done))
+        while True:
+            piece = await queue.get()
+            if piece is done:
+                break
+            yield piece
+        await future  # re-raises AIServiceError from the worker
+
+    def _generate_json(self, task: str, contents, use_cache: bool = True):
+        """
+        Structured-output call for a task with a declared response schema. Returns
+        (parsed object or None, raw text). A response that does not match the schema gets at most
+        one cheap repair attempt and is None if that fails too; such responses are never cached.
+        """
+        schema = RESPONSE_SCHEMAS[task]
+        text = self._generate(task, contents, use_cache=use_cache, response_schema=schema,
+                              cache_if=lambda t: conforms(parse_json_response(t, schema), schema))
+        return self._parse_or_repair(task, text, schema), text
+
+    def _parse_or_repair(self, task: str, text: str, schema: dict):
+        value = parse_json_response(text, schema)
+        if conforms(value, schema):
+            self._count_parse(task, "ok")
+            return value
+        self._count_parse(task, "failed")
+        print(f"⚠️  {task}: response did not match its schema, attempting one repair")
+        repaired = self._repair_json(text, schema)
+        if repaired is not None:
+            self._count_parse(task, "repaired")
+            return repaired
+        # A dict missing required keys (e.g. no "marks") must not pass for a result
+        return None
+
+    def _repair_json(self, text: str, schema: dict):
+        prompt = f"Rewrite the following model output as a single JSON object that matches this JSON schema. Keep the content; only fix the structure.\n\n**Schema:**\n{json.dumps(schema)}\n\n**Output to repair:**\n{text[:20000]}"
+        try:
+            repaired_text = self._generate("json_repair", prompt, use_cache=False, response_schema=schema)
+        except AIServiceError as e:
+            print(f"⚠️  JSON repair failed: {e}")
             return None
+        value = parse_json_response(repaired_text, schema)
+        return value if conforms(value, schema) else None
 
-    def get_handwriting_legibility(self, image_pil) -> str:
+    def _count_parse(self, task: str, outcome: str):
+        with self._stats_lock:
+            counts = self.parse_stats.setdefault(task, {"ok": 0, "failed": 0, "repaired": 0})
+            counts[outcome] += 1
+
+    def parsing_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                task: {**counts, "failure_rate": round(counts["failed"] / (counts["ok"] + counts["failed"]), 4) if counts["ok"] + counts["failed"] else 0.0}
+                for task, counts in self.parse_stats.items()
+            }
+
+    def route_stats(self) -> dict:
+        return {"routes": {task: self.router.chain(task, self.default_model_name) for task in self.router.routes}, "stats": self.router.stats(), "parsing": self.parsing_stats()}
+
+    def resilience_state(self) -> dict:
+        return {"circuits": {name: breaker.state() for name, breaker in sorted(self.breakers.items())}, "rate_limiter": self.limiter.state(), "retries": self.retry_count}
+
+    def metric_families(self) -> list:
+        """Scrape-time gauges for the telemetry registry: cache, circuit breaker and rate limiter state."""
+        families = []
+        if self.cache:
+            cache = self.cache.stats()
+            families.append(("nextgen_ai_cache_hit_ratio", "gauge", "Response cache hit ratio since start", [({}, cache.get("hit_ratio", 0.0))]))
+            families.append(("nextgen_ai_cache_entries", "gauge", "Entries in the response cache", [({"tier": "memory"}, cache["memory_entries"]), ({"tier": "disk"}, cache["disk_entries"])]))
+        circuits = [({"model": name}, 0 if breaker.state()["status"] == CircuitBreaker.CLOSED else 1) for name, breaker in sorted(self.breakers.items())]
+        families.append(("nextgen_ai_circuit_open", "gauge", "1 while a model's circuit breaker is rejecting calls", circuits))
+        limiter = self.limiter.state()
+        families.append(("nextgen_ai_rate_limiter_available_tokens", "gauge", "Tokens left in the client-side rate limiter", [({}, limiter["available_tokens"])]))
+        families.append(("nextgen_ai_rate_limiter_wait_seconds_total", "counter", "Time spent waiting for the rate limiter", [({}, limiter["wait_seconds"])]))
+        return families
+
+    async def _run_async(self, fn, *args, **kwargs):
+        """Runs a blocking AICore method on the bounded Gemini worker pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        if self._probe_timer:
+            self._probe_timer.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_handwriting_legibility(self, image, use_cache: bool = True) -> str:
         if not self.vision_model: return "Vision model not initialized."
         # Force Google AI SDK usage (not Vertex AI)
         force_google_ai_sdk()
         prompt = "Rate the legibility of the handwriting in this image on a scale of 1-10 and provide a one-sentence comment. Format as: 'Score: [number], Comment: [text]'"
         try:
-            response = self.vision_model.generate_content([prompt, image_pil])
-            return response.text.strip()
+            response_text = self._generate("legibility", [prompt, image], use_cache=use_cache)
+            return response_text.strip()
+        except AIServiceError:
+            raise
         except Exception as e:
             return f"Error during legibility check: {e}"
 
-    def extract_text_from_image(self, image_pil) -> str:
+    def extract_text_from_image(self, image, use_cache: bool = True) -> str:
         if not self.vision_model: return "Vision model not initialized."
         # Force Google AI SDK usage (not Vertex AI)
         force_google_ai_sdk()
         prompt = "Transcribe the text from this image exactly as it is written. Provide only the transcribed text."
         try:
-            response = self.vision_model.generate_content([prompt, image_pil])
-            return response.text.strip()
+            response_text = self._generate("ocr", [prompt, image], use_cache=use_cache)
+            return response_text.strip()
+        except AIServiceError:
+            raise
         except Exception as e:
             return f"Error during OCR: {e}"
 
-    def generate_assignment(self, context: str, num_questions: int = 5) -> dict:
-        """Generates a full assignment (questions and answers) in a single API call."""
+    def read_answer_sheet(self, image, use_cache: bool = True) -> dict:
+        """Fused vision pass: transcription and legibility score from a single upload of the image.
+        `image` is a PIL image or an already encoded {"mime_type", "data"} part, which is sent as-is."""
+        if not self.vision_model: return None
+        # Force Google AI SDK usage (not Vertex AI)
+        force_google_ai_sdk()
+        prompt = """
+        You are reading a student's handwritten answer sheet.
+        **Instructions:**
+        1. Transcribe the text from this image exactly as it is written.
+        2. Rate the legibility of the handwriting on a scale of 1-10 and give a one-sentence comment.
+        **IMPORTANT:** Your response MUST be a valid JSON object with the keys: "transcription", "legibility_score", "legibility_comment".
+        """
+        try:
+            ai_result, response_text = self._generate_json("read_sheet", [prompt, image], use_cache=use_cache)
+            if not ai_result:
+                # The model ignored the format; keep the text so grading can still proceed.
+                return {"transcription": response_text.strip(), "legibility_score": None, "legibility_comment": "", "legibility_report": "Score: N/A, Comment: Legibility could not be determined."}
+            score = ai_result.get("legibility_score")
+            comment = ai_result.get("legibility_comment", "")
+            return {
+                "transcription": str(ai_result.get("transcription", "")).strip(),
+                "legibility_score": score,
+                "legibility_comment": comment,
+                "legibility_report": f"Score: {score}, Comment: {comment}",
+            }
+        except AIServiceError:
+            raise
+        except Exception as e:
+            print(f"Error during fused vision pass: {e}")
+            return None
+
+    def generate_assignment(self, context: str, num_questions: int = 5, use_cache: bool = True, context_chars: int = None) -> dict:
+        """Generates a full assignment (questions and answers) in a single API call.
+        Only the first `context_chars` (default AI_CONTEXT_CHARS) of the source are sent."""
         if not self.text_model: return None
         # Force Google AI SDK usage (not Vertex AI)
         force_google_ai_sdk()
-        prompt = f"""
+        prompt = self._assignment_prompt(context, num_questions, context_chars)
+        try:
+            ai_result, response_text = self._generate_json("assignment", prompt, use_cache=use_cache)
+            return self._assignment_from_json(ai_result)
+        except AIServiceError:
+            raise
+        except Exception as e:
+            print(f"Error during assignment generation: {e}")
+            return None
+
+    @staticmethod
+    def _assignment_prompt(context: str, num_questions: int, context_chars: int = None) -> str:
+        return f"""
         You are a teacher creating an exam. Based on the source material, generate a complete assignment.
         **Instructions:**
         1. Create {num_questions} clear, short-answer questions.
         2. For each question, provide a detailed reference answer using ONLY the provided source material.
         3. Your response MUST be a single, valid JSON object with two keys: "questions" (a single string with a numbered list) and "answers" (a single string with corresponding answers).
         **Source Material:**
-        {context[:4000]} 
+        {context[:context_chars or AI_CONTEXT_CHARS]} 
         Provide the complete assignment as a single JSON object:
         """
-        try:
-            response = self.text_model.generate_content(prompt)
-            ai_result = self._extract_json(response.text)
-            if not ai_result: return None
-            
-            questions = ai_result.get("questions", "")
-            answers = ai_result.get("answers", "")
-            if isinstance(questions, list): questions = "\n".join(str(q) for q in questions)
-            if isinstance(answers, list): answers = "\n".join(str(a) for a in answers)
-            
-            return {"questions": questions, "answers": answers}
-        except Exception as e:
-            print(f"Error during assignment generation: {e}")
-            return None
 
-    def evaluate_student_answer(self, student_answer: str, model_answer: str, question: str, max_marks: int) -> dict:
+    @staticmethod
+    def _assignment_from_json(ai_result: dict) -> dict:
+        if not ai_result: return None
+        questions = ai_result.get("questions", "")
+        answers = ai_result.get("answers", "")
+        if isinstance(questions, list): questions = "\n".join(str(q) for q in questions)
+        if isinstance(answers, list): answers = "\n".join(str(a) for a in answers)
+        return {"questions": questions, "answers": answers}
+
+    def evaluate_student_answer(self, student_answer: str, model_answer: str, question: str, max_marks: int, use_cache: bool = True) -> dict:
         if not self.text_model: 
             print("❌ Text model not initialized")
             return None
@@ -157,7 +667,7 @@ class AICore:
         # Force Google AI SDK usage (not Vertex AI)
         force_google_ai_sdk()
         
-        print(f"🔍 Starting evaluation with model: {self.text_model}")
+        print(f"🔍 Starting evaluation with route: {self.router.chain('evaluation', self.default_model_name)}")
         print(f"📝 Question: {question[:100]}...")
         print(f"📚 Model Answer: {model_answer[:100]}...")
         print(f"👤 Student Answer: {student_answer[:100]}...")
@@ -179,49 +689,438 @@ class AICore:
         
         try:
             print("🤖 Sending request to AI model...")
-            response = self.text_model.generate_content(prompt)
-            print(f"✅ AI response received: {response.text[:200]}...")
+            ai_result, response_text = self._generate_json("evaluation", prompt, use_cache=use_cache)
+            print(f"✅ AI response received: {response_text[:200]}...")
             
-            ai_result = self._extract_json(response.text)
             if not ai_result: 
                 print("❌ Failed to extract JSON from AI response")
                 return None
             
-            result = {
-                "marks": ai_result.get("marks", 0), 
-                "max_marks": max_marks,
-                "feedback": ai_result.get("feedback", "No feedback provided."),
-                "key_concepts_missed": ai_result.get("key_concepts_missed", "N/A"),
-                "details": {"Rationale": ai_result.get("rationale", "No rationale provided.")}
-            }
+            result = self._evaluation_result(ai_result, max_marks)
             
             print(f"✅ Evaluation completed successfully: {result}")
             return result
             
+        except AIServiceError:
+            raise
         except Exception as e:
             print(f"❌ Error during evaluation: {e}")
             print(f"❌ Error type: {type(e).__name__}")
             print(f"❌ Error details: {str(e)}")
             return None
 
-    def analyze_feedback_fairness(self, feedback: str) -> str:
+    @staticmethod
+    def _evaluation_result(ai_result: dict, max_marks: int) -> dict:
+        return {
+            "marks": ai_result.get("marks", 0), 
+            "max_marks": max_marks,
+            "feedback": ai_result.get("feedback", "No feedback provided."),
+            "key_concepts_missed": ai_result.get("key_concepts_missed", "N/A"),
+            "details": {"Rationale": ai_result.get("rationale", "No rationale provided.")}
+        }
+
+    def prescore(self, model_answers: list, student_answers: list, max_marks: list) -> list:
+        """Local results for the pairs the pre-scorer is confident about, None for those to escalate to the model."""
+        if not self.prescorer:
+            return [None] * len(student_answers)
+        scores = self.prescorer.score_pairs(model_answers, student_answers)
+        return [None if score["decision"] == "escalate" else AnswerEvaluator.to_result(score, marks) for score, marks in zip(scores, max_marks)]
+
+    def plan_evaluation_batches(self, submissions: list, model_answer: str, question: str) -> list:
+        """Packs submissions into batches that fit the prompt budget left after the shared question/model answer prefix."""
+        budget = max(AI_BATCH_PROMPT_CHARS - len(question) - len(model_answer), AI_BATCH_PROMPT_CHARS // 4)
+        batches, current, used = [], [], 0
+        for sub in submissions:
+            size = len(sub["answer"]) + 64
+            if current and (used + size > budget or len(current) >= AI_BATCH_MAX_STUDENTS):
+                batches.append(current)
+                current, used = [], 0
+            current.append(sub)
+            used += size
+        if current:
+            batches.append(current)
+        return batches
+
+    def _evaluate_batch(self, submissions: list, model_answer: str, question: str, max_marks: int, use_cache: bool = True) -> dict:
+        """Grades one batch in a single request; returns {submission id: result} for the ids the model answered."""
+        ids = [str(sub["id"]) for sub in submissions]
+        answers_block = "\n\n".join(f'**Submission "{sid}":**\n"{sub["answer"]}"' for sid, sub in zip(ids, submissions))
+        prompt = f"""
+        You are a strict but fair AI teaching assistant. Evaluate each student's answer independently based on the model answer.
+        **Instructions:**
+        1. Assign each submission a numerical score out of {max_marks}.
+        2. Provide a "rationale" explaining each score.
+        3. Provide "feedback" for each student.
+        4. List "key_concepts_missed" in a bulleted list for each student.
+        **IMPORTANT:** Your response MUST be a valid JSON object with a single key "evaluations": a list with exactly one object per submission, each with the keys: "submission_id", "marks", "rationale", "feedback", "key_concepts_missed". Copy each "submission_id" exactly as given.
+
+        **Original Question:** "{question}"
+        **Model Answer:** "{model_answer}"
+
+        {answers_block}
+        Provide your evaluations as a JSON object:
+        """
+        ai_result = self._generate_json("evaluation_batch", prompt, use_cache=use_cache)[0] or {}
+        results = {}
+        for item in ai_result.get("evaluations", []):
+            sid = str(item.get("submission_id", "")).strip()
+            if sid in ids and sid not in results:
+                results[sid] = self._evaluation_result(item, max_marks)
+        return results
+
+    async def evaluate_students_batch_async(self, submissions: list, model_answer: str, question: str, max_marks: int, use_cache: bool = True) -> dict:
+        """
+        Grades many students against one assignment with a handful of requests.
+
+        :param submissions: list of {"id": ..., "answer": <OCR text>} dicts; ids must be unique.
+        :return: {str(id): evaluation result, None, or the AIServiceError that stopped it}.
+                 Submissions a batch response did not account for, or whose batch request
+                 failed, are re-graded individually, so one failed batch never costs the others.
+        """
+        if not self.text_model: return {str(sub["id"]): None for sub in submissions}
+        local = self.prescore([model_answer] * len(submissions), [sub["answer"] for sub in submissions], [max_marks] * len(submissions))
+        results = {str(sub["id"]): result for sub, result in zip(submissions, local) if result}
+        ambiguous = [sub for sub, result in zip(submissions, local) if not result]
+        batches = self.plan_evaluation_batches(ambiguous, model_answer, question)
+        print(f"🧮 Batch evaluation: {len(results)} of {len(submissions)} submissions scored locally, the rest in {len(batches)} request(s)")
+        batch_results = await asyncio.gather(*[
+            self._run_async(self._evaluate_batch, batch, model_answer, question, max_marks, use_cache=use_cache) for batch in batches
+        ], return_exceptions=True)
+        for partial in batch_results:
+            if isinstance(partial, AIServiceError):
+                print(f"⚠️  Batch evaluation request failed: {partial}")
+            elif isinstance(partial, BaseException):
+                raise partial
+            else:
+                results.update(partial)
+        missing = [sub for sub in ambiguous if str(sub["id"]) not in results]
+        if missing:
+            print(f"⚠️  Batch response missed {len(missing)} submission(s); grading them individually")
+            singles = await asyncio.gather(*[
+                self.evaluate_student_answer_async(sub["answer"], model_answer, question, max_marks, use_cache=use_cache) for sub in missing
+            ], return_exceptions=True)
+            for sub, result in zip(missing, singles):
+                if isinstance(result, BaseException) and not isinstance(result, AIServiceError):
+                    raise result
+                results[str(sub["id"])] = result
+        return results
+
+    async def evaluate_by_question_async(self, student_answer: str, model_answer: str, question: str, max_marks: int, use_cache: bool = True) -> dict:
+        """
+        Splits the paper into aligned (question, model answer, student answer) items and grades
+        them concurrently. Each item is its own cached request, so after a teacher edits one
+        question only that item misses the cache on regrade. Items the local pre-scorer decides
+        confidently are not sent to the model. Returns the same shape as evaluate_student_answer
+        plus a "per_question" breakdown, or None if any item failed.
+        """
+        items = align_items(question, model_answer, student_answer)
+        if len(items) < 2:
+            local = self.prescore([model_answer], [student_answer], [max_marks])[0]
+            return local or await self.evaluate_student_answer_async(student_answer, model_answer, question, max_marks, use_cache=use_cache)
+        item_marks = allocate_marks(max_marks, len(items))
+        student_answers = [item["student_answer"] or "(no answer)" for item in items]
+        local = self.prescore([item["model_answer"] for item in items], student_answers, item_marks)
+        print(f"🧩 Per-question evaluation of {len(items)} items, {sum(r is not None for r in local)} scored locally")
+
+        async def grade(item, answer, marks, result):
+            return result or await self.evaluate_student_answer_async(answer, item["model_answer"], item["question"], marks, use_cache=use_cache)
+
+        results = await asyncio.gather(*[grade(*args) for args in zip(items, student_answers, item_marks, local)])
+        return self._combine_items(items, item_marks, results, max_marks)
+
+    async def evaluate_students_by_question_async(self, submissions: list, model_answer: str, question: str, max_marks: int, use_cache: bool = True) -> dict:
+        """
+        Class-wide form of evaluate_by_question_async: every student's paper is split into the same
+        items with the same allocate_marks split, and each question is graded for the whole class with
+        evaluate_students_batch_async. Results have evaluate_by_question_async's shape.
+
+        :return: {str(id): evaluation result, None, or the AIServiceError that stopped one of its items}.
+        """
+        if len(align_items(question, model_answer, "")) < 2:
+            return await self.evaluate_students_batch_async(submissions, model_answer, question, max_marks, use_cache=use_cache)
+        papers = {str(sub["id"]): align_items(question, model_answer, sub["answer"]) for sub in submissions}
+        first = next(iter(papers.values()))
+        item_marks = allocate_marks(max_marks, len(first))
+        print(f"🧩 Per-question batch evaluation of {len(first)} items for {len(papers)} students")
+        per_item = await asyncio.gather(*[
+            self.evaluate_students_batch_async(
+                [{"id": sid, "answer": items[k]["student_answer"] or "(no answer)"} for sid, items in papers.items()],
+                item["model_answer"], item["question"], item_marks[k], use_cache=use_cache,
+            )
+            for k, item in enumerate(first)
+        ])
+        results = {}
+        for sid, items in papers.items():
+            item_results = [graded.get(sid) for graded in per_item]
+            error = next((r for r in item_results if isinstance(r, AIServiceError)), None)
+            results[sid] = error or self._combine_items(items, item_marks, item_results, max_marks)
+        return results
+
+    def _combine_items(self, items: list, item_marks: list, results: list, max_marks: int) -> dict:
+        """Paper-level result with a "per_question" breakdown, or None if any item has no result."""
+        if any(result is None for result in results):
+            return None
+        per_question = [
+            {"number": item["number"], "marks": result["marks"], "max_marks": marks, "feedback": result["feedback"],
+             "key_concepts_missed": result["key_concepts_missed"], "rationale": result["details"]["Rationale"],
+             "graded_by": result.get("graded_by", "model")}
+            for item, marks, result in zip(items, item_marks, results)
+        ]
+        def as_text(value):
+            return "\n".join(str(v) for v in value) if isinstance(value, list) else str(value)
+        return {
+            "marks": round(sum(self._as_number(q["marks"]) for q in per_question), 2),
+            "max_marks": max_marks,
+            "feedback": "\n".join(f"Q{q['number']}: {as_text(q['feedback'])}" for q in per_question),
+            "key_concepts_missed": "\n".join(f"Q{q['number']}: {as_text(q['key_concepts_missed'])}" for q in per_question),
+            "details": {"Rationale": "\n".join(f"Q{q['number']}: {as_text(q['rationale'])}" for q in per_question)},
+            "per_question": per_question,
+        }
+
+    @staticmethod
+    def _as_number(value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return 0
+        return int(number) if number.is_integer() else number
+
+    def analyze_feedback_fairness(self, feedback: str, use_cache: bool = True) -> str:
         if not self.text_model: return "Text model not initialized."
         # Force Google AI SDK usage (not Vertex AI)
         force_google_ai_sdk()
         prompt = f"Is the following feedback constructive and fair? Respond with 'Fairness Check: [Pass/Fail]' and a one-sentence explanation.\n\nFeedback: \"{feedback}\""
         try:
-            response = self.text_model.generate_content(prompt)
-            return response.text.strip()
+            response_text = self._generate("fairness", prompt, use_cache=use_cache)
+            return response_text.strip()
+        except AIServiceError:
+            raise
         except Exception as e:
             return f"Error during fairness check: {e}"
 
-    def refine_content(self, previous_content: str, teacher_feedback: str) -> str:
-        if not self.text_model: return "Text model not initialized."
+    def _analyze_fairness_batch(self, feedbacks: list, use_cache: bool = True) -> dict:
+        """Checks many students' feedback in one request; returns {submission id: report} for the ids the model answered."""
+        ids = [str(item["id"]) for item in feedbacks]
+        feedback_block = "\n\n".join(f'**Feedback "{fid}":**\n"{item["feedback"]}"' for fid, item in zip(ids, feedbacks))
+        prompt = f"""
+        Check each piece of feedback below independently: is it constructive and fair?
+        **IMPORTANT:** Your response MUST be a valid JSON object with a single key "checks": a list with exactly one object per feedback, each with the keys: "submission_id", "verdict" ("Pass" or "Fail"), "explanation" (one sentence). Copy each "submission_id" exactly as given.
+
+        {feedback_block}
+        """
+        ai_result = self._generate_json("fairness_batch", prompt, use_cache=use_cache)[0] or {}
+        reports = {}
+        for item in ai_result.get("checks", []):
+            fid = str(item.get("submission_id", "")).strip()
+            if fid in ids and fid not in reports:
+                reports[fid] = f"Fairness Check: {item.get('verdict', 'N/A')}. {item.get('explanation', '')}".strip()
+        return reports
+
+    async def analyze_fairness_batch_async(self, feedbacks: list, use_cache: bool = True) -> dict:
+        """
+        Fairness check for a whole class in a single request.
+
+        :param feedbacks: list of {"id": ..., "feedback": <text>} dicts; ids must be unique.
+        :return: {str(id): report}. Feedback the batch response did not account for is checked individually.
+        """
+        if not feedbacks: return {}
+        if not self.text_model: return {str(item["id"]): "Text model not initialized." for item in feedbacks}
+        reports = await self._run_async(self._analyze_fairness_batch, feedbacks, use_cache=use_cache)
+        missing = [item for item in feedbacks if str(item["id"]) not in reports]
+        if missing:
+            print(f"⚠️  Batch fairness check missed {len(missing)} feedback(s); checking them individually")
+            singles = await asyncio.gather(*[self.analyze_feedback_fairness_async(item["feedback"], use_cache=use_cache) for item in missing])
+            reports.update({str(item["id"]): report for item, report in zip(missing, singles)})
+        return reports
+
+    def refine_assignment(self, previous_questions: str, previous_answers: str, feedback: str, use_cache: bool = True) -> dict:
+        """
+        Single-call, item-level refinement of a whole paper. If the feedback names question
+        numbers, only those items are sent and regenerated; otherwise the model sees the paper
+        and returns only the items it changes (plus additions/removals). Returns merged
+        {"questions", "answers"} and a per-item "changes" diff.
+        """
+        if not self.text_model: return None
         # Force Google AI SDK usage (not Vertex AI)
         force_google_ai_sdk()
-        prompt = f"A teacher provided feedback on your previous work. Regenerate the content, incorporating their feedback.\n\n**Previous Content:**\n{previous_content}\n\n**Teacher's Feedback:**\n{teacher_feedback}\n\n**New, Regenerated Content:**"
-        try:
-            response = self.text_model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            return f"Error during refinement: {e}"
\ No newline at end of file
+        pairs, targets, prompt = self._refine_request(previous_questions, previous_answers, feedback)
+        ai_result = self._generate_json("refine_items", prompt, use_cache=use_cache)[0]
+        return self._refine_result(previous_questions, previous_answers, pairs, targets, ai_result)
+
+    @staticmethod
+    def _refine_request(previous_questions: str, previous_answers: str, feedback: str) -> tuple:
+        """(paper items, targeted item numbers or None, prompt) for a refinement."""
+        pairs = pair_items(previous_questions, previous_answers)
+        known = {pair["number"] for pair in pairs}
+        referenced = referenced_numbers(feedback)
+        targets = referenced if referenced and all(n in known for n in referenced) else None
+        if targets:
+            scope = [pair for pair in pairs if pair["number"] in targets]
+            instructions = ("Rewrite ONLY the items below to satisfy the teacher's feedback. Return every item below, keeping its number, "
+                            "except items the feedback asks to delete: list their numbers in \"removed\" instead.")
+        else:
+            scope = pairs
+            instructions = ("Apply the teacher's feedback to this paper. Return ONLY the items you change or add (new items get new numbers), "
+                            "with their full question and answer text, and list the numbers of any items to delete in \"removed\". Do not return unchanged items.")
+        items_block = "\n\n".join(f"**Item {pair['number']}**\nQuestion: {pair['question']}\nAnswer: {pair['answer']}" for pair in scope)
+        prompt = f"""
+        You are a teacher revising an exam paper.
+        **Instructions:** {instructions}
+        Your response MUST be a valid JSON object with the keys: "items" (a list of objects with "number", "question", "answer") and "removed" (a list of item numbers).
+
+        **Teacher's Feedback:** "{feedback}"
+
+        {items_block}
+        """
+        print(f"✏️  Refining {len(scope)} of {len(pairs)} item(s)")
+        return pairs, targets, prompt
+
+    @staticmethod
+    def _refine_result(previous_questions: str, previous_answers: str, pairs: list, targets: list, ai_result: dict) -> dict:
+        """Merges the model's item edits into the paper; untouched items keep the teacher's text verbatim."""
+        if ai_result is None: return None
+        removed = ai_result.get("removed", [])
+        if targets:
+            # Only the items the model was shown may be deleted
+            removed = [n for n in removed if str(n).strip().rstrip(".") in targets]
+        merged, changes = merge_items(pairs, ai_result.get("items", []), removed)
+        return {
+            "questions": rebuild_numbered(previous_questions, [{"number": p["number"], "text": p["question"]} for p in merged]),
+            "answers": rebuild_numbered(previous_answers, [{"number": p["number"], "text": p["answer"]} for p in merged]),
+            "changes": changes,
+        }
+
+    # --- Streaming API: async generators of (event, payload) for server-sent events ---
+    async def stream_assignment_async(self, context: str, num_questions: int = 5, use_cache: bool = True, context_chars: int = None):
+        """
+        Generates an assignment while streaming it. Yields ("status", {...}) during long-document
+        selection or reduction, ("delta", {"field": "questions"|"answers", "text": ...}) as text arrives,
+        and finally ("result", {"questions", "answers"}) or ("result", None) if nothing usable came back.
+        Pass context_chars for context the caller has already fitted (e.g. retrieved passages).
+        """
+        mode = long_source_mode(context, context_chars)
+        if mode == "retrieval":
+            yield "status", {"message": f"Selecting passages from {len(context)} characters of source material..."}
+            context = await asyncio.to_thread(representative_passages, context)
+            context_chars = RETRIEVAL_CONTEXT_CHARS
+        elif mode == "reduce":
+            yield "status", {"message": f"Condensing {len(context)} characters of source material..."}
+            context = await self.reduce_source_async(context, use_cache=use_cache)
+            context_chars = AI_REDUCE_CHARS
+        force_google_ai_sdk()
+        schema = RESPONSE_SCHEMAS["assignment"]
+        pieces, sent = [], {"questions": 0, "answers": 0}
+        async for piece in self._stream_async("assignment", self._assignment_prompt(context, num_questions, context_chars), use_cache=use_cache,
+                                              response_schema=schema, cache_if=lambda t: conforms(parse_json_response(t, schema), schema)):
+            pieces.append(piece)
+            for field, value in partial_json_strings("".join(pieces), sent.keys()).items():
+                if len(value) > sent[field]:
+                    yield "delta", {"field": field, "text": value[sent[field]:]}
+                    sent[field] = len(value)
+        ai_result = await self._run_async(self._parse_or_repair, "assignment", "".join(pieces), schema)
+        yield "result", self._assignment_from_json(ai_result)
+
+    async def stream_refinement_async(self, previous_questions: str, previous_answers: str, feedback: str, use_cache: bool = True):
+        """
+        Streaming form of refine_assignment. Yields a "status" event naming the targeted items,
+        ("delta", {"field": "questions"|"answers", "number", "text"}) with the revised text of each
+        item as soon as the model has finished it, then ("result", {...}) with the merged paper and its diff.
+        """
+        pairs, targets, prompt = self._refine_request(previous_questions, previous_answers, feedback)
+        yield "status", {"message": f"Refining question(s) {', '.join(targets)}..." if targets else "Refining the paper..."}
+        force_google_ai_sdk()
+        schema = RESPONSE_SCHEMAS["refine_items"]
+        pieces, sent = [], 0
+        async for piece in self._stream_async("refine_items", prompt, use_cache=use_cache,
+                                              response_schema=schema, cache_if=lambda t: conforms(parse_json_response(t, schema), schema)):
+            pieces.append(piece)
+            items = partial_json_array("".join(pieces), "items")
+            for item in items[sent:]:
+                if not isinstance(item, dict):
+                    continue
+                number = str(item.get("number", "")).strip().rstrip(".")
+                for field, key in (("questions", "question"), ("answers", "answer")):
+                    if item.get(key):
+                        yield "delta", {"field": field, "number": number, "text": str(item[key]).strip()}
+            sent = max(sent, len(items))
+        ai_result = await self._run_async(self._parse_or_repair, "refine_items", "".join(pieces), schema)
+        yield "result", self._refine_result(previous_questions, previous_answers, pairs, targets, ai_result)
+
+    # --- Async API: same tasks, executed on the bounded worker pool ---
+    async def get_handwriting_legibility_async(self, image, use_cache: bool = True) -> str:
+        return await self._run_async(self.get_handwriting_legibility, image, use_cache=use_cache)
+
+    async def extract_text_from_image_async(self, image, use_cache: bool = True) -> str:
+        return await self._run_async(self.extract_text_from_image, image, use_cache=use_cache)
+
+    async def read_answer_sheet_async(self, image, use_cache: bool = True) -> dict:
+        return await self._run_async(self.read_answer_sheet, image, use_cache=use_cache)
+
+    async def generate_assignment_async(self, context: str, num_questions: int = 5, use_cache: bool = True, context_chars: int = None) -> dict:
+        """
+        Sources longer than AI_CONTEXT_CHARS are map-reduced (AI_LONG_DOC_MODE) or, with that off,
+        cut down to their most representative passages (AI_RETRIEVAL); see long_source_mode.
+        Pass context_chars for context the caller has already fitted, e.g. passages retrieved for
+        a question paper.
+        """
+        mode = long_source_mode(context, context_chars)
+        if mode == "reduce":
+            return await self.generate_assignment_long_async(context, num_questions, use_cache=use_cache)
+        if mode == "retrieval":
+            context = await asyncio.to_thread(representative_passages, context)
+            context_chars = RETRIEVAL_CONTEXT_CHARS
+        return await self._run_async(self.generate_assignment, context, num_questions, use_cache=use_cache, context_chars=context_chars)
+
+    def extract_key_facts(self, chunk: str, use_cache: bool = True) -> str:
+        """Map step for long documents: condenses one chunk into exam-relevant notes."""
+        # Force Google AI SDK usage (not Vertex AI)
+        force_google_ai_sdk()
+        prompt = f"""
+        You are preparing notes for a teacher who will write an exam from this material.
+        **Instructions:**
+        1. Extract the key facts, definitions, processes, formulas and examples as a concise bulleted list.
+        2. Copy any existing exam or exercise questions verbatim.
+        3. Use ONLY the provided text; do not add outside knowledge.
+        **Source Excerpt:**
+        {chunk}
+        """
+        return self._generate("key_facts", prompt, use_cache=use_cache).strip()
+
+    async def reduce_source_async(self, context: str, use_cache: bool = True, chunk_chars: int = None, concurrency: int = None, target_chars: int = None) -> str:
+        """
+        Map-reduce a long document down to at most target_chars of notes. Chunks are condensed
+        concurrently (bounded by `concurrency`); if the combined notes are still too long they
+        are condensed again, so coverage spans the whole document at any length.
+        """
+        chunk_chars = chunk_chars or AI_MAP_CHUNK_CHARS
+        target_chars = target_chars or AI_REDUCE_CHARS
+        semaphore = asyncio.Semaphore(concurrency or AI_MAP_CONCURRENCY)
+
+        async def condense(chunk):
+            async with semaphore:
+                return await self._run_async(self.extract_key_facts, chunk, use_cache=use_cache)
+
+        material = context
+        for round_number in range(1, 4):
+            chunks = chunk_text(material, chunk_chars)
+            print(f"🗺️  Map round {round_number}: {len(material)} chars in {len(chunks)} chunk(s)")
+            notes = await asyncio.gather(*[condense(chunk) for chunk in chunks])
+            material = "\n\n".join(note for note in notes if note)
+            if len(material) <= target_chars or len(chunks) == 1:
+                break
+        return material[:target_chars]
+
+    async def generate_assignment_long_async(self, context: str, num_questions: int = 5, use_cache: bool = True) -> dict:
+        """Long-document mode: reduce the full source, then generate the assignment from the notes."""
+        if not self.text_model: return None
+        notes = await self.reduce_source_async(context, use_cache=use_cache)
+        return await self._run_async(self.generate_assignment, notes, num_questions, use_cache=use_cache, context_chars=AI_REDUCE_CHARS)
+
+    async def evaluate_student_answer_async(self, student_answer: str, model_answer: str, question: str, max_marks: int, use_cache: bool = True) -> dict:
+        return await self._run_async(self.evaluate_student_answer, student_answer, model_answer, question, max_marks, use_cache=use_cache)
+
+    async def analyze_feedback_fairness_async(self, feedback: str, use_cache: bool = True) -> str:
+        return await self._run_async(self.analyze_feedback_fairness, feedback, use_cache=use_cache)
+
+    async def refine_assignment_async(self, previous_questions: str, previous_answers: str, feedback: str, use_cache: bool = True) -> dict:
+        return await self._run_async(self.refine_assignment, previous_questions, previous_answers, feedback, use_cache=use_cache)
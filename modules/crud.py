@@ -2,6 +2,7 @@
 
 from sqlalchemy.orm import Session
 from . import models, schemas
+from .image_hash import hamming_distance
 from passlib.context import CryptContext
 
 # Setup for password hashing
@@ -63,7 +64,7 @@ def get_assignment_by_name_for_user(db: Session, user_id: int, name: str):
         .first()
     )
 
-def create_submission(db: Session, *, user_id: int, assignment_name: str, student_name: str | None, score: int | None, max_score: int | None, created_at: str | None, assignment_id: int | None = None, class_id: int | None = None, student_id: int | None = None, student_sheet_path: str | None = None, remarks: str | None = None):
+def create_submission(db: Session, *, user_id: int, assignment_name: str, student_name: str | None, score: float | None, max_score: float | None, created_at: str | None, assignment_id: int | None = None, class_id: int | None = None, student_id: int | None = None, student_sheet_path: str | None = None, remarks: str | None = None, sheet_hash: str | None = None, sheet_sha256: str | None = None, result_json: str | None = None):
     sub = models.Submission(
         user_id=user_id,
         assignment_name=assignment_name,
@@ -76,12 +77,51 @@ def create_submission(db: Session, *, user_id: int, assignment_name: str, studen
         created_at=created_at,
         student_sheet_path=student_sheet_path,
         remarks=remarks,
+        sheet_hash=sheet_hash,
+        sheet_sha256=sheet_sha256,
+        result_json=result_json,
     )
     db.add(sub)
     db.commit()
     db.refresh(sub)
     return sub
 
+def set_submission_result(db: Session, submission_id: int, result_json: str):
+    db.query(models.Submission).filter(models.Submission.id == submission_id).update({"result_json": result_json})
+    db.commit()
+
+def _graded_submissions(db: Session, user_id: int, assignment_id: int, student_id: int | None):
+    """Graded submissions of one student (or of unassigned sheets) for one assignment."""
+    return db.query(models.Submission).filter(
+        models.Submission.user_id == user_id,
+        models.Submission.assignment_id == assignment_id,
+        models.Submission.student_id.is_(None) if student_id is None else models.Submission.student_id == student_id,
+        models.Submission.result_json.isnot(None),
+    )
+
+def find_duplicate_submission(db: Session, user_id: int, assignment_id: int, student_id: int | None, sheet_sha256: str):
+    """Most recent graded submission of the same student for this assignment with a byte-identical sheet."""
+    return (
+        _graded_submissions(db, user_id, assignment_id, student_id)
+        .filter(models.Submission.sheet_sha256 == sheet_sha256)
+        .order_by(models.Submission.id.desc())
+        .first()
+    )
+
+def get_graded_submission(db: Session, user_id: int, assignment_id: int, student_id: int | None, submission_id: int):
+    return _graded_submissions(db, user_id, assignment_id, student_id).filter(models.Submission.id == submission_id).first()
+
+def find_similar_submission(db: Session, user_id: int, assignment_id: int, student_id: int | None, sheet_hash: str, max_distance: int):
+    """Closest graded submission of the same student for this assignment whose perceptual sheet hash
+    is within max_distance bits. Only a candidate: the caller must not reuse its result unconfirmed."""
+    best, best_distance = None, max_distance + 1
+    candidates = _graded_submissions(db, user_id, assignment_id, student_id).filter(models.Submission.sheet_hash.isnot(None))
+    for sub in candidates.order_by(models.Submission.id.desc()):
+        distance = hamming_distance(sub.sheet_hash, sheet_hash)
+        if distance < best_distance:
+            best, best_distance = sub, distance
+    return best
+
 def list_user_submissions(db: Session, user_id: int):
     return db.query(models.Submission).filter(models.Submission.user_id == user_id).all()
 
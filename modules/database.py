@@ -39,8 +39,16 @@ def _apply_sqlite_migrations():
                 cols_to_add.append("ALTER TABLE submissions ADD COLUMN remarks TEXT")
             if 'student_sheet_path' not in existing_cols:
                 cols_to_add.append("ALTER TABLE submissions ADD COLUMN student_sheet_path TEXT")
+            if 'sheet_hash' not in existing_cols:
+                cols_to_add.append("ALTER TABLE submissions ADD COLUMN sheet_hash VARCHAR")
+            if 'result_json' not in existing_cols:
+                cols_to_add.append("ALTER TABLE submissions ADD COLUMN result_json TEXT")
+            if 'sheet_sha256' not in existing_cols:
+                cols_to_add.append("ALTER TABLE submissions ADD COLUMN sheet_sha256 VARCHAR")
             for stmt in cols_to_add:
                 conn.exec_driver_sql(stmt)
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_submissions_sheet_hash ON submissions (sheet_hash)")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_submissions_sheet_sha256 ON submissions (sheet_sha256)")
             # Ensure new columns exist on 'assignments'
             a_cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(assignments)")}
             a_add = []
@@ -1,44 +1,291 @@
 # modules/document_parser.py
 
+import codecs
+import io
+import itertools
+import multiprocessing
+import os
+import pickle
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+from xml.etree import ElementTree
 import fitz  # PyMuPDF
 import pptx
 
+# Large PDFs are split into page ranges and extracted in a process pool; small ones are read inline
+DOC_PARSE_WORKERS = int(os.getenv("DOC_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+DOC_PARALLEL_MIN_PAGES = int(os.getenv("DOC_PARALLEL_MIN_PAGES", "40"))
+DOC_PAGES_PER_TASK = int(os.getenv("DOC_PAGES_PER_TASK", "25"))
+DOC_MAX_PAGES = int(os.getenv("DOC_MAX_PAGES", "0"))  # 0 = no limit
+# Part of the parsed-document cache key: bump whenever extraction output changes
+PARSER_VERSION = "3"
+
+_pool = None
+_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"BM", b"II*\x00", b"MM\x00*")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process runs threads that must not be forked
+        _pool = ProcessPoolExecutor(max_workers=DOC_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _open_pdf(source):
+    return fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+
+
+def _pdf_pages(source, pages: range) -> list:
+    """Text of the given PDF pages; runs in a pool worker, which opens its own copy of the document."""
+    with _open_pdf(source) as doc:
+        return [doc[number].get_text() for number in pages]
+
+
+def _as_file(source):
+    """Seekable binary file for a path, bytes or an already open (e.g. spooled upload) file, rewound."""
+    if isinstance(source, str):
+        return open(source, "rb")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _read_all(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    f = _as_file(source)
+    try:
+        return f.read()
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _decode(data: bytes) -> str:
+    return codecs.decode(data, "utf-8-sig", errors="replace")
+
+
+class _HTMLText(HTMLParser):
+    """Collects visible text, with line breaks at block elements."""
+    BLOCKS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "table", "ul", "ol", "pre", "blockquote"}
+    SKIP = {"script", "style", "head", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts, self._skipping = [], 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in "".join(self.parts).split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
 class DocumentParser:
     """
-    A utility class to extract plain text from PDF and PowerPoint files.
+    A utility class to extract plain text from uploaded documents.
+
+    Parsers are registered per document kind and picked by sniffing the content (magic bytes,
+    zip members, markup), never by file extension. Every parser is a generator
+    `fn(source, pages, max_pages)` yielding text page by page, where source is a path or a
+    seekable binary file (bytes are wrapped), so uploads parse straight from memory.
     """
-    def parse(self, file_path: str, file_type: str) -> str:
+    def __init__(self):
+        self.parsers = {}
+        self.register("pdf", self._iter_pdf)
+        self.register("pptx", self._iter_pptx)
+        self.register("docx", self._iter_docx)
+        self.register("text", self._iter_text)
+        self.register("markdown", self._iter_markdown)
+        self.register("html", self._iter_html)
+
+    def register(self, kind: str, parser):
+        self.parsers[kind] = parser
+
+    def sniff(self, source, filename: str = None) -> str:
+        """
+        Document kind from the content: "pdf", "pptx", "docx", "html", "markdown", "text",
+        "image", or None when unrecognised. The filename only tells Markdown from plain text.
         """
-        Parses the given file and returns the extracted text.
+        f = _as_file(source)
+        try:
+            head = f.read(2048)
+            if head.startswith(b"%PDF-"):
+                return "pdf"
+            if head.startswith(b"PK\x03\x04"):
+                f.seek(0)
+                with zipfile.ZipFile(f) as archive:
+                    names = archive.namelist()
+                if "ppt/presentation.xml" in names:
+                    return "pptx"
+                if "word/document.xml" in names:
+                    return "docx"
+                return None
+            if head.startswith(_IMAGE_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP"):
+                return "image"
+            if b"\x00" in head:
+                return None
+            try:
+                text = codecs.getincrementaldecoder("utf-8-sig")().decode(head)
+            except UnicodeDecodeError:
+                return None
+            if re.match(r"\s*(<!doctype html|<html|<head|<body)", text, re.IGNORECASE):
+                return "html"
+            if filename and filename.lower().endswith((".md", ".markdown")):
+                return "markdown"
+            return "text"
+        except zipfile.BadZipFile:
+            return None
+        finally:
+            if f is not source:
+                f.close()
 
-        :param file_path: The path to the file to be parsed.
-        :param file_type: The type of the file ('pdf' or 'pptx').
+    def parse(self, source, file_type: str = None, pages: range = None, max_pages: int = None, filename: str = None) -> str:
+        """
+        Parses the given document and returns the extracted text.
+
+        :param source: A file path, bytes, or a binary file object such as an upload's spooled file.
+        :param file_type: A registered kind; sniffed from the content when omitted.
+        :param pages: Optional 0-based range of pages (slides) to extract, e.g. range(10, 20).
+        :param max_pages: Optional cap on the number of pages extracted (default DOC_MAX_PAGES).
+        :param filename: Optional original name, used only to recognise Markdown.
         :return: A string containing the extracted text.
         """
         try:
-            if file_type == 'pdf':
-                return self._parse_pdf(file_path)
-            elif file_type == 'pptx':
-                return self._parse_pptx(file_path)
-            else:
+            file_type = file_type or self.sniff(source, filename)
+            if file_type not in self.parsers:
                 return "Error: Unsupported file type."
+            return "".join(self.iter_pages(source, file_type, pages, max_pages))
         except Exception as e:
             return f"Error parsing document: {e}"
 
-    def _parse_pdf(self, file_path: str) -> str:
-        """Extracts text from a PDF file."""
-        text = ""
-        with fitz.open(file_path) as doc:
-            for page in doc:
-                text += page.get_text()
-        return text
-
-    def _parse_pptx(self, file_path: str) -> str:
-        """Extracts text from a PowerPoint (pptx) file."""
-        text = ""
-        prs = pptx.Presentation(file_path)
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
\ No newline at end of file
+    def iter_pages(self, source, file_type: str, pages: range = None, max_pages: int = None):
+        """Yields the text of each selected page (slide) in order."""
+        if file_type not in self.parsers:
+            raise ValueError(f"Unsupported file type '{file_type}'.")
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        return self.parsers[file_type](source, pages, max_pages)
+
+    @staticmethod
+    def _select(total: int, pages: range = None, max_pages: int = None) -> range:
+        selected = range(total)
+        if pages is not None:
+            selected = selected[pages.start:pages.stop:pages.step]
+        max_pages = DOC_MAX_PAGES if max_pages is None else max_pages
+        return selected[:max_pages] if max_pages else selected
+
+    def _iter_pdf(self, source, pages: range = None, max_pages: int = None):
+        """Extracts text from a PDF file, page ranges in parallel when the document is large."""
+        if not isinstance(source, str):
+            source = _read_all(source)
+        with _open_pdf(source) as doc:
+            selected = self._select(doc.page_count, pages, max_pages)
+            if len(selected) < DOC_PARALLEL_MIN_PAGES or DOC_PARSE_WORKERS < 2:
+                for number in selected:
+                    yield doc[number].get_text()
+                return
+        done = 0
+        try:
+            pool = _get_pool()
+            chunks = (selected[i:i + DOC_PAGES_PER_TASK] for i in range(0, len(selected), DOC_PAGES_PER_TASK))
+            # Keep a bounded window of ranges in flight and hand them back in page order
+            pending = deque(pool.submit(_pdf_pages, source, chunk) for chunk in itertools.islice(chunks, DOC_PARSE_WORKERS * 2))
+            while pending:
+                texts = pending.popleft().result()
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.append(pool.submit(_pdf_pages, source, chunk))
+                yield from texts
+                done += len(texts)
+        except (BrokenProcessPool, pickle.PicklingError, OSError) as e:
+            # A dead worker or a pool that cannot start must not fail the upload: finish inline
+            print(f"⚠️  PDF page pool failed ({type(e).__name__}: {e}); extracting the remaining {len(selected) - done} page(s) inline")
+            shutdown()
+            with _open_pdf(source) as doc:
+                for number in selected[done:]:
+                    yield doc[number].get_text()
+
+    def _iter_pptx(self, source, pages: range = None, max_pages: int = None):
+        """Extracts text from a PowerPoint (pptx) file, one slide at a time."""
+        prs = pptx.Presentation(_as_file(source) if not isinstance(source, str) else source)
+        slides = list(prs.slides)
+        for number in self._select(len(slides), pages, max_pages):
+            yield "".join(shape.text + "\n" for shape in slides[number].shapes if hasattr(shape, "text"))
+
+    def _iter_docx(self, source, pages: range = None, max_pages: int = None):
+        """Extracts paragraph text from a Word (docx) file; explicit page breaks delimit pages."""
+        with zipfile.ZipFile(_as_file(source) if not isinstance(source, str) else source) as archive:
+            with archive.open("word/document.xml") as xml:
+                document = ElementTree.parse(xml)
+        page_texts, current = [], []
+        for paragraph in document.iter(f"{_WORD}p"):
+            line = []
+            for node in paragraph.iter():
+                if node.tag == f"{_WORD}t":
+                    line.append(node.text or "")
+                elif node.tag == f"{_WORD}tab":
+                    line.append("\t")
+                elif node.tag == f"{_WORD}br" and node.get(f"{_WORD}type") == "page":
+                    current.append("".join(line))
+                    page_texts.append("\n".join(current) + "\n")
+                    current, line = [], []
+                elif node.tag in (f"{_WORD}br", f"{_WORD}cr"):
+                    line.append("\n")
+            current.append("".join(line))
+        page_texts.append("\n".join(current) + "\n")
+        for number in self._select(len(page_texts), pages, max_pages):
+            yield page_texts[number]
+
+    def _iter_text(self, source, pages: range = None, max_pages: int = None):
+        """Plain text (UTF-8); form feeds delimit pages."""
+        page_texts = _decode(_read_all(source)).split("\f")
+        for number in self._select(len(page_texts), pages, max_pages):
+            text = page_texts[number]
+            yield text if text.endswith("\n") else text + "\n"
+
+    def _iter_markdown(self, source, pages: range = None, max_pages: int = None):
+        """Markdown as plain text: keeps headings and list text, drops link targets, images and emphasis markers."""
+        for page in self._iter_text(source, pages, max_pages):
+            page = re.sub(r"!\[([^\]]*)\]\([^)]*\)", r"\1", page)
+            page = re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", page)
+            page = re.sub(r"^\s{0,3}(#{1,6}|>)\s*", "", page, flags=re.MULTILINE)
+            page = re.sub(r"^```.*$", "", page, flags=re.MULTILINE)
+            page = re.sub(r"^(\s*)[*+]\s+", r"\1- ", page, flags=re.MULTILINE)
+            yield re.sub(r"(\*\*|__|\*|`)", "", page)
+
+    def _iter_html(self, source, pages: range = None, max_pages: int = None):
+        """Visible text of an HTML page, as a single page."""
+        if self._select(1, pages, max_pages):
+            parser = _HTMLText()
+            parser.feed(_decode(_read_all(source)))
+            parser.close()
+            yield parser.text()
@@ -0,0 +1,187 @@
+# modules/fake_backend.py
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from .structured_output import RESPONSE_SCHEMAS
+
+# Local stand-in for the Gemini API (AI_BACKEND=fake): no network, no quota. Latency is drawn
+# from AI_FAKE_LATENCY ("fixed:MS", "uniform:MIN_MS:MAX_MS" or "lognormal:MEDIAN_MS:SIGMA"),
+# AI_FAKE_ERROR_RATE of calls fail with HTTP AI_FAKE_ERROR_CODE, and AI_FAKE_RESPONSES may
+# point to a JSON file of canned responses per task that replace the built-in ones.
+AI_FAKE_LATENCY = os.getenv("AI_FAKE_LATENCY", "lognormal:800:0.5")
+AI_FAKE_ERROR_RATE = float(os.getenv("AI_FAKE_ERROR_RATE", "0"))
+AI_FAKE_ERROR_CODE = int(os.getenv("AI_FAKE_ERROR_CODE", "503"))
+AI_FAKE_RESPONSES = os.getenv("AI_FAKE_RESPONSES")
+AI_FAKE_SEED = os.getenv("AI_FAKE_SEED")
+
+# Prompt fragments identifying each AICore task when no response schema is attached, checked in order
+TASK_MARKERS = [
+    ("json_repair", "Rewrite the following model output as a single JSON object"),
+    ("read_sheet", '"transcription", "legibility_score"'),
+    ("legibility", "Rate the legibility"),
+    ("ocr", "Transcribe the text"),
+    ("evaluation_batch", '"evaluations"'),
+    ("fairness_batch", '"checks"'),
+    ("evaluation", '"key_concepts_missed"'),
+    ("refine_items", "revising an exam paper"),
+    ("assignment", "creating an exam"),
+    ("key_facts", "preparing notes for a teacher"),
+    ("fairness", "constructive and fair"),
+]
+
+CANNED_RESPONSES = {
+    "legibility": "Score: 7, Comment: Mostly neat handwriting with a few cramped words.",
+    "ocr": "1. Evaporation turns water into vapour.\n2. Condensation forms clouds.",
+    "read_sheet": {
+        "transcription": "1. Evaporation turns water into vapour.\n2. Condensation forms clouds.",
+        "legibility_score": 7,
+        "legibility_comment": "Mostly neat handwriting with a few cramped words.",
+    },
+    "assignment": {
+        "questions": "1. What is evaporation?\n2. How do clouds form?\n3. What is precipitation?",
+        "answers": "1. Water turning into vapour when heated.\n2. Water vapour condenses around dust particles.\n3. Water falling from clouds as rain, snow or hail.",
+    },
+    "key_facts": "- Evaporation turns liquid water into vapour.\n- Condensation forms clouds.\n- Precipitation returns water to the surface.",
+    "fairness": "Fairness Check: Pass. The feedback is specific and constructive.",
+    "evaluation": {
+        "rationale": "Covers the main idea but misses supporting detail.",
+        "feedback": "Good start; add an example and name the process precisely.",
+        "key_concepts_missed": "- Role of heat energy",
+    },
+    "json_repair": {},
+}
+
+
+class FakeAPIError(Exception):
+    """Mimics google.api_core errors, which carry the HTTP status in `code`."""
+    def __init__(self, code: int):
+        super().__init__(f"{code} Simulated API error")
+        self.code = code
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: FakeUsage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeStream:
+    """Iterable of text chunks, delivered over the sampled latency like a streamed response."""
+    def __init__(self, text: str, usage: FakeUsage, latency: float, chunk_chars: int = 64):
+        self._chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        self._latency = latency
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        # Roughly a third of the latency is time to first token, the rest is spread over the chunks
+        time.sleep(self._latency / 3)
+        gap = (self._latency * 2 / 3) / len(self._chunks)
+        for chunk in self._chunks:
+            yield FakeResponse(chunk, None)
+            time.sleep(gap)
+
+
+def parse_latency(spec: str):
+    """Returns a zero-argument sampler (seconds) for a latency spec such as "lognormal:800:0.5"."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: _RANDOM.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        return lambda: _RANDOM.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+def load_canned_responses() -> dict:
+    responses = dict(CANNED_RESPONSES)
+    if AI_FAKE_RESPONSES:
+        try:
+            with open(AI_FAKE_RESPONSES, "r") as f:
+                responses.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring invalid AI_FAKE_RESPONSES: {e}")
+    return responses
+
+
+_RANDOM = random.Random(AI_FAKE_SEED)
+_RANDOM_LOCK = threading.Lock()
+_SCHEMA_TASKS = [(schema, task) for task, schema in RESPONSE_SCHEMAS.items()]
+
+
+def detect_task(prompt: str, generation_config=None) -> str:
+    schema = getattr(generation_config, "response_schema", None)
+    for known, task in _SCHEMA_TASKS:
+        if schema is not None and schema == known:
+            return task
+    for task, marker in TASK_MARKERS:
+        if marker in prompt:
+            return task
+    return "default"
+
+
+class FakeModel:
+    """Drop-in for genai.GenerativeModel: generate_content(contents, stream=False, generation_config=None)."""
+    def __init__(self, model_name: str, latency: str = None, error_rate: float = None, responses: dict = None):
+        self.model_name = model_name
+        self._sample_latency = parse_latency(latency or AI_FAKE_LATENCY)
+        self.error_rate = AI_FAKE_ERROR_RATE if error_rate is None else error_rate
+        self.responses = responses or load_canned_responses()
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt = "\n".join(part for part in parts if isinstance(part, str))
+        with _RANDOM_LOCK:
+            latency = self._sample_latency()
+            failed = _RANDOM.random() < self.error_rate
+        if failed:
+            time.sleep(latency / 3)
+            raise FakeAPIError(AI_FAKE_ERROR_CODE)
+        text = self._respond(detect_task(prompt, generation_config), prompt)
+        # ~4 characters per token, 258 tokens per image (Gemini's flat image rate)
+        usage = FakeUsage(len(prompt) // 4 + 258 * (len(parts) - sum(isinstance(p, str) for p in parts)), len(text) // 4)
+        if stream:
+            return FakeStream(text, usage, latency)
+        time.sleep(latency)
+        return FakeResponse(text, usage)
+
+    def _respond(self, task: str, prompt: str) -> str:
+        canned = self.responses.get(task, "OK")
+        if task == "evaluation" and isinstance(canned, dict):
+            canned = {"marks": self._marks(prompt), **canned}
+        elif task == "evaluation_batch" and "evaluations" not in canned:
+            evaluation = self.responses.get("evaluation", {})
+            canned = {"evaluations": [
+                {"submission_id": sid, "marks": self._marks(prompt), **evaluation}
+                for sid in re.findall(r'\*\*Submission "(.+?)":\*\*', prompt)
+            ]}
+        elif task == "fairness_batch" and isinstance(canned, str):
+            canned = {"checks": [
+                {"submission_id": sid, "verdict": "Pass", "explanation": "The feedback is specific and constructive."}
+                for sid in re.findall(r'\*\*Feedback "(.+?)":\*\*', prompt)
+            ]}
+        elif task == "refine_items" and isinstance(canned, str):
+            canned = {"items": [
+                {"number": number, "question": f"Revised question {number}.", "answer": f"Revised answer {number}."}
+                for number in re.findall(r'\*\*Item (\d+)\*\*', prompt)[:1]
+            ], "removed": []}
+        return canned if isinstance(canned, str) else json.dumps(canned)
+
+    @staticmethod
+    def _marks(prompt: str) -> float:
+        match = re.search(r'score out of (\d+)', prompt)
+        max_marks = int(match.group(1)) if match else 10
+        with _RANDOM_LOCK:
+            return round(max_marks * _RANDOM.uniform(0.4, 1.0), 1)
@@ -0,0 +1,46 @@
+# modules/image_hash.py
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps
+from .image_preprocess import is_pdf
+
+PDF_HASH_DPI = 48  # pages only need to be big enough for the 17x16 thumbnail
+# 16x16 = 256-bit hashes: 64-bit hashes of different students' sheets on one printed template
+# are often only a few bits apart, closer than two photos of the same sheet
+SHEET_HASH_SIZE = 16
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> str:
+    """
+    Difference hash of an image as a hex string (hash_size**2 bits). Compares the brightness of
+    horizontally adjacent pixels on a tiny grayscale thumbnail, so re-encoded, rescaled or
+    slightly re-exposed photos of the same sheet hash to the same or nearby values.
+    """
+    image = ImageOps.exif_transpose(image).convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def dhash_file(path: str, hash_size: int = SHEET_HASH_SIZE) -> str:
+    """dhash of an image file; for a PDF, the hashes of its pages concatenated in page order."""
+    if is_pdf(path):
+        with fitz.open(path) as doc:
+            return "".join(dhash(_page_image(page), hash_size) for page in doc)
+    with Image.open(path) as image:
+        return dhash(image, hash_size)
+
+
+def _page_image(page) -> Image.Image:
+    pixmap = page.get_pixmap(dpi=PDF_HASH_DPI, colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def hamming_distance(a: str, b: str) -> int:
+    if len(a) != len(b):
+        return 4 * max(len(a), len(b))  # different page counts or hash sizes never match
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
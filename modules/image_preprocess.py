@@ -0,0 +1,119 @@
+# modules/image_preprocess.py
+
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps
+from .telemetry import SHEET_BYTES_IN, SHEET_BYTES_OUT, SHEET_PREPROCESS_SECONDS
+
+# Answer sheets are normalised once, off the event loop and outside the API process, and the
+# resulting JPEG is reused by every vision call instead of the SDK re-encoding a full-size photo.
+SHEET_PREPROCESS = os.getenv("SHEET_PREPROCESS", "1") == "1"
+SHEET_MAX_SIDE = int(os.getenv("SHEET_MAX_SIDE", "2048"))  # longest side in pixels after downscaling
+SHEET_JPEG_QUALITY = int(os.getenv("SHEET_JPEG_QUALITY", "80"))
+SHEET_GRAYSCALE = os.getenv("SHEET_GRAYSCALE", "1") == "1"  # grayscale + autocontrast for handwriting
+SHEET_PREPROCESS_WORKERS = int(os.getenv("SHEET_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Scanned PDF answer sheets: each page is rasterised at this resolution, then encoded like a photo
+SHEET_PDF_DPI = int(os.getenv("SHEET_PDF_DPI", "200"))
+
+_pool = None
+
+
+def preprocess_sheet(path: str, max_side: int = None, quality: int = None, grayscale: bool = None) -> dict:
+    """
+    Loads an answer sheet photo and returns it as a compact JPEG part:
+    {"mime_type", "data", "original_bytes", "bytes", "original_size", "size"}.
+    Applies EXIF orientation, downscales to max_side and optionally converts to
+    contrast-stretched grayscale.
+    """
+    max_side = max_side or SHEET_MAX_SIDE
+    grayscale = SHEET_GRAYSCALE if grayscale is None else grayscale
+    with Image.open(path) as image:
+        original_size = image.size
+        # JPEG only: decode at a reduced scale (1/2, 1/4, 1/8) when the photo is much larger than needed
+        image.draft("L" if grayscale else "RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        part = _encode(image, max_side, quality, grayscale)
+    return {**part, "original_bytes": os.path.getsize(path), "original_size": original_size}
+
+
+def is_pdf(path: str) -> bool:
+    """Sniffs the PDF signature; copier uploads do not always carry a .pdf name."""
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def pdf_page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def render_pdf_page(path: str, page_number: int, dpi: int = None, max_side: int = None, quality: int = None, grayscale: bool = None) -> dict:
+    """
+    Rasterises one page (0-based) of a PDF answer sheet at dpi and returns it as the same JPEG
+    part as preprocess_sheet. Only this page is decoded, so memory does not grow with page count.
+    """
+    grayscale = SHEET_GRAYSCALE if grayscale is None else grayscale
+    with fitz.open(path) as doc:
+        pixmap = doc[page_number].get_pixmap(dpi=dpi or SHEET_PDF_DPI, colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False)
+        page_share = os.path.getsize(path) // doc.page_count  # uploaded bytes attributed to this page
+    image = Image.frombytes("L" if grayscale else "RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    original_size = image.size
+    part = _encode(image, max_side, quality, grayscale)
+    return {**part, "original_bytes": page_share, "original_size": original_size}
+
+
+def _encode(image: Image.Image, max_side: int = None, quality: int = None, grayscale: bool = False) -> dict:
+    max_side = max_side or SHEET_MAX_SIDE
+    quality = quality or SHEET_JPEG_QUALITY
+    if grayscale:
+        image = ImageOps.autocontrast(image.convert("L"), cutoff=1)
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+    return {"mime_type": "image/jpeg", "data": data, "bytes": len(data), "size": image.size}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process runs threads (model worker pool) that must not be forked
+        _pool = ProcessPoolExecutor(max_workers=SHEET_PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def preprocess_sheet_async(path: str) -> dict:
+    """Runs preprocess_sheet in the process pool and records the bytes saved."""
+    started = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(_get_pool(), preprocess_sheet, path)
+    _record(result, started)
+    return result
+
+
+async def render_pdf_page_async(path: str, page_number: int) -> dict:
+    """Runs render_pdf_page in the process pool."""
+    started = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(_get_pool(), render_pdf_page, path, page_number)
+    _record(result, started)
+    return result
+
+
+def _record(result: dict, started: float):
+    SHEET_PREPROCESS_SECONDS.observe(time.perf_counter() - started)
+    SHEET_BYTES_IN.inc(amount=result["original_bytes"])
+    SHEET_BYTES_OUT.inc(amount=result["bytes"])
+    print(f"🖼️  Sheet {result['original_size']} {result['original_bytes'] // 1024} KB -> {result['size']} {result['bytes'] // 1024} KB")
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
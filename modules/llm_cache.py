@@ -0,0 +1,140 @@
+# modules/llm_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(contents) -> str:
+    """Stable hash over a request's prompt text and image bytes."""
+    digest = hashlib.sha256()
+    for part in contents if isinstance(contents, list) else [contents]:
+        if isinstance(part, str):
+            digest.update(part.encode("utf-8"))
+        elif isinstance(part, (bytes, bytearray)):
+            digest.update(part)
+        elif isinstance(part, dict) and "data" in part:
+            digest.update(part.get("mime_type", "").encode("utf-8"))
+            digest.update(part["data"])
+        elif hasattr(part, "tobytes"):
+            # PIL image: hash the decoded pixels so re-encoded copies still match
+            digest.update(f"{part.mode}{part.size}".encode("utf-8"))
+            digest.update(part.tobytes())
+        else:
+            digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for model responses: an in-memory LRU in front of an on-disk SQLite store.
+    Entries expire after `ttl_seconds`; the disk tier is trimmed (least recently used first)
+    once it grows past `max_disk_bytes`.
+    """
+    def __init__(self, db_path: str, max_memory_entries: int = 512, max_disk_bytes: int = 256 * 1024 * 1024, ttl_seconds: int = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, template_version: str, content_hash: str) -> str:
+        return hashlib.sha256(f"{model_name}|{template_version}|{content_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self._remember(key, row[0], row[1])
+                self.counters["disk_hits"] += 1
+                return row[0]
+            if row is not None:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self.counters["writes"] += 1
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 50:
+                self._trim_disk(now)
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _trim_disk(self, now: float):
+        """Drops expired rows, then least recently used rows until the store fits the size cap."""
+        self._writes_since_trim = 0
+        cur = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        self.counters["evictions"] += cur.rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_disk_bytes:
+            doomed, freed = [], 0
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                doomed.append((key,))
+                freed += size
+                if total - freed <= self.max_disk_bytes:
+                    break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.counters["evictions"] += len(doomed)
+        self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            disk_entries, disk_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {
+                **self.counters,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes,
+            }
@@ -0,0 +1,90 @@
+# modules/model_router.py
+
+import json
+import os
+import threading
+
+# Each AICore task maps to an ordered fallback chain of models. Cheap, short-output
+# tasks go to a flash tier; grading and authoring stay on the pro tier.
+DEFAULT_ROUTES = {
+    "legibility": ["gemini-2.0-flash", "gemini-1.5-flash", "gemini-2.5-pro"],
+    "fairness": ["gemini-2.0-flash", "gemini-1.5-flash", "gemini-2.5-pro"],
+    "fairness_batch": ["gemini-2.0-flash", "gemini-1.5-flash", "gemini-2.5-pro"],
+    "ocr": ["gemini-2.5-pro", "gemini-2.0-flash", "gemini-1.5-pro"],
+    "read_sheet": ["gemini-2.5-pro", "gemini-2.0-flash", "gemini-1.5-pro"],
+    "evaluation": ["gemini-2.5-pro", "gemini-1.5-pro", "gemini-2.0-flash"],
+    "evaluation_batch": ["gemini-2.5-pro", "gemini-1.5-pro", "gemini-2.0-flash"],
+    "assignment": ["gemini-2.5-pro", "gemini-2.0-flash", "gemini-1.5-pro"],
+    "key_facts": ["gemini-2.0-flash", "gemini-1.5-flash", "gemini-2.5-pro"],
+    "json_repair": ["gemini-2.0-flash", "gemini-1.5-flash"],
+    "refine_items": ["gemini-2.5-pro", "gemini-2.0-flash", "gemini-1.5-pro"],
+}
+
+# Approximate list prices in USD per 1M tokens (input, output), used for cost estimates only
+MODEL_PRICING = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-pro-latest": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.0-pro": (0.50, 1.50),
+}
+
+
+def load_routes() -> dict:
+    """Default routing table, overridden per task by the AI_ROUTES JSON env var (or a path to a JSON file)."""
+    routes = {task: list(chain) for task, chain in DEFAULT_ROUTES.items()}
+    override = os.getenv("AI_ROUTES")
+    if override:
+        try:
+            if os.path.isfile(override):
+                with open(override, "r") as f:
+                    override = f.read()
+            for task, chain in json.loads(override).items():
+                routes[task] = [chain] if isinstance(chain, str) else list(chain)
+        except (OSError, ValueError, AttributeError) as e:  # AttributeError: JSON that is not an object
+            print(f"⚠️  Ignoring invalid AI_ROUTES: {e}")
+    return routes
+
+
+class ModelRouter:
+    """
+    Resolves the model fallback chain for a task and keeps per-route (task, model)
+    latency, token and estimated cost statistics.
+    """
+    def __init__(self, routes: dict = None):
+        self.routes = routes or load_routes()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def chain(self, task: str, default_model: str = None) -> list:
+        chain = list(self.routes.get(task, []))
+        # The probed default model is always the last resort
+        if default_model and default_model not in chain:
+            chain.append(default_model)
+        return chain
+
+    def record(self, task: str, model_name: str, latency: float, ok: bool, input_tokens: int = 0, output_tokens: int = 0):
+        price_in, price_out = MODEL_PRICING.get(model_name, (0.0, 0.0))
+        with self._lock:
+            route = self._stats.setdefault((task, model_name), {"calls": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+            route["calls"] += 1
+            route["errors"] += 0 if ok else 1
+            route["latency_total"] += latency
+            route["latency_max"] = max(route["latency_max"], latency)
+            route["input_tokens"] += input_tokens
+            route["output_tokens"] += output_tokens
+            route["cost_usd"] += (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+    def stats(self) -> list:
+        with self._lock:
+            return [
+                {
+                    "task": task,
+                    "model": model_name,
+                    **{k: round(v, 6) if isinstance(v, float) else v for k, v in route.items()},
+                    "latency_avg": round(route["latency_total"] / route["calls"], 3) if route["calls"] else 0.0,
+                }
+                for (task, model_name), route in sorted(self._stats.items())
+            ]
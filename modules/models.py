@@ -1,6 +1,6 @@
 # modules/models.py
 
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import Column, Float, Integer, String, Text, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -51,11 +51,14 @@ class Submission(Base):
     class_id = Column(Integer, ForeignKey("classes.id"), nullable=True)
     student_id = Column(Integer, ForeignKey("students.id"), nullable=True)
     student_name = Column(String, nullable=True)
-    score = Column(Integer, nullable=True)
-    max_score = Column(Integer, nullable=True)
+    score = Column(Float, nullable=True)  # per-question marks may be fractional
+    max_score = Column(Float, nullable=True)
     created_at = Column(String, nullable=True)
     remarks = Column(Text, nullable=True)
     student_sheet_path = Column(String, nullable=True)
+    sheet_hash = Column(String, nullable=True, index=True)  # perceptual (dHash) hash of the answer sheet
+    sheet_sha256 = Column(String, nullable=True, index=True)  # exact content hash of the uploaded file
+    result_json = Column(Text, nullable=True)  # full grading response, returned again for duplicate uploads
 
     user = relationship("User", back_populates="submissions")
     
@@ -0,0 +1,167 @@
+# modules/nlp_evaluator.py
+
+import os
+import re
+import numpy as np
+from .telemetry import LOCAL_SCORES
+
+# Local pre-scoring of short answers (opt-in): blank answers get zero and clear matches full marks
+# without a model call; every other answer is escalated to the LLM. Bag-of-words similarity cannot
+# tell a paraphrase from a wrong answer, so a non-blank answer is never rejected locally.
+# Similarity is the mean of TF-IDF cosine and key-term coverage (share of the model answer's key
+# terms the student used), both in 0-1.
+NLP_PRESCORE = os.getenv("NLP_PRESCORE", "0") == "1"
+NLP_ACCEPT_ABOVE = float(os.getenv("NLP_ACCEPT_ABOVE", "0.8"))  # full marks at or above
+# Share of the shared key terms that must appear in the model answer's order for a local accept
+NLP_MIN_ORDER = float(os.getenv("NLP_MIN_ORDER", "0.8"))
+# Model answers with more distinct key terms than this are not objective short answers: always escalate
+NLP_MAX_KEY_TERMS = int(os.getenv("NLP_MAX_KEY_TERMS", "25"))
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_STOPWORDS = frozenset("""
+a about above after again all also an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his how
+i if in into is it its itself just me more most my now of off on once only or other our out over own same
+she should so some such than that the their them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your answer question called known
+""".split())
+# Kept as tokens (not stopwords): "is not", "isn't" and "never" flip an answer's meaning
+_NEGATIONS = frozenset({"not", "no", "nor", "never", "cannot", "none", "neither", "nothing", "without"})
+_PLACEHOLDERS = {"", "(no answer)"}
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens without stopwords, stemmed so that "form", "forms", "formed" and "forming"
+    all map to one token. Negations are kept and "n't" contractions become "not"."""
+    tokens = []
+    for token in _TOKEN.findall((text or "").lower()):
+        if token.endswith("n't"):
+            tokens.append("not")
+            continue
+        token = token.replace("'", "")
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token if token in _NEGATIONS else stem(token))
+    return tokens
+
+
+def stem(token: str) -> str:
+    """Light suffix strip: one of -ing/-ed/-es/-s, then an undoubled final consonant ("running" -> "run")
+    and a silent final e ("evaporate", "evaporates", "evaporated" -> "evaporat"). Stems keep 3+ letters."""
+    for suffix in ("ing", "ed", "es", "s"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3 and not (suffix == "s" and token.endswith(("ss", "is", "us"))):
+            token = token[:-len(suffix)]
+            break
+    if len(token) >= 4 and token[-1] == token[-2] and token[-1] not in "aeioulsz":
+        token = token[:-1]
+    if len(token) >= 4 and token.endswith("e"):
+        token = token[:-1]
+    return token
+
+
+def order_agreement(model_tokens: list, student_tokens: list) -> float:
+    """Share (0-1) of the key terms both answers use that the student wrote in the model answer's order:
+    the longest common subsequence of first occurrences, over the shared terms."""
+    shared = set(model_tokens) & set(student_tokens)
+    if not shared:
+        return 0.0
+    model_order = list(dict.fromkeys(t for t in model_tokens if t in shared))
+    student_order = list(dict.fromkeys(t for t in student_tokens if t in shared))
+    previous = [0] * (len(student_order) + 1)
+    for term in model_order:
+        current = [0]
+        for j, other in enumerate(student_order):
+            current.append(previous[j] + 1 if term == other else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1] / len(shared)
+
+
+def negation_mismatch(model_tokens: list, student_tokens: list) -> bool:
+    """True when one answer is negated and the other is not (different counts of negation words)."""
+    return sum(t in _NEGATIONS for t in model_tokens) != sum(t in _NEGATIONS for t in student_tokens)
+
+
+class AnswerEvaluator:
+    """
+    Vectorised TF-IDF / key-term scorer. score_pairs() scores any number of (model answer, student
+    answer) pairs in one pass, e.g. every item of a paper or a whole class against one answer.
+    """
+    def __init__(self, accept_above: float = None, min_order: float = None, max_key_terms: int = None):
+        self.accept_above = NLP_ACCEPT_ABOVE if accept_above is None else accept_above
+        self.min_order = NLP_MIN_ORDER if min_order is None else min_order
+        self.max_key_terms = NLP_MAX_KEY_TERMS if max_key_terms is None else max_key_terms
+
+    def score_pairs(self, model_answers: list, student_answers: list) -> list:
+        """
+        Returns one dict per pair: {"similarity", "tfidf", "coverage", "confidence",
+        "decision": "accept"|"reject"|"escalate", "blank", "missed": [key terms not used]}.
+        Only blank answers are rejected; an accept also needs matching negation and word order.
+        """
+        model_tokens = [tokenize(text) for text in model_answers]
+        student_tokens = [tokenize(text) for text in student_answers]
+        unique_models = {text: i for i, text in enumerate(model_answers)}
+        vocabulary = {}
+        for tokens in model_tokens + student_tokens:
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+        if not vocabulary:
+            return [self._decide(0.0, 0.0, 0, [], text, [], []) for text in student_answers]
+
+        def counts(token_lists):
+            matrix = np.zeros((len(token_lists), len(vocabulary)), dtype=np.float32)
+            rows = np.repeat(np.arange(len(token_lists)), [len(tokens) for tokens in token_lists])
+            cols = np.fromiter((vocabulary[t] for tokens in token_lists for t in tokens), dtype=np.int64, count=len(rows))
+            np.add.at(matrix, (rows, cols), 1.0)
+            return matrix
+
+        model_counts, student_counts = counts(model_tokens), counts(student_tokens)
+        # Document frequency over the distinct texts, so a model answer repeated for a whole class counts once
+        distinct = np.vstack([model_counts[list(unique_models.values())], student_counts]) > 0
+        idf = np.log((1 + len(distinct)) / (1 + distinct.sum(axis=0))) + 1.0
+
+        def tfidf(matrix):
+            weighted = np.log1p(matrix) * idf
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            return weighted / np.where(norms == 0, 1.0, norms)
+
+        cosine = np.einsum("ij,ij->i", tfidf(model_counts), tfidf(student_counts))
+        model_present, student_present = model_counts > 0, student_counts > 0
+        key_terms = model_present.sum(axis=1)
+        coverage = (model_present & student_present).sum(axis=1) / np.maximum(key_terms, 1)
+
+        terms = list(vocabulary)
+        scores = []
+        for i, text in enumerate(student_answers):
+            missed = [terms[j] for j in np.flatnonzero(model_present[i] & ~student_present[i])]
+            scores.append(self._decide(float(cosine[i]), float(coverage[i]), int(key_terms[i]), missed, text, model_tokens[i], student_tokens[i]))
+        return scores
+
+    def _decide(self, tfidf: float, coverage: float, key_terms: int, missed: list, student_answer: str, model_tokens: list, student_tokens: list) -> dict:
+        similarity = (tfidf + coverage) / 2
+        blank = (student_answer or "").strip().lower() in _PLACEHOLDERS
+        if blank:
+            decision, confidence = "reject", 1.0
+        elif key_terms == 0 or key_terms > self.max_key_terms:
+            decision, confidence = "escalate", 0.0
+        elif (similarity >= self.accept_above and not negation_mismatch(model_tokens, student_tokens)
+              and order_agreement(model_tokens, student_tokens) >= self.min_order):
+            decision, confidence = "accept", (similarity - self.accept_above) / max(1 - self.accept_above, 1e-6)
+        else:
+            decision, confidence = "escalate", 0.0
+        LOCAL_SCORES.inc(decision)
+        return {"similarity": round(similarity, 3), "tfidf": round(tfidf, 3), "coverage": round(coverage, 3),
+                "confidence": round(min(confidence, 1.0), 3), "decision": decision, "blank": blank, "missed": missed}
+
+    @staticmethod
+    def to_result(score: dict, max_marks: int) -> dict:
+        """Evaluation result (same shape as AICore's) for a pair the policy decided locally."""
+        accepted = score["decision"] == "accept"
+        feedback = "Matches the key points of the model answer." if accepted else "No answer was given."
+        return {
+            "marks": max_marks if accepted else 0,
+            "max_marks": max_marks,
+            "feedback": feedback,
+            "key_concepts_missed": "\n".join(f"- {term}" for term in score["missed"][:8]) or "None",
+            "details": {"Rationale": f"Scored locally: similarity {score['similarity']:.2f} (TF-IDF {score['tfidf']:.2f}, key-term coverage {score['coverage']:.0%})."},
+            "graded_by": "local",
+        }
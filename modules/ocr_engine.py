@@ -0,0 +1,187 @@
+# modules/ocr_engine.py
+
+import io
+import os
+from abc import ABC, abstractmethod
+import shutil
+import subprocess
+import time
+from .telemetry import OCR_PAGES, OCR_SECONDS
+
+# OCR_ENGINE: "tiered" (local first, escalate low-confidence pages to Gemini), "tesseract" or "gemini".
+# Tiered falls back to Gemini alone when the tesseract binary is not installed.
+OCR_ENGINE = os.getenv("OCR_ENGINE", "tiered")
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+TESSERACT_PSM = os.getenv("TESSERACT_PSM", "3")  # 3 = automatic page segmentation
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "30"))
+# Minimum mean word confidence (0-100) and text length for a local result to be kept
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "80"))
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "20"))
+
+
+class OCRResult:
+    def __init__(self, text: str, confidence: float = None, engine: str = "", seconds: float = 0.0):
+        self.text = text
+        self.confidence = confidence  # mean word confidence 0-100; None when the engine reports none
+        self.engine = engine
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"OCRResult(engine={self.engine!r}, confidence={self.confidence}, chars={len(self.text)})"
+
+
+class OCRError(RuntimeError):
+    """No usable transcription: the engine is not configured or the recognizer reported an error."""
+
+
+class OCREngine(ABC):
+    """Backend interface: recognize(image) -> OCRResult, where image is a PIL image or an encoded {"mime_type", "data"} part."""
+    name = "base"
+    local = False
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def recognize(self, image) -> OCRResult:
+        """Transcribes one image; raises OCRError (or OSError/SubprocessError) instead of returning error text."""
+
+
+def _image_bytes(image) -> bytes:
+    if isinstance(image, dict):
+        return image["data"]
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TesseractEngine(OCREngine):
+    """Runs the local tesseract binary (image on stdin, TSV on stdout); no network, no quota."""
+    name = "tesseract"
+    local = True
+
+    def __init__(self, cmd: str = None, lang: str = None, psm: str = None, timeout: float = None):
+        self.cmd = cmd or TESSERACT_CMD
+        self.lang = lang or TESSERACT_LANG
+        self.psm = psm or TESSERACT_PSM
+        self.timeout = timeout or OCR_TIMEOUT_SECONDS
+
+    def available(self) -> bool:
+        return shutil.which(self.cmd) is not None
+
+    def recognize(self, image) -> OCRResult:
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [self.cmd, "stdin", "stdout", "-l", self.lang, "--psm", str(self.psm), "tsv"],
+            input=_image_bytes(image), capture_output=True, timeout=self.timeout, check=True,
+        )
+        text, confidence = self.parse_tsv(completed.stdout.decode("utf-8", errors="replace"))
+        return OCRResult(text, confidence, self.name, time.perf_counter() - started)
+
+    @staticmethod
+    def parse_tsv(tsv: str):
+        """Rebuilds line-broken text from tesseract's word-level TSV and returns it with the
+        character-weighted mean word confidence (0 when no words were found)."""
+        lines, current, weighted, chars = [], {}, 0.0, 0
+        for row in tsv.splitlines()[1:]:
+            cols = row.split("\t")
+            if len(cols) < 12 or cols[0] != "5":
+                continue
+            word, conf = cols[11].strip(), float(cols[10])
+            if not word or conf < 0:
+                continue
+            key = (int(cols[1]), int(cols[2]), int(cols[3]), int(cols[4]))  # page, block, paragraph, line
+            current.setdefault(key, []).append(word)
+            weighted += conf * len(word)
+            chars += len(word)
+        previous = None
+        for key in sorted(current):
+            if previous and key[:3] != previous[:3]:
+                lines.append("")  # blank line between paragraphs
+            lines.append(" ".join(current[key]))
+            previous = key
+        return "\n".join(lines).strip(), round(weighted / chars, 1) if chars else 0.0
+
+
+class GeminiEngine(OCREngine):
+    """The existing vision-model transcription (AICore.extract_text_from_image)."""
+    name = "gemini"
+
+    def __init__(self, ai_core):
+        self.ai_core = ai_core
+
+    def available(self) -> bool:
+        return self.ai_core is not None
+
+    def recognize(self, image) -> OCRResult:
+        if not self.ai_core.vision_model:
+            raise OCRError("Vision model not initialized.")
+        started = time.perf_counter()
+        text = self.ai_core.extract_text_from_image(image)
+        # extract_text_from_image reports failures as text; never let them pass as a transcription
+        if text.startswith("Error"):
+            raise OCRError(text)
+        return OCRResult(text, None, self.name, time.perf_counter() - started)
+
+
+class TieredEngine(OCREngine):
+    """Local OCR first; pages below min_confidence (or with almost no text) are escalated to the remote engine."""
+    name = "tiered"
+    local = True
+
+    def __init__(self, local_engine: OCREngine, remote_engine: OCREngine, min_confidence: float = None, min_chars: int = None):
+        self.local_engine = local_engine
+        self.remote_engine = remote_engine
+        self.min_confidence = OCR_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.min_chars = OCR_MIN_CHARS if min_chars is None else min_chars
+
+    def accepts(self, result: OCRResult) -> bool:
+        return result.confidence is not None and result.confidence >= self.min_confidence and len(result.text) >= self.min_chars
+
+    def recognize_local(self, image):
+        """Local result if it passes the confidence policy, else None (the caller decides how to escalate)."""
+        try:
+            result = self.local_engine.recognize(image)
+        except Exception as e:
+            # Any local failure (missing binary, timeout, unparseable TSV) only costs the fast path
+            print(f"⚠️  Local OCR failed, escalating: {type(e).__name__}: {e}")
+            OCR_PAGES.inc(self.local_engine.name, "failed")
+            return None
+        OCR_SECONDS.observe(result.seconds, self.local_engine.name)
+        if self.accepts(result):
+            OCR_PAGES.inc(self.local_engine.name, "accepted")
+            return result
+        OCR_PAGES.inc(self.local_engine.name, "escalated")
+        print(f"🔎 Local OCR confidence {result.confidence} on {len(result.text)} chars, escalating to {self.remote_engine.name}")
+        return None
+
+    def recognize(self, image) -> OCRResult:
+        result = self.recognize_local(image)
+        if result:
+            return result
+        result = self.remote_engine.recognize(image)
+        OCR_SECONDS.observe(result.seconds, self.remote_engine.name)
+        return result
+
+
+def build_ocr_engine(ai_core, engine: str = None) -> OCREngine:
+    """OCR engine for OCR_ENGINE, degrading to whichever of tesseract / Gemini is actually available.
+    Raises OCRError when neither is: no tesseract binary and no AI core."""
+    engine = engine or OCR_ENGINE
+    local, remote = TesseractEngine(), GeminiEngine(ai_core)
+    if not local.available() and not remote.available():
+        raise OCRError(f"No OCR engine available: '{local.cmd}' not found and the AI core is not initialized.")
+    if not local.available():
+        if engine != "gemini":
+            print(f"⚠️  '{local.cmd}' not found; OCR uses {remote.name} only")
+        return remote
+    if not remote.available():
+        if engine != "tesseract":
+            print(f"⚠️  AI core not initialized; OCR uses {local.name} only")
+        return local
+    if engine == "gemini":
+        return remote
+    if engine == "tesseract":
+        return local
+    return TieredEngine(local, remote)
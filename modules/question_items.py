@@ -0,0 +1,172 @@
+# modules/question_items.py
+
+import re
+
+# "1.", "1)", "Q1", "Q1.", "Question 1:", "Ans 1", "Answer 1 -" at the start of a line
+_ITEM_START = re.compile(
+    r'^\s*(?:\*\*)?(?:(?:q(?:uestion)?|ans(?:wer)?)\s*\.?\s*)?(\d{1,3})\s*(?:[.):\-]|\*\*|\s(?=\S))\s*',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _item_spans(text: str) -> list:
+    """(marker start, body start, number) for each item start, numbers strictly increasing."""
+    starts, last = [], 0
+    for match in _ITEM_START.finditer(text):
+        number = int(match.group(1))
+        if number > last:
+            starts.append((match.start(), match.end(), str(number)))
+            last = number
+    return starts
+
+
+def split_numbered(text: str) -> list:
+    """
+    Splits a numbered blob ("1. ...\n2. ...") into [{"number": "1", "text": "..."}].
+    Text before the first number is kept with the first item. Numbers must increase,
+    so a "2." inside an answer body does not start a new item. A blob with no
+    numbering becomes a single item "1".
+    """
+    text = text or ""
+    starts = _item_spans(text)
+    if not starts:
+        return [{"number": "1", "text": text.strip()}] if text.strip() else []
+    items = []
+    for i, (start, body_start, number) in enumerate(starts):
+        body_end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        body = text[body_start:body_end].strip()
+        if i == 0 and text[:start].strip():
+            body = f"{text[:start].strip()}\n{body}"
+        items.append({"number": number, "text": body})
+    return items
+
+
+def join_numbered(items: list) -> str:
+    return "\n".join(f"{item['number']}. {item['text']}" for item in items)
+
+
+def rebuild_numbered(original: str, items: list) -> str:
+    """
+    Writes `items` ([{"number", "text"}], as split_numbered returns them) back into `original`.
+    Unchanged items keep their original text and numbering style verbatim; changed items keep
+    their marker, removed items are cut out and new items are appended in join_numbered form.
+    """
+    original = original or ""
+    starts = _item_spans(original)
+    before = {item["number"]: item["text"] for item in split_numbered(original)}
+    if not starts:
+        kept = [item for item in items if item["text"]]
+        return original if kept == split_numbered(original) else join_numbered(kept)
+    after = {item["number"]: item["text"] for item in items}
+    preamble = original[:starts[0][0]]
+    parts = [preamble]
+    for i, (start, body_start, number) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(original)
+        if number not in after:
+            continue
+        segment = original[start:end]
+        if after[number] != before[number]:
+            text = after[number]
+            if i == 0 and preamble.strip() and text.startswith(preamble.strip()):
+                text = text[len(preamble.strip()):].lstrip()  # the preamble stays where it was
+            body = original[body_start:end]
+            segment = original[start:body_start] + text + body[len(body.rstrip()):]
+        parts.append(segment)
+    rebuilt = "".join(parts)
+    added = [item for item in items if item["number"] not in before and item["text"]]
+    trailing = original[len(original.rstrip()):]
+    rebuilt = rebuilt.rstrip()
+    if added:
+        rebuilt = f"{rebuilt}\n{join_numbered(added)}" if rebuilt else join_numbered(added)
+    return rebuilt + trailing
+
+
+def align_items(questions: str, model_answers: str, student_answers: str) -> list:
+    """
+    Aligns questions, model answers and the student's transcription by question number:
+    [{"number", "question", "model_answer", "student_answer"}]. Missing parts are "".
+    """
+    q_items = split_numbered(questions)
+    answers = {item["number"]: item["text"] for item in split_numbered(model_answers)}
+    student = split_numbered(student_answers)
+    student_by_number = {item["number"]: item["text"] for item in student}
+    if len(q_items) > 1 and len(student) == 1 and student_answers.strip():
+        # Unnumbered transcription: cannot attribute it to a question, give every item the full text
+        student_by_number = {item["number"]: student_answers.strip() for item in q_items}
+    return [
+        {
+            "number": item["number"],
+            "question": item["text"],
+            "model_answer": answers.get(item["number"], ""),
+            "student_answer": student_by_number.get(item["number"], ""),
+        }
+        for item in q_items
+    ]
+
+
+def allocate_marks(max_marks: int, count: int) -> list:
+    """Splits max_marks across count questions as evenly as possible (remainder to the first ones)."""
+    if count <= 0:
+        return []
+    base, remainder = divmod(max_marks, count)
+    return [base + (1 if i < remainder else 0) for i in range(count)]
+
+
+# Only question/item references count: "answers 2-3 sentences" or "no 2 questions alike" name no items
+_REFERENCE = re.compile(r'(?:\b(?:questions?|ques|qs?|items?)|#)\s*\.?\s*((?:\d{1,3}\s*(?:-|–|to|and|&|,|or)?\s*)+)', re.IGNORECASE)
+_RANGE = re.compile(r'(\d{1,3})\s*(?:-|–|to)\s*(\d{1,3})')
+
+
+def referenced_numbers(feedback: str) -> list:
+    """Question numbers a piece of feedback explicitly names ("question 3", "Q2 and Q5", "questions 2-4")."""
+    numbers = []
+    for match in _REFERENCE.finditer(feedback or ""):
+        group = match.group(1)
+        for start, end in _RANGE.findall(group):
+            numbers.extend(range(int(start), int(end) + 1))
+        numbers.extend(int(n) for n in re.findall(r'\d{1,3}', _RANGE.sub(" ", group)))
+    return sorted({str(n) for n in numbers}, key=int)
+
+
+def pair_items(questions: str, answers: str) -> list:
+    """[{"number", "question", "answer"}] for a paper's question and answer blobs, in question order."""
+    q_items = split_numbered(questions)
+    a_items = split_numbered(answers)
+    answers_by_number = {item["number"]: item["text"] for item in a_items}
+    pairs = [{"number": item["number"], "question": item["text"], "answer": answers_by_number.pop(item["number"], "")} for item in q_items]
+    # Answers without a matching question are kept rather than silently dropped
+    pairs.extend({"number": number, "question": "", "answer": text} for number, text in answers_by_number.items())
+    return pairs
+
+
+def merge_items(pairs: list, updated: list, removed: list) -> tuple:
+    """
+    Applies item-level edits to a paper. Returns (merged pairs, changes) where each change is
+    {"number", "action": "modified"|"added"|"removed", "before", "after"}. An item that is both
+    returned and listed as removed is removed.
+    """
+    by_number = {pair["number"]: pair for pair in pairs}
+    changes, merged = [], [dict(pair) for pair in pairs]
+    index = {pair["number"]: i for i, pair in enumerate(merged)}
+    removed = {str(n).strip().rstrip(".") for n in removed or []}
+    for item in updated:
+        number = str(item.get("number", "")).strip().rstrip(".")
+        if not number or number in removed:
+            continue
+        after = {"question": str(item.get("question", "")).strip(), "answer": str(item.get("answer", "")).strip()}
+        before = by_number.get(number)
+        if before is None:
+            merged.append({"number": number, **after})
+            index[number] = len(merged) - 1
+            changes.append({"number": number, "action": "added", "before": None, "after": after})
+        else:
+            # An empty field means "unchanged"
+            after = {key: after[key] or before[key] for key in after}
+            if after != {"question": before["question"], "answer": before["answer"]}:
+                merged[index[number]].update(after)
+                changes.append({"number": number, "action": "modified", "before": {"question": before["question"], "answer": before["answer"]}, "after": after})
+    for number in removed & set(by_number):
+        before = by_number[number]
+        changes.append({"number": number, "action": "removed", "before": {"question": before["question"], "answer": before["answer"]}, "after": None})
+    merged = [pair for pair in merged if pair["number"] not in removed]
+    return merged, changes
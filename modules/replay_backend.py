@@ -0,0 +1,119 @@
+# modules/replay_backend.py
+
+import google.generativeai as genai
+import hashlib
+import json
+import os
+import threading
+import time
+from .fake_backend import FakeResponse, FakeStream, FakeUsage
+from .llm_cache import content_hash
+
+# Fixture store for AI_BACKEND=record / replay: one JSON file per distinct request
+# (model, prompt and images, response schema), so recorded runs can be committed and diffed.
+AI_FIXTURES_PATH = os.getenv("AI_FIXTURES_PATH", os.path.join("fixtures", "ai"))
+# Replay with the recorded latency ("recorded") or instantly ("none")
+AI_REPLAY_LATENCY = os.getenv("AI_REPLAY_LATENCY", "none")
+
+
+class FixtureMissing(Exception):
+    """Replay found no recording for a request. Not retryable: re-record to fix it."""
+
+
+class FixtureStore:
+    def __init__(self, path: str = None):
+        self.path = path or AI_FIXTURES_PATH
+        self._lock = threading.Lock()
+        self.counters = {"recorded": 0, "replayed": 0, "missing": 0}
+
+    @staticmethod
+    def make_key(model_name: str, contents, generation_config=None) -> str:
+        schema = getattr(generation_config, "response_schema", None)
+        raw = f"{model_name}\x00{content_hash(contents)}\x00{json.dumps(schema, sort_keys=True, default=str)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def load(self, key: str):
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.counters["missing"] += 1
+            return None
+        with self._lock:
+            self.counters["replayed"] += 1
+        return fixture
+
+    def save(self, key: str, fixture: dict):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so a concurrent replay never reads a half-written fixture
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.counters["recorded"] += 1
+
+
+FIXTURES = FixtureStore()
+
+
+def _prompt_preview(contents) -> str:
+    parts = contents if isinstance(contents, list) else [contents]
+    text = "\n".join(part for part in parts if isinstance(part, str)).strip()
+    images = len(parts) - sum(isinstance(part, str) for part in parts)
+    return (f"[{images} image(s)] " if images else "") + text[:300]
+
+
+def _usage(response) -> dict:
+    usage = getattr(response, "usage_metadata", None)
+    return {"prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0, "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0}
+
+
+class RecordingModel:
+    """Calls Gemini through genai.GenerativeModel and stores every successful response in the fixture store."""
+    def __init__(self, model_name: str, store: FixtureStore = None):
+        self.model_name = model_name
+        self.store = store or FIXTURES
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        started = time.perf_counter()
+        response = self._model.generate_content(contents, **kwargs)
+        text = response.text
+        # Streams are recorded whole and replayed as chunks, so one fixture serves both call styles
+        self.store.save(FixtureStore.make_key(self.model_name, contents, generation_config), {
+            "model": self.model_name,
+            "prompt": _prompt_preview(contents),
+            "text": text,
+            "usage": _usage(response),
+            "latency": round(time.perf_counter() - started, 3),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        if stream:
+            return FakeStream(text, response.usage_metadata, 0.0)
+        return response
+
+
+class ReplayModel:
+    """Serves recorded responses deterministically; a request without a recording fails."""
+    def __init__(self, model_name: str, store: FixtureStore = None):
+        self.model_name = model_name
+        self.store = store or FIXTURES
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        fixture = self.store.load(FixtureStore.make_key(self.model_name, contents, generation_config))
+        if fixture is None:
+            raise FixtureMissing(f"No recorded response for {self.model_name}: {_prompt_preview(contents)[:120]!r}")
+        latency = fixture.get("latency", 0.0) if AI_REPLAY_LATENCY == "recorded" else 0.0
+        usage = FakeUsage(**fixture.get("usage", {"prompt_token_count": 0, "candidates_token_count": 0}))
+        if stream:
+            return FakeStream(fixture["text"], usage, latency)
+        time.sleep(latency)
+        return FakeResponse(fixture["text"], usage)
@@ -0,0 +1,145 @@
+# modules/resilience.py
+
+import random
+import threading
+import time
+
+# HTTP status codes worth retrying: timeouts, quota (429) and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class AIServiceError(Exception):
+    """A model call failed; the caller must not treat the result as model output."""
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class AIServiceUnavailable(AIServiceError):
+    """The call was refused locally (circuit open or rate limit wait exceeded)."""
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message, retryable=True)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(AIServiceUnavailable):
+    """One model's circuit is rejecting calls; other models in the route may still be tried."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Classifies SDK errors without importing google.api_core (its exceptions carry an HTTP `code`)."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = None  # grpc-style errors expose code() instead of an int
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter. Holds up to `capacity` tokens, refilled at `rate_per_minute`.
+    `acquire` blocks the calling worker thread until a token is free or `max_wait` elapses.
+    """
+    def __init__(self, rate_per_minute: float, capacity: int = None, max_wait: float = 30.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, int(rate_per_minute // 6))
+        self.max_wait = max_wait
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.counters = {"acquired": 0, "throttled": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.counters["acquired"] += 1
+                    if waited:
+                        self.counters["throttled"] += 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                if now + wait > deadline:
+                    self.counters["rejected"] += 1
+                    raise AIServiceUnavailable("AI request rate limit reached; try again shortly.", retry_after=wait)
+                self.counters["wait_seconds"] += wait
+            waited = True
+            time.sleep(wait)
+
+    def state(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {"rate_per_minute": round(self.rate * 60, 2), "capacity": self.capacity, "available_tokens": round(self._tokens, 2), **{k: round(v, 3) for k, v in self.counters.items()}}
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive retryable failures. After `reset_timeout`
+    seconds one trial call is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.status = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        with self._lock:
+            if self.status == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpen("AI service is temporarily unavailable (circuit open).", retry_after=remaining)
+                self.status = self.HALF_OPEN
+            if self.status == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.counters["rejected"] += 1
+                    raise CircuitOpen("AI service is recovering; try again shortly.", retry_after=1.0)
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+            self.status = self.CLOSED
+
+    def record_failure(self, counts_towards_open: bool = True):
+        with self._lock:
+            self.counters["failures"] += 1
+            self._trial_in_flight = False
+            if not counts_towards_open:
+                if self.status == self.HALF_OPEN:
+                    self.status = self.CLOSED
+                return
+            self._consecutive_failures += 1
+            if self.status == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self.status != self.OPEN:
+                    self.counters["opened"] += 1
+                self.status = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def state(self) -> dict:
+        with self._lock:
+            retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)) if self.status == self.OPEN else 0.0
+            return {"status": self.status, "consecutive_failures": self._consecutive_failures, "retry_after": round(retry_after, 1), **self.counters}
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
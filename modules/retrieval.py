@@ -0,0 +1,143 @@
+# modules/retrieval.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from .nlp_evaluator import tokenize
+from .text_chunks import chunk_text
+
+# Long sources are chunked and indexed (BM25) so prompts carry only the passages that matter.
+# Question papers always retrieve per question; whole-source generation uses representative
+# passages only when map-reduce (AI_LONG_DOC_MODE) is off, instead of the first AI_CONTEXT_CHARS
+AI_RETRIEVAL = os.getenv("AI_RETRIEVAL", "1") == "1"
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1200"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "150"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))  # passages per question
+RETRIEVAL_CONTEXT_CHARS = int(os.getenv("RETRIEVAL_CONTEXT_CHARS", "8000"))  # passage budget per prompt
+RETRIEVAL_INDEX_CACHE = int(os.getenv("RETRIEVAL_INDEX_CACHE", "16"))  # source documents kept indexed
+BM25_K1, BM25_B = 1.5, 0.75
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class RetrievalIndex:
+    """
+    BM25 index over overlapping chunks of one source document. Postings are flat NumPy arrays
+    sorted by term (offsets[t]:offsets[t + 1] are term t's chunks and term frequencies), so a
+    query touches only the postings of its own terms.
+    """
+    def __init__(self, text: str, chunk_chars: int = None, overlap_chars: int = None):
+        self.chunks = chunk_text(text, chunk_chars or RETRIEVAL_CHUNK_CHARS, RETRIEVAL_CHUNK_OVERLAP if overlap_chars is None else overlap_chars)
+        self.vocabulary = {}
+        token_ids = [[self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokenize(chunk)] for chunk in self.chunks]
+        n_chunks, n_terms = len(self.chunks), len(self.vocabulary)
+        self.lengths = np.array([len(ids) for ids in token_ids], dtype=np.float32)
+        chunk_of_token = np.repeat(np.arange(n_chunks, dtype=np.int64), [len(ids) for ids in token_ids])
+        term_of_token = np.fromiter((t for ids in token_ids for t in ids), dtype=np.int64, count=len(chunk_of_token))
+        # One entry per (term, chunk) pair, sorted by term then chunk, with its term frequency
+        keys, tf = np.unique(term_of_token * max(n_chunks, 1) + chunk_of_token, return_counts=True)
+        self.postings_chunk = keys % max(n_chunks, 1)
+        self.postings_term = keys // max(n_chunks, 1)
+        self.postings_tf = tf.astype(np.float32)
+        self.offsets = np.searchsorted(self.postings_term, np.arange(n_terms + 1))
+        df = np.diff(self.offsets)
+        self.idf = np.log1p((n_chunks - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(float(self.lengths.mean()) if n_chunks else 1.0, 1.0))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocabulary.get(term)
+            if t is None:
+                continue
+            chunks = self.postings_chunk[self.offsets[t]:self.offsets[t + 1]]
+            tf = self.postings_tf[self.offsets[t]:self.offsets[t + 1]]
+            scores[chunks] += self.idf[t] * tf * (BM25_K1 + 1) / (tf + self.norm[chunks])
+        return scores
+
+    def search(self, query: str, k: int = None) -> list:
+        """Indexes of the k best-matching chunks, best first (chunks sharing no term are left out)."""
+        scores = self.scores(query)
+        return [int(i) for i in np.argsort(-scores, kind="stable")[:k or RETRIEVAL_TOP_K] if scores[i] > 0]
+
+    def for_queries(self, queries: list, budget_chars: int = None, k: int = None) -> list:
+        """Top chunks for every query, taken rank by rank across queries so each one is covered
+        before any gets its second passage; stops at budget_chars. Returned in document order."""
+        budget_chars = budget_chars or RETRIEVAL_CONTEXT_CHARS
+        ranked = [self.search(query, k) for query in queries if query.strip()]
+        chosen, used = [], 0
+        for rank in range(max((len(hits) for hits in ranked), default=0)):
+            for hits in ranked:
+                if rank < len(hits) and hits[rank] not in chosen and used + len(self.chunks[hits[rank]]) <= budget_chars:
+                    chosen.append(hits[rank])
+                    used += len(self.chunks[hits[rank]])
+        return sorted(chosen)
+
+    def representative(self, budget_chars: int = None) -> list:
+        """
+        Chunks that together cover the document's salient vocabulary, for prompts with no
+        question to search for (e.g. generating a paper). Terms are weighted by df * idf, so
+        recurring topic words count and words in every chunk do not; each pick discounts the
+        terms it covers, which spreads the selection across the document. Document order.
+        """
+        budget_chars = budget_chars or RETRIEVAL_CONTEXT_CHARS
+        weights = np.diff(self.offsets).astype(np.float32) * self.idf
+        sizes = np.array([len(chunk) for chunk in self.chunks])
+        available = np.ones(len(self.chunks), dtype=bool)
+        chosen, used = [], 0
+        while True:
+            available &= used + sizes <= budget_chars
+            if not available.any():
+                break
+            gains = np.bincount(self.postings_chunk, weights=weights[self.postings_term], minlength=len(self.chunks))
+            best = int(np.argmax(np.where(available, gains, -1.0)))
+            chosen.append(best)
+            used += sizes[best]
+            available[best] = False
+            weights[self.postings_term[self.postings_chunk == best]] *= 0.3
+        return sorted(chosen)
+
+    def join(self, chunk_indexes: list) -> str:
+        return "\n\n[...]\n\n".join(self.chunks[i] for i in chunk_indexes)
+
+
+def get_index(text: str) -> RetrievalIndex:
+    """Index for a source document, kept in a small LRU keyed by content hash so the same
+    material (e.g. an assignment's source re-uploaded for refinement) is indexed once."""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = RetrievalIndex(text)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > RETRIEVAL_INDEX_CACHE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def passages_for_questions(material: str, queries: list, budget_chars: int = None, k: int = None) -> str:
+    """The passages of material most relevant to the given questions, within budget_chars."""
+    budget_chars = budget_chars or RETRIEVAL_CONTEXT_CHARS
+    if len(material) <= budget_chars:
+        return material
+    index = get_index(material)
+    chosen = index.for_queries(queries, budget_chars, k)
+    print(f"🔎 Retrieved {len(chosen)} of {len(index.chunks)} passages for {len(queries)} question(s)")
+    return index.join(chosen)
+
+
+def representative_passages(material: str, budget_chars: int = None) -> str:
+    """Passages covering the main topics of material, within budget_chars."""
+    budget_chars = budget_chars or RETRIEVAL_CONTEXT_CHARS
+    if len(material) <= budget_chars:
+        return material
+    index = get_index(material)
+    chosen = index.representative(budget_chars)
+    print(f"🔎 Selected {len(chosen)} of {len(index.chunks)} passages ({len(material)} chars of source)")
+    return index.join(chosen)
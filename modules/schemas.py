@@ -26,8 +26,8 @@ class Submission(BaseModel):
     id: int
     assignment_name: str
     student_name: str | None = None
-    score: int | None = None
-    max_score: int | None = None
+    score: float | None = None
+    max_score: float | None = None
     created_at: str | None = None
     remarks: str | None = None
 
@@ -72,6 +72,15 @@ class GenerationResponse(BaseModel):
     questions: str
     answers: str
 
+class RefineChange(BaseModel):
+    number: str
+    action: str
+    before: dict | None = None
+    after: dict | None = None
+
+class RefineResponse(GenerationResponse):
+    changes: list[RefineChange] = []
+
 class RefineRequest(BaseModel):
     previous_questions: str
     previous_answers: str
@@ -89,6 +98,23 @@ class GradeResponse(BaseModel):
     ocr_text: str
     evaluation: dict
     fairness_check: str
+    duplicate_of: int | None = None  # id of the earlier submission whose stored result was returned
+    possible_duplicate_of: int | None = None  # earlier submission that looks like the same sheet; send it as confirm_duplicate_of to reuse its result
+
+class BatchGradeItem(BaseModel):
+    filename: str | None = None
+    student_id: int | None = None
+    student_sheet_path: str | None = None
+    legibility_report: str | None = None
+    ocr_text: str | None = None
+    evaluation: dict | None = None
+    fairness_check: str | None = None
+    duplicate_of: int | None = None
+    possible_duplicate_of: int | None = None
+    error: str | None = None
+
+class BatchGradeResponse(BaseModel):
+    results: list[BatchGradeItem]
 
 class GradeRequest(BaseModel):
     assignment_name: str
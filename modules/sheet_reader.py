@@ -0,0 +1,90 @@
+# modules/sheet_reader.py
+
+import asyncio
+import os
+from PIL import Image
+from .image_preprocess import SHEET_PREPROCESS, is_pdf, pdf_page_count, preprocess_sheet_async, render_pdf_page_async
+from .ocr_engine import TieredEngine
+
+# Read transcription and legibility from the answer sheet in one vision call
+FUSED_VISION = os.getenv("AI_FUSED_VISION", "1") == "1"
+# Try local OCR on answer sheets first (tiered OCR only); Gemini then only rates legibility.
+# Off by default: answer sheets are mostly handwritten, where tesseract rarely passes and only adds latency
+SHEET_LOCAL_OCR = os.getenv("SHEET_LOCAL_OCR", "0") == "1"
+# Multi-page PDF answer sheets: page limit and pages rendered/read at the same time per sheet
+SHEET_PDF_MAX_PAGES = int(os.getenv("SHEET_PDF_MAX_PAGES", "40"))
+SHEET_PDF_CONCURRENCY = int(os.getenv("SHEET_PDF_CONCURRENCY", "4"))
+
+
+class InvalidSheet(ValueError):
+    """The saved answer sheet cannot be read (e.g. a broken PDF or one with too many pages)."""
+
+
+class SheetReader:
+    """
+    Reads saved answer sheets (images or scanned PDFs) into (legibility_report, transcription).
+    The API and tools/benchmark.py both go through this class, so benchmarks measure the
+    production read path: preprocessing, local OCR, the fused vision call and PDF page fan-out.
+    """
+    def __init__(self, ai_core, ocr):
+        self.ai_core = ai_core
+        self.ocr = ocr
+
+    async def read(self, saved_path: str, use_cache: bool = True) -> tuple[str, str]:
+        """Returns (legibility_report, transcription) for a saved answer sheet image or scanned PDF."""
+        if is_pdf(saved_path):
+            return await self.read_pdf(saved_path, use_cache)
+        return await self.read_image(await self.load(saved_path), use_cache)
+
+    @staticmethod
+    async def load(saved_path: str):
+        """Image for the vision calls: the preprocessed JPEG part, encoded once and shared by every call,
+        or the original image if preprocessing is off or fails."""
+        if SHEET_PREPROCESS:
+            try:
+                sheet = await preprocess_sheet_async(saved_path)
+                return {"mime_type": sheet["mime_type"], "data": sheet["data"]}
+            except Exception as e:
+                print(f"WARN: Sheet preprocessing failed, sending the original image: {e}")
+        return Image.open(saved_path)
+
+    async def read_pdf(self, saved_path: str, use_cache: bool = True) -> tuple[str, str]:
+        """Reads a scanned multi-page sheet page by page. At most SHEET_PDF_CONCURRENCY pages are
+        rendered or in flight at once and only their text is kept, so memory stays flat for long
+        booklets. Transcriptions are stitched in page order."""
+        try:
+            pages = await asyncio.to_thread(pdf_page_count, saved_path)
+        except Exception as e:
+            raise InvalidSheet(f"Could not open PDF answer sheet: {e}") from e
+        if not 0 < pages <= SHEET_PDF_MAX_PAGES:
+            raise InvalidSheet(f"PDF answer sheets must have 1 to {SHEET_PDF_MAX_PAGES} pages (got {pages}).")
+        semaphore = asyncio.Semaphore(SHEET_PDF_CONCURRENCY)
+
+        async def read_page(number):
+            async with semaphore:
+                page = await render_pdf_page_async(saved_path, number)
+                return await self.read_image({"mime_type": page["mime_type"], "data": page["data"]}, use_cache)
+
+        print(f"📄 Reading {pages}-page PDF answer sheet")
+        readings = await asyncio.gather(*[read_page(number) for number in range(pages)])
+        if pages == 1:
+            return readings[0]
+        legibility_report = "\n".join(f"Page {number}: {report}" for number, (report, _) in enumerate(readings, 1))
+        return legibility_report, "\n\n".join(text.strip() for _, text in readings)
+
+    async def read_image(self, student_image, use_cache: bool = True) -> tuple[str, str]:
+        """Returns (legibility_report, transcription) for one loaded sheet image or encoded page."""
+        if SHEET_LOCAL_OCR and isinstance(self.ocr, TieredEngine):
+            # Printed or very clean sheets transcribe locally; handwriting usually falls through to the vision model
+            local = await asyncio.to_thread(self.ocr.recognize_local, student_image)
+            if local:
+                return await self.ai_core.get_handwriting_legibility_async(student_image, use_cache=use_cache), local.text
+        sheet = await self.ai_core.read_answer_sheet_async(student_image, use_cache=use_cache) if FUSED_VISION else None
+        if sheet:
+            return sheet["legibility_report"], sheet["transcription"]
+        # Separate passes are independent of each other, so run them side by side
+        legibility_report, student_answers_text = await asyncio.gather(
+            self.ai_core.get_handwriting_legibility_async(student_image, use_cache=use_cache),
+            self.ai_core.extract_text_from_image_async(student_image, use_cache=use_cache),
+        )
+        return legibility_report, student_answers_text
@@ -0,0 +1,219 @@
+# modules/structured_output.py
+
+import json
+import re
+
+# Response schemas for JSON-producing AICore tasks, in the OpenAPI subset accepted by
+# Gemini's structured-output mode (generation_config.response_schema).
+_EVALUATION_PROPERTIES = {
+    "marks": {"type": "number"},
+    "rationale": {"type": "string"},
+    "feedback": {"type": "string"},
+    "key_concepts_missed": {"type": "string", "description": "Bulleted list, one concept per line"},
+}
+
+RESPONSE_SCHEMAS = {
+    "read_sheet": {
+        "type": "object",
+        "properties": {
+            "transcription": {"type": "string"},
+            "legibility_score": {"type": "integer"},
+            "legibility_comment": {"type": "string"},
+        },
+        "required": ["transcription", "legibility_score", "legibility_comment"],
+    },
+    "assignment": {
+        "type": "object",
+        "properties": {
+            "questions": {"type": "string", "description": "Numbered list of questions"},
+            "answers": {"type": "string", "description": "Numbered list of answers matching the questions"},
+        },
+        "required": ["questions", "answers"],
+    },
+    "evaluation": {
+        "type": "object",
+        "properties": _EVALUATION_PROPERTIES,
+        "required": list(_EVALUATION_PROPERTIES),
+    },
+    "evaluation_batch": {
+        "type": "object",
+        "properties": {
+            "evaluations": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"submission_id": {"type": "string"}, **_EVALUATION_PROPERTIES},
+                    "required": ["submission_id", *_EVALUATION_PROPERTIES],
+                },
+            },
+        },
+        "required": ["evaluations"],
+    },
+    "fairness_batch": {
+        "type": "object",
+        "properties": {
+            "checks": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "submission_id": {"type": "string"},
+                        "verdict": {"type": "string", "description": "Pass or Fail"},
+                        "explanation": {"type": "string"},
+                    },
+                    "required": ["submission_id", "verdict", "explanation"],
+                },
+            },
+        },
+        "required": ["checks"],
+    },
+    "refine_items": {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"number": {"type": "string"}, "question": {"type": "string"}, "answer": {"type": "string"}},
+                    "required": ["number", "question", "answer"],
+                },
+            },
+            "removed": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["items"],
+    },
+}
+
+_FENCE = re.compile(r'```(?:json|JSON)?\s*')
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_DECODER = json.JSONDecoder()
+
+
+def parse_json_response(text: str, schema: dict = None):
+    """
+    Tolerant JSON extraction from model output. Ignores code fences and surrounding prose and
+    returns the first decodable value scanning left to right; with a schema, the first one that
+    conforms to it (falling back to the first decodable value). Returns None if nothing decodes.
+    Trailing commas, a common model slip, are accepted.
+    """
+    if not text:
+        return None
+    cleaned = _FENCE.sub("", text.strip().lstrip("\ufeff"))
+    first = None
+    for candidate in (cleaned, _TRAILING_COMMA.sub(r"\1", cleaned)):
+        start = _next_start(candidate, 0)
+        while start != -1:
+            try:
+                value, end = _DECODER.raw_decode(candidate, start)
+            except json.JSONDecodeError:
+                start = _next_start(candidate, start + 1)
+                continue
+            if schema is None:
+                return value
+            value = coerce(value, schema)
+            if conforms(value, schema):
+                return value
+            if first is None:
+                first = value
+            start = _next_start(candidate, end)
+    return first
+
+
+def _next_start(text: str, pos: int) -> int:
+    starts = [i for i in (text.find("{", pos), text.find("[", pos)) if i != -1]
+    return min(starts) if starts else -1
+
+
+def conforms(value, schema: dict) -> bool:
+    """Shallow check that a parsed value has the schema's top-level type and required keys."""
+    if schema.get("type") == "object":
+        return isinstance(value, dict) and all(key in value for key in schema.get("required", []))
+    if schema.get("type") == "array":
+        return isinstance(value, list)
+    return value is not None
+
+
+def coerce(value, schema: dict):
+    """Wraps a bare list into the schema's single array property (e.g. {"evaluations": [...]})."""
+    if isinstance(value, list) and schema.get("type") == "object":
+        arrays = [key for key, prop in schema.get("properties", {}).items() if prop.get("type") == "array"]
+        if len(arrays) == 1:
+            return {arrays[0]: value}
+    return value
+
+
+def partial_json_strings(text: str, keys) -> dict:
+    """
+    Decodes the (possibly unterminated) string values of `keys` from a JSON object that is
+    still streaming in, e.g. '{"questions": "1. What is' -> {"questions": "1. What is"}.
+    """
+    values = {}
+    for key in keys:
+        match = re.search(r'"%s"\s*:\s*"' % re.escape(key), text)
+        if match:
+            values[key] = _decode_partial_string(text, match.end())
+    return values
+
+
+def partial_json_array(text: str, key: str) -> list:
+    """
+    The complete elements so far of the array value of `key` in a JSON object that is still
+    streaming in, e.g. '{"items": [{"number": "1"}, {"numb' -> [{"number": "1"}].
+    """
+    match = re.search(r'"%s"\s*:\s*\[' % re.escape(key), text)
+    if not match:
+        return []
+    values, pos = [], match.end()
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] == "]":
+            return values
+        try:
+            value, pos = _DECODER.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            return values
+        values.append(value)
+
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def _decode_partial_string(text: str, pos: int) -> str:
+    chars, i = [], pos
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            break
+        if char == "\\":
+            if i + 1 >= len(text):
+                break  # escape sequence split across chunks
+            escaped = text[i + 1]
+            if escaped == "u":
+                if i + 6 > len(text):
+                    break
+                try:
+                    code = int(text[i + 2:i + 6], 16)
+                except ValueError:
+                    break
+                if 0xD800 <= code < 0xDC00:
+                    # High surrogate (e.g. an escaped emoji): wait for its low half
+                    if i + 12 > len(text):
+                        break
+                    try:
+                        low = int(text[i + 8:i + 12], 16) if text[i + 6:i + 8] == "\\u" else -1
+                    except ValueError:
+                        break
+                    if 0xDC00 <= low < 0xE000:
+                        chars.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                        i += 12
+                        continue
+                chars.append(chr(code))
+                i += 6
+                continue
+            chars.append(_ESCAPES.get(escaped, escaped))
+            i += 2
+            continue
+        chars.append(char)
+        i += 1
+    return "".join(chars)
@@ -0,0 +1,126 @@
+# modules/telemetry.py
+
+import bisect
+import threading
+
+# Minimal Prometheus text-format metrics (exposition format 0.0.4), so /metrics needs no extra dependency.
+
+AI_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+HTTP_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(self.labelnames, values)} {_number(v)}" for values, v in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=AI_LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((values, {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}) for values, s in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, inf)} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(series['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """collect() returns (name, type, help, [(labels dict, value), ...]) tuples computed at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                lines.append(f"# collector error: {_escape(e)}")
+                continue
+            for name, metric_type, help_text, samples in families:
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"])
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+AI_REQUEST_SECONDS = REGISTRY.register(Histogram("nextgen_ai_request_duration_seconds", "Latency of individual model requests", ("task", "model", "outcome")))
+AI_INPUT_TOKENS = REGISTRY.register(Counter("nextgen_ai_input_tokens_total", "Prompt tokens sent to the model", ("task", "model")))
+AI_OUTPUT_TOKENS = REGISTRY.register(Counter("nextgen_ai_output_tokens_total", "Tokens generated by the model", ("task", "model")))
+AI_IMAGE_BYTES = REGISTRY.register(Counter("nextgen_ai_image_bytes_total", "Image bytes attached to model requests", ("task", "model")))
+AI_ERRORS = REGISTRY.register(Counter("nextgen_ai_errors_total", "Failed model requests", ("task", "model", "retryable")))
+AI_RETRIES = REGISTRY.register(Counter("nextgen_ai_retries_total", "Model requests retried after a transient error", ("task", "model")))
+AI_CACHE_LOOKUPS = REGISTRY.register(Counter("nextgen_ai_cache_lookups_total", "Response cache lookups", ("task", "result")))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram("nextgen_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"), buckets=HTTP_LATENCY_BUCKETS))
+SHEET_BYTES_IN = REGISTRY.register(Counter("nextgen_sheet_original_bytes_total", "Answer sheet bytes as uploaded"))
+SHEET_BYTES_OUT = REGISTRY.register(Counter("nextgen_sheet_preprocessed_bytes_total", "Answer sheet bytes after preprocessing, as sent to the model"))
+SHEET_PREPROCESS_SECONDS = REGISTRY.register(Histogram("nextgen_sheet_preprocess_duration_seconds", "Answer sheet preprocessing time, including process pool queueing", buckets=HTTP_LATENCY_BUCKETS))
+OCR_PAGES = REGISTRY.register(Counter("nextgen_ocr_pages_total", "Pages run through local OCR, by whether the result was kept, escalated or failed", ("engine", "outcome")))
+OCR_SECONDS = REGISTRY.register(Histogram("nextgen_ocr_duration_seconds", "OCR time per page", ("engine",), buckets=HTTP_LATENCY_BUCKETS))
+LOCAL_SCORES = REGISTRY.register(Counter("nextgen_local_scores_total", "Answers run through the local pre-scorer, by decision (accept, reject, escalate)", ("decision",)))
+DOC_CACHE_LOOKUPS = REGISTRY.register(Counter("nextgen_document_cache_lookups_total", "Parsed-document cache lookups for uploaded source files", ("result",)))
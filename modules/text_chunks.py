@@ -0,0 +1,31 @@
+# modules/text_chunks.py
+
+import re
+
+
+def chunk_text(text: str, chunk_chars: int, overlap_chars: int = 0) -> list:
+    """
+    Splits text into chunks of at most ~chunk_chars, breaking on paragraph, then sentence,
+    boundaries where possible. Consecutive chunks share up to overlap_chars of context.
+    """
+    text = (text or "").strip()
+    if len(text) <= chunk_chars:
+        return [text] if text else []
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        if len(paragraph) <= chunk_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            # Hard-split anything still too long (tables, text without punctuation)
+            pieces.extend(sentence[i:i + chunk_chars] for i in range(0, len(sentence), chunk_chars))
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_chars:
+            chunks.append(current)
+            current = current[-overlap_chars:] if overlap_chars else ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,70 @@
+# modules/uploads.py
+
+import asyncio
+import contextlib
+import os
+import tempfile
+
+# Uploads are copied in fixed-size chunks, so memory per request does not depend on file size
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "50"))  # per file
+UPLOAD_MAX_REQUEST_MB = float(os.getenv("UPLOAD_MAX_REQUEST_MB", "200"))  # whole request body, e.g. a class batch
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+UPLOAD_TEMP_DIR = os.getenv("UPLOAD_TEMP_DIR") or None  # default: the system temp directory
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, filename: str, max_bytes: int):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        super().__init__(f"'{filename}' is larger than the {max_bytes / (1024 * 1024):g} MB upload limit.")
+
+
+def max_upload_bytes() -> int:
+    return int(UPLOAD_MAX_MB * 1024 * 1024)
+
+
+def check_upload_size(upload, max_bytes: int = None):
+    """Rejects an upload whose size is already known (set by the multipart parser) before any copying."""
+    max_bytes = max_bytes or max_upload_bytes()
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(upload.filename or "upload", max_bytes)
+
+
+async def save_upload(upload, path: str, max_bytes: int = None) -> int:
+    """
+    Streams an upload to path in UPLOAD_CHUNK_BYTES chunks and returns the bytes written.
+    Writes go to a unique temp file next to path that is renamed into place, so concurrent
+    uploads to the same name never interleave and a failed or oversized upload leaves nothing behind.
+    Disk writes run in a worker thread so a slow disk never stalls the event loop.
+    """
+    max_bytes = max_bytes or max_upload_bytes()
+    check_upload_size(upload, max_bytes)
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".upload-", suffix=".part")
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            await upload.seek(0)
+            while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(upload.filename or "upload", max_bytes)
+                await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(os.replace, partial, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(partial)
+        raise
+    return written
+
+
+@contextlib.asynccontextmanager
+async def temp_upload(upload, suffix: str = ""):
+    """Yields the path of a private on-disk copy of the upload, removed when the block exits."""
+    fd, path = tempfile.mkstemp(dir=UPLOAD_TEMP_DIR, prefix="nextgen-", suffix=suffix)
+    os.close(fd)
+    try:
+        await save_upload(upload, path)
+        yield path
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(path)
@@ -0,0 +1,20 @@
+# tests/conftest.py
+
+import os
+import sys
+import pytest
+
+# modules/ is imported from the repository root, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# AICore tests run against the offline stand-in, without touching the on-disk response cache
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("AI_FAKE_LATENCY", "fixed:0")
+os.environ["AI_CACHE_ENABLED"] = "0"
+
+
+@pytest.fixture
+def ai_core():
+    from modules.ai_core import AICore
+    core = AICore(api_key=None, backend="fake")
+    yield core
+    core.shutdown()
@@ -0,0 +1,131 @@
+# tests/test_ai_core.py
+
+from modules.structured_output import RESPONSE_SCHEMAS
+
+
+def test_unrepairable_response_is_not_a_result(ai_core, monkeypatch):
+    monkeypatch.setattr(ai_core, "_repair_json", lambda text, schema: None)
+    assert ai_core._parse_or_repair("evaluation", '{"feedback": "Good work."}', RESPONSE_SCHEMAS["evaluation"]) is None
+
+
+def test_repaired_response_is_used(ai_core, monkeypatch):
+    repaired = {"marks": 3, "rationale": "r", "feedback": "f", "key_concepts_missed": "None"}
+    monkeypatch.setattr(ai_core, "_repair_json", lambda text, schema: repaired)
+    assert ai_core._parse_or_repair("evaluation", '{"feedback": "Good work."}', RESPONSE_SCHEMAS["evaluation"]) == repaired
+
+
+def test_evaluation_without_marks_is_not_scored_zero(ai_core, monkeypatch):
+    monkeypatch.setattr(ai_core, "_generate", lambda task, contents, **kwargs: '{"feedback": "Good work."}')
+    monkeypatch.setattr(ai_core, "_repair_json", lambda text, schema: None)
+    assert ai_core.evaluate_student_answer("Water evaporates.", "Water turns into vapour.", "What is evaporation?", 5) is None
+
+
+def test_long_source_mode_precedence(monkeypatch):
+    from modules import ai_core
+    long_source = "Evaporation turns water into vapour. " * 1000
+    assert ai_core.long_source_mode("Short source.") is None
+    assert ai_core.long_source_mode(long_source, context_chars=12000) is None  # already fitted by the caller
+    monkeypatch.setattr(ai_core, "AI_LONG_DOC_MODE", True)
+    monkeypatch.setattr(ai_core, "AI_RETRIEVAL", True)
+    assert ai_core.long_source_mode(long_source) == "reduce"
+    monkeypatch.setattr(ai_core, "AI_LONG_DOC_MODE", False)
+    assert ai_core.long_source_mode(long_source) == "retrieval"
+    monkeypatch.setattr(ai_core, "AI_RETRIEVAL", False)
+    assert ai_core.long_source_mode(long_source) is None
+
+
+def test_long_source_is_map_reduced_by_default(ai_core, monkeypatch):
+    import asyncio
+    from modules import ai_core as module
+    monkeypatch.setattr(module, "AI_LONG_DOC_MODE", True)
+    monkeypatch.setattr(module, "AI_RETRIEVAL", True)
+    reduced = []
+
+    async def reduce_source_async(context, use_cache=True):
+        reduced.append(len(context))
+        return "Notes: evaporation."
+
+    monkeypatch.setattr(ai_core, "reduce_source_async", reduce_source_async)
+    long_source = "Evaporation turns water into vapour. " * 1000
+    assert asyncio.run(ai_core.generate_assignment_async(long_source))
+    assert reduced == [len(long_source)]
+    reduced.clear()
+    assert asyncio.run(ai_core.generate_assignment_async(long_source, context_chars=12000))
+    assert reduced == []
+
+
+QUESTIONS = "1. What is evaporation?\n2. How do clouds form?\n3. What is precipitation?"
+ANSWERS = "1. Water turning into vapour when heated.\n2. Water vapour condenses.\n3. Water falling from clouds."
+
+
+def test_class_grading_per_question_matches_single_sheet_shape(ai_core):
+    import asyncio
+    sheets = [{"id": 1, "answer": "1. Vapour forms.\n2. Condensation.\n3. Rain."}, {"id": 2, "answer": "1. Heat.\n3. Snow."}]
+    batch = asyncio.run(ai_core.evaluate_students_by_question_async(sheets, ANSWERS, QUESTIONS, 100))
+    single = asyncio.run(ai_core.evaluate_by_question_async(sheets[0]["answer"], ANSWERS, QUESTIONS, 100))
+    assert set(batch) == {"1", "2"}
+    for result in batch.values():
+        assert [q["max_marks"] for q in result["per_question"]] == [q["max_marks"] for q in single["per_question"]] == [34, 33, 33]
+        assert result["marks"] == round(sum(q["marks"] for q in result["per_question"]), 2)
+
+
+def test_hung_probe_request_times_out(monkeypatch):
+    import threading
+    import pytest
+    from modules import ai_core as module
+    monkeypatch.setattr(module, "AI_PROBE_TIMEOUT_SECONDS", 0.1)
+    release = threading.Event()
+
+    class HangingModel:
+        def generate_content(self, contents, **kwargs):
+            release.wait(5)
+
+    with pytest.raises(TimeoutError):
+        module.AICore._probe_call(HangingModel())
+    release.set()
+
+
+def test_ready_on_optimistic_model_while_unverified(ai_core):
+    ai_core.probe = {"status": "failed", "model": None, "checked_at": None, "errors": {}}
+    probe = ai_core.probe_state()
+    assert probe["ready"] and probe["optimistic"] and not probe["verified"]
+    ai_core.default_model_name = None  # the AI core could not be configured at all
+    assert not ai_core.probe_state()["ready"]
+
+
+def test_open_circuit_on_one_model_falls_back_to_the_next(ai_core, monkeypatch):
+    from modules import ai_core as module
+    from modules.fake_backend import FakeAPIError, FakeResponse, FakeUsage
+    from modules.model_router import ModelRouter
+
+    class Down:
+        def generate_content(self, contents, **kwargs):
+            raise FakeAPIError(503)
+
+    class Up:
+        def generate_content(self, contents, **kwargs):
+            return FakeResponse("ok", FakeUsage(1, 1))
+
+    monkeypatch.setattr(module, "AI_MAX_RETRIES", 0)
+    monkeypatch.setattr(module, "AI_BREAKER_FAILURES", 1)
+    ai_core.router = ModelRouter({"evaluation": ["model-down", "model-up"]})
+    ai_core.default_model_name = None
+    ai_core._models = {"model-down": Down(), "model-up": Up()}
+    assert ai_core._generate("evaluation", ["prompt"], use_cache=False) == "ok"
+    assert ai_core.breakers["model-down"].status == "open"
+    assert ai_core._generate("evaluation", ["prompt"], use_cache=False) == "ok"  # skips the open model
+    circuits = ai_core.resilience_state()["circuits"]
+    assert circuits["model-down"]["rejected"] == 1
+    assert circuits["model-up"]["status"] == "closed" and circuits["model-up"]["successes"] == 2
+
+
+def test_refine_without_changes_keeps_the_paper_verbatim(ai_core):
+    questions = "Q1) What is evaporation?\nQ2) How do clouds form?"
+    answers = "Ans 1 - Water turns into vapour.\nAns 2 - Vapour condenses."
+    pairs, targets, _ = ai_core._refine_request(questions, answers, "Looks fine")
+    result = ai_core._refine_result(questions, answers, pairs, targets, {"items": [], "removed": []})
+    assert (result["questions"], result["answers"], result["changes"]) == (questions, answers, [])
+    edit = {"items": [{"number": "2", "question": "Explain how clouds form.", "answer": ""}], "removed": []}
+    result = ai_core._refine_result(questions, answers, pairs, targets, edit)
+    assert result["questions"] == "Q1) What is evaporation?\nQ2) Explain how clouds form."
+    assert result["answers"] == answers
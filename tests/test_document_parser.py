@@ -0,0 +1,88 @@
+# tests/test_document_parser.py
+
+import io
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+
+from modules import document_parser
+from modules.document_parser import DocumentParser
+
+
+def make_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for number in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {number + 1} text")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def parallel(monkeypatch):
+    monkeypatch.setattr(document_parser, "DOC_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(document_parser, "DOC_PARSE_WORKERS", 2)
+    monkeypatch.setattr(document_parser, "DOC_PAGES_PER_TASK", 2)
+
+
+def test_pool_parse_matches_inline(monkeypatch):
+    pdf = make_pdf(7)
+    inline = DocumentParser().parse(pdf, "pdf")
+    parallel(monkeypatch)
+    try:
+        assert DocumentParser().parse(pdf, "pdf") == inline  # pages are pickled to and from spawned workers
+    finally:
+        document_parser.shutdown()
+    assert "Page 7 text" in inline
+
+
+def test_broken_pool_falls_back_to_inline_extraction(monkeypatch):
+    class BrokenAfterFirstRange:
+        def __init__(self):
+            self.submitted = 0
+
+        def submit(self, fn, *args):
+            future = Future()
+            if self.submitted == 0:
+                future.set_result(fn(*args))
+            else:
+                future.set_exception(BrokenProcessPool("worker died"))
+            self.submitted += 1
+            return future
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            pass
+
+    pdf = make_pdf(7)
+    inline = DocumentParser().parse(pdf, "pdf")
+    parallel(monkeypatch)
+    monkeypatch.setattr(document_parser, "_pool", BrokenAfterFirstRange())
+    assert DocumentParser().parse(pdf, "pdf") == inline
+    assert document_parser._pool is None  # the next large PDF gets a fresh pool
+
+
+def zip_with(name: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(name, "<xml/>")
+    return buffer.getvalue()
+
+
+def test_sniff_reads_the_content_not_the_name():
+    parser = DocumentParser()
+    assert parser.sniff(make_pdf(1), "notes.txt") == "pdf"
+    assert parser.sniff(zip_with("ppt/presentation.xml")) == "pptx"
+    assert parser.sniff(zip_with("word/document.xml")) == "docx"
+    assert parser.sniff(zip_with("other.xml")) is None
+    assert parser.sniff(b"\x89PNG\r\n\x1a\n....") == "image"
+    assert parser.sniff(b"<!DOCTYPE html><p>Hi</p>") == "html"
+    assert parser.sniff(b"# Title", "notes.md") == "markdown"
+    assert parser.sniff(b"\xef\xbb\xbfplain " + "é".encode() * 1024) == "text"  # a character split at the sniff window is fine
+    assert parser.sniff(b"bin\x00ary") is None
+
+
+def test_parse_from_an_open_file_leaves_it_usable():
+    f = io.BytesIO(b"<html><body><p>Water cycle</p><script>x()</script></body></html>")
+    assert DocumentParser().parse(f).strip() == "Water cycle"
+    assert not f.closed
@@ -0,0 +1,91 @@
+# tests/test_image_hash.py
+
+import io
+import random
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+from modules.image_hash import SHEET_HASH_SIZE, dhash, dhash_file, hamming_distance
+
+
+def template_sheet(student: int) -> Image.Image:
+    """A printed answer template (header box, ruled lines, question labels) with one student's strokes."""
+    rng = random.Random(student)
+    image = Image.new("L", (1240, 1754), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((60, 60, 1180, 200), outline=0, width=4)
+    for y in range(260, 1700, 48):
+        draw.line((60, y, 1180, y), fill=170, width=2)
+    for question in range(4):
+        draw.text((70, 280 + question * 380), f"Q{question + 1}.", fill=0)
+    for line in range(rng.randint(8, 20)):
+        x, y = 130, 300 + line * 72
+        for _ in range(rng.randint(3, 9)):
+            width = rng.randint(30, 110)
+            draw.line((x, y + rng.randint(-6, 6), x + width, y + rng.randint(-6, 6)), fill=40, width=3)
+            x += width + rng.randint(15, 35)
+    return image
+
+
+def rephotograph(image: Image.Image) -> Image.Image:
+    image = image.rotate(1.0, fillcolor=230).resize((992, 1403))
+    image = ImageEnhance.Brightness(image).enhance(0.9).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_hash_size():
+    assert len(dhash(template_sheet(1), SHEET_HASH_SIZE)) == SHEET_HASH_SIZE * SHEET_HASH_SIZE // 4
+    assert len(dhash(template_sheet(1), 8)) == 16
+
+
+def test_identical_images_hash_identically():
+    assert hamming_distance(dhash(template_sheet(3), SHEET_HASH_SIZE), dhash(template_sheet(3), SHEET_HASH_SIZE)) == 0
+
+
+def test_rephotographed_sheet_stays_close():
+    sheet = template_sheet(4)
+    assert hamming_distance(dhash(sheet, SHEET_HASH_SIZE), dhash(rephotograph(sheet), SHEET_HASH_SIZE)) <= 40
+
+
+def test_different_students_on_one_template_are_further_apart_than_64_bit_hashes_suggest():
+    sheets = [template_sheet(student) for student in range(6)]
+    pairs = [(a, b) for i, a in enumerate(sheets) for b in sheets[i + 1:]]
+    # 64-bit hashes put different students only a few bits apart; 256-bit hashes keep them well separated
+    assert min(hamming_distance(dhash(a, 8), dhash(b, 8)) for a, b in pairs) < 8
+    assert min(hamming_distance(dhash(a, SHEET_HASH_SIZE), dhash(b, SHEET_HASH_SIZE)) for a, b in pairs) > 16
+
+
+def test_hashes_of_different_length_never_match():
+    assert hamming_distance("00", "0000") == 16
+
+
+def test_pdf_pages_are_concatenated(tmp_path):
+    doc = fitz.open()
+    for number in range(3):
+        doc.new_page().insert_text((72, 72 + number * 40), f"Page {number}")
+    path = tmp_path / "sheet.pdf"
+    doc.save(str(path))
+    assert len(dhash_file(str(path))) == 3 * SHEET_HASH_SIZE * SHEET_HASH_SIZE // 4
+
+
+def test_duplicate_lookup_is_scoped_to_the_student_and_exact_bytes():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from modules import crud, models
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    sheet_hash = dhash(template_sheet(5), SHEET_HASH_SIZE)
+    original = crud.create_submission(
+        db, user_id=1, assignment_name="Quiz", student_name="A", score=5, max_score=10, created_at=None,
+        assignment_id=1, student_id=7, sheet_hash=sheet_hash, sheet_sha256="abc", result_json="{}",
+    )
+    assert crud.find_duplicate_submission(db, 1, 1, 7, "abc").id == original.id
+    assert crud.find_duplicate_submission(db, 1, 1, 8, "abc") is None  # another student's identical bytes
+    assert crud.find_duplicate_submission(db, 1, 1, None, "abc") is None
+    assert crud.find_duplicate_submission(db, 1, 1, 7, "def") is None  # re-photo: no exact match
+    assert crud.find_similar_submission(db, 1, 1, 7, sheet_hash, 24).id == original.id
+    assert crud.find_similar_submission(db, 1, 1, 8, sheet_hash, 24) is None
+    assert crud.get_graded_submission(db, 1, 1, 8, original.id) is None
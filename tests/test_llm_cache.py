@@ -0,0 +1,63 @@
+# tests/test_llm_cache.py
+
+from PIL import Image
+
+from modules import llm_cache
+from modules.llm_cache import LLMCache, content_hash
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+def make_cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock.time)
+    return LLMCache(str(tmp_path / "cache.sqlite"), **kwargs), clock
+
+
+def test_memory_lru_falls_back_to_disk(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch, max_memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("a") == "A"  # evicted from memory, still on disk
+    assert cache.get("c") == "C"
+    assert (cache.counters["disk_hits"], cache.counters["memory_hits"]) == (1, 1)
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, ttl_seconds=60)
+    cache.set("k", "v")
+    clock.now += 61
+    assert cache.get("k") is None
+    assert cache.stats()["disk_entries"] == 0  # expired rows are dropped on read
+
+
+def test_disk_is_trimmed_least_recently_used_first(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, max_memory_entries=1, max_disk_bytes=20)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.set(key, key * 10)
+    clock.now += 1
+    assert cache.get("a") == "a" * 10  # touch "a" so "b" is the oldest
+    cache._trim_disk(clock.now)
+    assert cache.get("b") is None
+    assert cache.stats()["disk_bytes"] <= 20 and cache.counters["evictions"] == 1
+
+
+def test_cache_survives_a_restart(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    cache.set("k", "v")
+    assert LLMCache(str(tmp_path / "cache.sqlite")).get("k") == "v"
+
+
+def test_content_hash_matches_reencoded_images():
+    image = Image.new("RGB", (4, 4), "white")
+    assert content_hash(["Grade this", image]) == content_hash(["Grade this", image.copy()])
+    assert content_hash(["Grade this", image]) != content_hash(["Grade that", image])
+    assert content_hash(["a", "b"]) != content_hash(["ab"])
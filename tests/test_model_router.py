@@ -0,0 +1,39 @@
+# tests/test_model_router.py
+
+import json
+
+from modules.model_router import DEFAULT_ROUTES, ModelRouter, load_routes
+
+
+def test_chain_ends_with_the_probed_default_model():
+    router = ModelRouter({"ocr": ["model-a", "model-b"]})
+    assert router.chain("ocr", "model-c") == ["model-a", "model-b", "model-c"]
+    assert router.chain("ocr", "model-a") == ["model-a", "model-b"]
+    assert router.chain("unrouted", "model-c") == ["model-c"]
+
+
+def test_routes_override_per_task(monkeypatch, tmp_path):
+    monkeypatch.setenv("AI_ROUTES", json.dumps({"ocr": "model-x"}))
+    routes = load_routes()
+    assert routes["ocr"] == ["model-x"]
+    assert routes["evaluation"] == DEFAULT_ROUTES["evaluation"]
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps({"evaluation": ["model-y", "model-z"]}))
+    monkeypatch.setenv("AI_ROUTES", str(path))
+    assert load_routes()["evaluation"] == ["model-y", "model-z"]
+
+
+def test_invalid_routes_fall_back_to_defaults(monkeypatch):
+    for override in ("{not json", '["model-x"]'):
+        monkeypatch.setenv("AI_ROUTES", override)
+        assert load_routes() == DEFAULT_ROUTES
+
+
+def test_stats_accumulate_tokens_and_cost_per_route():
+    router = ModelRouter({"evaluation": ["gemini-2.0-flash"]})
+    router.record("evaluation", "gemini-2.0-flash", 0.5, ok=True, input_tokens=1_000_000, output_tokens=1_000_000)
+    router.record("evaluation", "gemini-2.0-flash", 1.5, ok=False)
+    (stats,) = router.stats()
+    assert (stats["calls"], stats["errors"], stats["input_tokens"]) == (2, 1, 1_000_000)
+    assert stats["cost_usd"] == 0.5
+    assert (stats["latency_avg"], stats["latency_max"]) == (1.0, 1.5)
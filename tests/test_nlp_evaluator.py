@@ -0,0 +1,65 @@
+# tests/test_nlp_evaluator.py
+
+import pytest
+from modules.nlp_evaluator import AnswerEvaluator, order_agreement, tokenize
+
+WATER = "Water turns into vapour when heated."
+PHOTOSYNTHESIS = "Photosynthesis is the process by which plants make food using sunlight."
+
+
+def decide(model_answer: str, student_answer: str) -> dict:
+    return AnswerEvaluator().score_pairs([model_answer], [student_answer])[0]
+
+
+def test_stemming_is_consistent_across_inflections():
+    assert len({*tokenize("form forms formed forming")}) == 1
+    assert len({*tokenize("evaporate evaporates evaporated evaporating")}) == 1
+    assert tokenize("run running") == ["run", "run"]
+    assert tokenize("gas gases process photosynthesis") == ["gas", "gas", "process", "photosynthesis"]
+
+
+def test_negations_are_kept():
+    assert tokenize("It is not hot, it isn't cold and never wet") == ["not", "hot", "not", "cold", "never", "wet"]
+
+
+def test_clear_match_is_accepted():
+    score = decide(WATER, "Water turns into vapour when it is heated.")
+    assert score["decision"] == "accept"
+    assert AnswerEvaluator.to_result(score, 2)["marks"] == 2
+
+
+def test_blank_answer_is_rejected():
+    score = decide(WATER, "(no answer)")
+    assert score["decision"] == "reject" and score["blank"]
+    assert AnswerEvaluator.to_result(score, 2)["marks"] == 0
+
+
+@pytest.mark.parametrize("model_answer, student_answer", [
+    (WATER, "When liquid H2O gets hot it becomes a gas."),
+    (PHOTOSYNTHESIS, "Plants use sunlight to make sugar food."),
+])
+def test_paraphrases_go_to_the_model(model_answer, student_answer):
+    assert decide(model_answer, student_answer)["decision"] == "escalate"
+
+
+def test_negated_answer_is_not_accepted():
+    assert decide(WATER, "Water is not turning into vapour when heated.")["decision"] == "escalate"
+    assert decide("Metals do not float on water.", "Metals float on water.")["decision"] == "escalate"
+
+
+def test_word_salad_is_not_accepted():
+    score = decide(WATER, "vapour heated water turning")
+    assert score["similarity"] == 1.0
+    assert score["decision"] == "escalate"
+
+
+def test_order_agreement():
+    assert order_agreement(tokenize(WATER), tokenize("Water turns to vapour on heating")) == 1.0
+    assert order_agreement(tokenize(WATER), tokenize("vapour heated water turning")) == 0.5
+    assert order_agreement(tokenize(WATER), tokenize("Ice melts")) == 0.0
+
+
+def test_nothing_is_rejected_without_being_blank():
+    students = ["Completely unrelated text about football.", "Mitochondria", "vapour"]
+    scores = AnswerEvaluator().score_pairs([WATER] * len(students), students)
+    assert [score["decision"] for score in scores] == ["escalate"] * len(students)
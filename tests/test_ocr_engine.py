@@ -0,0 +1,54 @@
+# tests/test_ocr_engine.py
+
+import pytest
+from modules.ocr_engine import GeminiEngine, OCREngine, OCRError, TesseractEngine, TieredEngine, build_ocr_engine
+
+
+class StubCore:
+    def __init__(self, vision_model=object(), text="1. Evaporation"):
+        self.vision_model = vision_model
+        self.text = text
+
+    def extract_text_from_image(self, image):
+        return self.text
+
+
+def test_engines_must_implement_recognize():
+    class Incomplete(OCREngine):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_build_fails_clearly_without_any_engine(monkeypatch):
+    monkeypatch.setattr(TesseractEngine, "available", lambda self: False)
+    with pytest.raises(OCRError, match="No OCR engine available"):
+        build_ocr_engine(None)
+
+
+def test_build_falls_back_to_tesseract_without_ai_core(monkeypatch):
+    monkeypatch.setattr(TesseractEngine, "available", lambda self: True)
+    assert build_ocr_engine(None, "gemini").name == "tesseract"
+
+
+def test_gemini_engine_raises_instead_of_returning_error_text():
+    with pytest.raises(OCRError, match="Vision model not initialized"):
+        GeminiEngine(StubCore(vision_model=None)).recognize(None)
+    with pytest.raises(OCRError):
+        GeminiEngine(StubCore(text="Error during OCR: quota")).recognize(None)
+    assert GeminiEngine(StubCore()).recognize(None).text == "1. Evaporation"
+
+
+class BrokenLocal(OCREngine):
+    name = "broken"
+    local = True
+
+    def recognize(self, image):
+        raise ValueError("could not convert string to float: 'conf'")
+
+
+def test_tiered_escalates_when_local_engine_raises():
+    tiered = TieredEngine(BrokenLocal(), GeminiEngine(StubCore()))
+    assert tiered.recognize_local(None) is None
+    assert tiered.recognize(None).text == "1. Evaporation"
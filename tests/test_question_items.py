@@ -0,0 +1,99 @@
+# tests/test_question_items.py
+
+from modules.question_items import align_items, allocate_marks, join_numbered, merge_items, pair_items, rebuild_numbered, referenced_numbers, split_numbered
+
+
+def test_split_numbered_styles():
+    text = "1. What is evaporation?\nQ2) How do clouds form?\nQuestion 3: What is rain?"
+    assert split_numbered(text) == [
+        {"number": "1", "text": "What is evaporation?"},
+        {"number": "2", "text": "How do clouds form?"},
+        {"number": "3", "text": "What is rain?"},
+    ]
+
+
+def test_split_numbered_ignores_non_increasing_numbers_in_bodies():
+    items = split_numbered("1. Steps:\n1. heat\n2. cool\n2. Second question")
+    assert [item["number"] for item in items] == ["1", "2"]
+    assert "heat" in items[0]["text"]
+
+
+def test_split_numbered_keeps_preamble_and_unnumbered_text():
+    assert split_numbered("Answer all.\n1. First")[0]["text"] == "Answer all.\nFirst"
+    assert split_numbered("Just prose") == [{"number": "1", "text": "Just prose"}]
+    assert split_numbered("   ") == []
+
+
+def test_join_numbered_round_trip():
+    items = [{"number": "1", "text": "A"}, {"number": "2", "text": "B"}]
+    assert split_numbered(join_numbered(items)) == items
+
+
+def test_rebuild_numbered_keeps_untouched_items_verbatim():
+    paper = "Answer all questions.\n\nQ1) What is evaporation?\n\nQuestion 2: How do clouds form?\n  (3 marks)\nQ3) What is rain?\n"
+    items = split_numbered(paper)
+    assert rebuild_numbered(paper, items) == paper
+    items[1] = {"number": "2", "text": "Explain how clouds form."}
+    assert rebuild_numbered(paper, items) == "Answer all questions.\n\nQ1) What is evaporation?\n\nQuestion 2: Explain how clouds form.\nQ3) What is rain?\n"
+
+
+def test_rebuild_numbered_removes_and_appends_items():
+    paper = "Q1) First\nQ2) Second\nQ3) Third"
+    items = [{"number": "1", "text": "First"}, {"number": "3", "text": "Third"}, {"number": "4", "text": "Fourth"}, {"number": "5", "text": ""}]
+    assert rebuild_numbered(paper, items) == "Q1) First\nQ3) Third\n4. Fourth"
+    assert rebuild_numbered("Just prose", [{"number": "1", "text": "Just prose"}]) == "Just prose"
+
+
+def test_align_items_by_number():
+    items = align_items("1. Q one\n2. Q two\n3. Q three", "1. A one\n2. A two\n3. A three", "2. S two\n3. S three")
+    assert items[0] == {"number": "1", "question": "Q one", "model_answer": "A one", "student_answer": ""}
+    assert items[1]["student_answer"] == "S two"
+
+
+def test_align_items_unnumbered_transcription_goes_to_every_item():
+    items = align_items("1. Q one\n2. Q two", "1. A\n2. B", "free text answer")
+    assert [item["student_answer"] for item in items] == ["free text answer", "free text answer"]
+
+
+def test_allocate_marks():
+    assert allocate_marks(100, 3) == [34, 33, 33]
+    assert sum(allocate_marks(7, 4)) == 7
+    assert allocate_marks(10, 0) == []
+
+
+def test_referenced_numbers():
+    assert referenced_numbers("Make question 3 harder") == ["3"]
+    assert referenced_numbers("Q2 and Q5 are too easy") == ["2", "5"]
+    assert referenced_numbers("Rewrite questions 2-4") == ["2", "3", "4"]
+    assert referenced_numbers("#4 has a typo") == ["4"]
+    assert referenced_numbers("Items 1, 3 and 6") == ["1", "3", "6"]
+
+
+def test_referenced_numbers_ignores_ordinary_counts():
+    assert referenced_numbers("Keep answers 2-3 sentences long") == []
+    assert referenced_numbers("No 2 questions should test the same idea") == []
+    assert referenced_numbers("Use at most 5 marks per answer") == []
+
+
+def test_pair_items_keeps_orphan_answers():
+    pairs = pair_items("1. Q one", "1. A one\n2. A two")
+    assert pairs == [{"number": "1", "question": "Q one", "answer": "A one"}, {"number": "2", "question": "", "answer": "A two"}]
+
+
+def test_merge_items_modify_add_remove():
+    pairs = pair_items("1. Q1\n2. Q2\n3. Q3", "1. A1\n2. A2\n3. A3")
+    merged, changes = merge_items(pairs, [{"number": "2", "question": "Q2 harder", "answer": ""}, {"number": "4", "question": "Q4", "answer": "A4"}], ["3"])
+    assert [(p["number"], p["question"], p["answer"]) for p in merged] == [("1", "Q1", "A1"), ("2", "Q2 harder", "A2"), ("4", "Q4", "A4")]
+    assert [(c["number"], c["action"]) for c in changes] == [("2", "modified"), ("4", "added"), ("3", "removed")]
+
+
+def test_merge_items_unchanged_item_is_not_a_change():
+    pairs = pair_items("1. Q1", "1. A1")
+    assert merge_items(pairs, [{"number": "1", "question": "Q1", "answer": "A1"}], [])[1] == []
+
+
+def test_merge_items_removal_wins_over_a_returned_item():
+    pairs = pair_items("1. Q1\n2. Q2\n3. Q3", "1. A1\n2. A2\n3. A3")
+    merged, changes = merge_items(pairs, [{"number": "3", "question": "Q3 again", "answer": "A3"}], ["3."])
+    assert [p["number"] for p in merged] == ["1", "2"]
+    assert [(c["number"], c["action"]) for c in changes] == [("3", "removed")]
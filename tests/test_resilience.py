@@ -0,0 +1,73 @@
+# tests/test_resilience.py
+
+import pytest
+
+from modules.fake_backend import FakeAPIError
+from modules.resilience import AIServiceUnavailable, CircuitBreaker, CircuitOpen, TokenBucket, is_retryable
+
+
+def test_token_bucket_rejects_once_wait_exceeds_limit():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2, max_wait=0.0)
+    bucket.acquire()
+    bucket.acquire()
+    with pytest.raises(AIServiceUnavailable) as exc:
+        bucket.acquire()
+    assert exc.value.retry_after > 0
+    state = bucket.state()
+    assert state["acquired"] == 2 and state["rejected"] == 1
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=600, capacity=1, max_wait=1.0)
+    bucket.acquire()
+    bucket.acquire()  # refills at 10 tokens/s, so this waits ~0.1s
+    assert bucket.state()["throttled"] == 1
+
+
+def test_breaker_opens_after_consecutive_retryable_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure(counts_towards_open=False)  # a 400 says nothing about availability
+    assert breaker.status == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.status == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_breaker_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()  # cool-down over: the trial call goes through
+    assert breaker.status == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.status == CircuitBreaker.OPEN
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.status == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (FakeAPIError(429), True),
+    (FakeAPIError(503), True),
+    (FakeAPIError(400), False),
+    (FakeAPIError(403), False),
+    (TimeoutError("read timed out"), True),
+    (ConnectionError("reset"), True),
+    (ValueError("bad schema"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_grpc_style_code_method_is_not_retried():
+    class GrpcError(Exception):
+        def code(self):
+            return 14
+    assert is_retryable(GrpcError()) is False
@@ -0,0 +1,80 @@
+# tests/test_structured_output.py
+
+import json
+
+from modules.structured_output import RESPONSE_SCHEMAS, coerce, conforms, parse_json_response, partial_json_array, partial_json_strings
+
+EVALUATION = RESPONSE_SCHEMAS["evaluation"]
+BATCH = RESPONSE_SCHEMAS["evaluation_batch"]
+
+
+def evaluation(marks=7):
+    return {"marks": marks, "rationale": "r", "feedback": "f", "key_concepts_missed": "- k"}
+
+
+def test_plain_json():
+    assert parse_json_response('{"marks": 7, "rationale": "r", "feedback": "f", "key_concepts_missed": "- k"}', EVALUATION) == evaluation()
+
+
+def test_code_fence_and_prose_are_ignored():
+    text = 'Here is the evaluation:\n```json\n{"marks": 7, "rationale": "r", "feedback": "f", "key_concepts_missed": "- k"}\n```\nHope this helps.'
+    assert parse_json_response(text, EVALUATION) == evaluation()
+
+
+def test_trailing_commas_are_accepted():
+    text = '{"marks": 7, "rationale": "r", "feedback": "f", "key_concepts_missed": "- k",}'
+    assert parse_json_response(text, EVALUATION) == evaluation()
+
+
+def test_first_conforming_object_wins_over_earlier_fragments():
+    text = 'Scale: {"max": 10}. Result: {"marks": 7, "rationale": "r", "feedback": "f", "key_concepts_missed": "- k"}'
+    assert parse_json_response(text, EVALUATION) == evaluation()
+
+
+def test_falls_back_to_first_decodable_value():
+    assert parse_json_response('{"marks": 7}', EVALUATION) == {"marks": 7}
+
+
+def test_nothing_decodable():
+    assert parse_json_response("no json here", EVALUATION) is None
+    assert parse_json_response("", EVALUATION) is None
+
+
+def test_bare_list_is_wrapped_into_the_single_array_property():
+    items = [{"submission_id": "1", **evaluation()}]
+    assert coerce(items, BATCH) == {"evaluations": items}
+    assert parse_json_response('[{"submission_id": "1", "marks": 7, "rationale": "r", "feedback": "f", "key_concepts_missed": "- k"}]', BATCH) == {"evaluations": items}
+
+
+def test_conforms_checks_required_keys():
+    assert conforms(evaluation(), EVALUATION)
+    assert not conforms({"marks": 7}, EVALUATION)
+    assert not conforms([evaluation()], EVALUATION)
+
+
+def test_partial_strings_from_a_stream():
+    assert partial_json_strings('{"questions": "1. What is', ["questions", "answers"]) == {"questions": "1. What is"}
+    assert partial_json_strings('{"questions": "a\\nb", "answers": "x\\u00e9', ["questions", "answers"]) == {"questions": "a\nb", "answers": "xé"}
+
+
+def test_partial_strings_stop_before_a_split_escape():
+    assert partial_json_strings('{"answers": "line\\', ["answers"]) == {"answers": "line"}
+    assert partial_json_strings('{"answers": "caf\\u00', ["answers"]) == {"answers": "caf"}
+
+
+def test_partial_strings_grow_chunk_by_chunk_to_the_final_values():
+    full = json.dumps({"questions": "1. Why is the sky blue? \U0001F30D\n2. What is \"rain\"?", "answers": "1. Rayleigh scattering.\t2. Water."})
+    previous = {"questions": "", "answers": ""}
+    for end in range(len(full) + 1):
+        values = partial_json_strings(full[:end], previous.keys())
+        for key, value in values.items():
+            assert value.startswith(previous[key])  # deltas are never retracted
+            previous[key] = value
+    assert previous == json.loads(full)
+
+
+def test_partial_array_returns_only_complete_elements():
+    text = '{"items": [{"number": "1", "question": "Q"}, {"number": "2", "quest'
+    assert partial_json_array(text, "items") == [{"number": "1", "question": "Q"}]
+    assert partial_json_array(text + 'ion": "R"}], "removed": []}', "items") == [{"number": "1", "question": "Q"}, {"number": "2", "question": "R"}]
+    assert partial_json_array('{"removed": [', "items") == []
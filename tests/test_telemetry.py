@@ -0,0 +1,40 @@
+# tests/test_telemetry.py
+
+from modules.telemetry import Counter, Histogram, MetricsRegistry
+
+
+def test_counter_renders_labelled_series():
+    counter = Counter("demo_total", "Demo counter", ("task",))
+    counter.inc("grade")
+    counter.inc("grade", amount=2)
+    counter.inc('say "hi"')
+    assert counter.render() == [
+        "# HELP demo_total Demo counter",
+        "# TYPE demo_total counter",
+        'demo_total{task="grade"} 3',
+        'demo_total{task="say \\"hi\\""} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("demo_seconds", "Demo latency", ("model",), buckets=(0.5, 1.0))
+    for value in (0.2, 0.5, 0.7, 3.0):
+        histogram.observe(value, "m")
+    assert histogram.render()[2:] == [
+        'demo_seconds_bucket{model="m",le="0.5"} 2',
+        'demo_seconds_bucket{model="m",le="1"} 3',
+        'demo_seconds_bucket{model="m",le="+Inf"} 4',
+        'demo_seconds_sum{model="m"} 4.4',
+        'demo_seconds_count{model="m"} 4',
+    ]
+
+
+def test_registry_renders_collectors_and_survives_their_errors():
+    registry = MetricsRegistry()
+    registry.register(Counter("demo_total", "Demo counter")).inc()
+    registry.register_collector(lambda: [("demo_open", "gauge", "Demo gauge", [({"model": "a"}, 1), ({"model": "b"}, 0)])])
+    registry.register_collector(lambda: 1 / 0)
+    text = registry.render()
+    assert "demo_total 1\n" in text
+    assert 'demo_open{model="a"} 1\ndemo_open{model="b"} 0\n' in text
+    assert "# collector error: division by zero" in text
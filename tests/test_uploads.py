@@ -0,0 +1,55 @@
+# tests/test_uploads.py
+
+import asyncio
+import io
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from modules import uploads
+from modules.uploads import UploadTooLarge, save_upload, temp_upload
+
+
+def upload(data: bytes, size: int = None) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="sheet.png", size=size)
+
+
+def test_save_upload_copies_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 4)
+    path = tmp_path / "sheet.png"
+    assert asyncio.run(save_upload(upload(b"0123456789"), str(path), max_bytes=10)) == 10
+    assert path.read_bytes() == b"0123456789"
+    assert os.listdir(tmp_path) == ["sheet.png"]
+
+
+def test_oversized_stream_leaves_nothing_behind(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_BYTES", 4)
+    path = tmp_path / "sheet.png"
+    with pytest.raises(UploadTooLarge) as exc:
+        asyncio.run(save_upload(upload(b"0123456789"), str(path), max_bytes=9))  # size unknown: caught while streaming
+    assert exc.value.max_bytes == 9
+    assert os.listdir(tmp_path) == []
+
+
+def test_declared_size_is_rejected_before_copying(tmp_path):
+    class NoRead(UploadFile):
+        async def read(self, size: int = -1):
+            raise AssertionError("an upload over the declared limit must not be read")
+
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(save_upload(NoRead(file=io.BytesIO(b"x" * 20), filename="big.pdf", size=20), str(tmp_path / "big.pdf"), max_bytes=10))
+    assert os.listdir(tmp_path) == []
+
+
+def test_temp_upload_is_removed_after_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_TEMP_DIR", str(tmp_path))
+
+    async def use():
+        async with temp_upload(upload(b"%PDF-1.4 data"), suffix=".pdf") as path:
+            with open(path, "rb") as f:
+                assert f.read() == b"%PDF-1.4 data"
+        return path
+
+    assert not os.path.exists(asyncio.run(use()))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,165 @@
+# tools/benchmark.py
+"""
+Golden-set grading benchmark: runs every sheet in a golden set through the same read + grade
+pipeline as /grade-submission and reports wall time, model call counts and score drift.
+
+Record fixtures once against Gemini, then replay them for free and deterministically:
+    GEMINI_API_KEY=... python tools/benchmark.py --mode record --label gemini-2.5-pro
+    python tools/benchmark.py --mode replay --label new-prompt --compare benchmark-results/<previous>.json
+
+Score drift is reported against each sheet's expected_marks in the golden set and, with
+--compare, against the scores of an earlier run. The response cache is off in every mode, so
+timings and call counts never come from an earlier run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Grade a golden set of answer sheets and report timing, calls and score drift.")
+    parser.add_argument("--golden", default=os.path.join(ROOT, "benchmarks", "golden.json"))
+    parser.add_argument("--mode", choices=["replay", "record", "gemini", "fake"], default="replay", help="AI backend (replay serves recorded fixtures)")
+    parser.add_argument("--fixtures", help="fixture store directory (default: AI_FIXTURES_PATH)")
+    parser.add_argument("--grading", choices=["per-question", "whole"], default="per-question")
+    parser.add_argument("--concurrency", type=int, default=4, help="sheets graded at the same time")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out-dir", default="benchmark-results")
+    parser.add_argument("--compare", help="previous result JSON to compare scores and timings against")
+    return parser.parse_args()
+
+
+async def grade_sheet(ai_core, reader, assignment: dict, sheet: dict, grading: str) -> dict:
+    started = time.perf_counter()
+    result = {"assignment": assignment["name"], "sheet": sheet["path"], "expected_marks": sheet.get("expected_marks")}
+    try:
+        # Same read path as /grade-submission: async preprocessing, local OCR tier, fused vision call, PDF pages
+        _, transcription = await reader.read(os.path.join(ROOT, sheet["path"]))
+        grade = ai_core.evaluate_by_question_async if grading == "per-question" else ai_core.evaluate_student_answer_async
+        evaluation = await grade(transcription, assignment["answers"], assignment["questions"], max_marks=assignment.get("max_marks", 100))
+        result["marks"] = evaluation.get("marks") if evaluation else None
+        result["error"] = None if evaluation else "no usable evaluation"
+    except Exception as e:
+        result["marks"], result["error"] = None, f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run(ai_core, reader, golden: dict, args) -> list:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(assignment, sheet):
+        async with semaphore:
+            return await grade_sheet(ai_core, reader, assignment, sheet, args.grading)
+
+    return await asyncio.gather(*[bounded(assignment, sheet) for assignment in golden["assignments"] for sheet in assignment["sheets"]])
+
+
+def drift(sheets: list, reference: dict) -> dict:
+    """Mean and max absolute score difference against {sheet: marks}, over sheets scored in both."""
+    diffs = [abs(s["marks"] - reference[s["sheet"]]) for s in sheets if s["marks"] is not None and reference.get(s["sheet"]) is not None]
+    if not diffs:
+        return {"compared": 0, "mean_abs": None, "max_abs": None}
+    return {"compared": len(diffs), "mean_abs": round(sum(diffs) / len(diffs), 2), "max_abs": round(max(diffs), 2)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    # Backend settings are read when modules.ai_core is imported
+    os.environ["AI_BACKEND"] = args.mode
+    if args.fixtures:
+        os.environ["AI_FIXTURES_PATH"] = args.fixtures
+    if args.mode == "replay":
+        # No quota behind recorded fixtures; keep the client-side limiter from dominating wall time
+        os.environ.setdefault("AI_RATE_LIMIT_RPM", "100000")
+    else:
+        # Cached responses from earlier runs would hide model calls and wall time
+        os.environ["AI_CACHE_ENABLED"] = "0"
+    sys.path.insert(0, ROOT)
+    from modules.ai_core import AICore
+    from modules import image_preprocess
+    from modules.ocr_engine import build_ocr_engine
+    from modules.replay_backend import FIXTURES
+    from modules.sheet_reader import SheetReader
+
+    with open(args.golden, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    ai_core = AICore(api_key=os.getenv("GEMINI_API_KEY"))
+    if ai_core.probe_state()["status"] == "pending":
+        ai_core.start_probe()
+
+    reader = SheetReader(ai_core, build_ocr_engine(ai_core))
+
+    started = time.perf_counter()
+    sheets = asyncio.run(run(ai_core, reader, golden, args))
+    wall = time.perf_counter() - started
+    ai_core.shutdown()
+    image_preprocess.shutdown()
+
+    routes = ai_core.router.stats()
+    calls = {}
+    for route in routes:
+        task = calls.setdefault(route["task"], {"calls": 0, "errors": 0})
+        task["calls"] += route["calls"]
+        task["errors"] += route["errors"]
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+    result = {
+        "label": args.label,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"mode": args.mode, "grading": args.grading, "concurrency": args.concurrency, "golden": os.path.relpath(args.golden, ROOT),
+                   "response_cache": ai_core.cache is not None},
+        "wall_seconds": round(wall, 2),
+        "sheets_graded": sum(s["marks"] is not None for s in sheets),
+        "sheets_failed": sum(s["marks"] is None for s in sheets),
+        "calls": calls,
+        "model_calls": sum(task["calls"] for task in calls.values()),
+        "input_tokens": sum(route["input_tokens"] for route in routes),
+        "output_tokens": sum(route["output_tokens"] for route in routes),
+        "cost_usd": round(sum(route["cost_usd"] for route in routes), 4),
+        "fixtures": dict(FIXTURES.counters),
+        "drift_vs_expected": drift(sheets, {s["sheet"]: s["expected_marks"] for s in sheets}),
+        "drift_vs_previous": drift(sheets, {s["sheet"]: s["marks"] for s in previous["sheets"]}) if previous else None,
+        "sheets": sheets,
+    }
+
+    print(f"\n📊 {result['label']} @ {result['commit']} [{args.mode}, {args.grading}]")
+    print(f"Wall time: {result['wall_seconds']}s for {len(sheets)} sheet(s), {result['sheets_failed']} failed")
+    print(f"Model calls: {result['model_calls']} " + ", ".join(f"{task}={c['calls']}" for task, c in sorted(calls.items())))
+    print(f"Tokens: {result['input_tokens']} in / {result['output_tokens']} out (~${result['cost_usd']})")
+    if args.mode in ("record", "replay"):
+        print(f"Fixtures: {result['fixtures']}")
+    print(f"Score drift vs expected: {result['drift_vs_expected']}")
+    if previous:
+        print(f"Score drift vs {previous.get('label')}: {result['drift_vs_previous']}")
+        print(f"Wall time vs {previous.get('label')}: {previous.get('wall_seconds')}s -> {result['wall_seconds']}s; model calls {previous.get('model_calls')} -> {result['model_calls']}")
+    for sheet in sheets:
+        if sheet["error"]:
+            print(f"⚠️  {sheet['sheet']}: {sheet['error']}")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    path = os.path.join(args.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.label}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=4)
+    print(f"\n💾 Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
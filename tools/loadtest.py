@@ -0,0 +1,295 @@
+# tools/loadtest.py
+"""
+End-to-end load test for the Nextgen Ed API.
+
+Start the server against the local Gemini stand-in so no quota is used, with its caches and the
+duplicate-sheet shortcut off so every request does the full work, e.g.
+    AI_BACKEND=fake AI_FAKE_LATENCY=lognormal:800:0.5 AI_CACHE_ENABLED=0 DOC_CACHE_ENABLED=0 SHEET_DEDUPE=0 uvicorn app:app --workers 1
+then drive it at a target request rate:
+    python tools/loadtest.py --rps 20 --duration 60 --label baseline
+    python tools/loadtest.py --rps 20 --duration 60 --label candidate --compare loadtest-results/<baseline>.json
+
+Requests are sent open-loop on a fixed schedule; latency is measured from each request's
+scheduled start so a slow server cannot hide queueing delay. Results are written to
+--out-dir as JSON (with the git commit) for comparison between versions.
+
+Every sheet and source upload carries a unique nonce (drawn onto the sheet, added as a line of
+the source) and grading is sent with fresh=true, so caches on the server cannot answer for the
+model even if they are left on. Pass --cached to repeat identical payloads and measure the cache.
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = ["token", "grade-submission", "generate-assignment", "me/dashboard"]
+ASSIGNMENT_NAME = "Load test: Water Cycle"
+QUESTIONS = "1. What is evaporation?\n2. How do clouds form?\n3. What is precipitation?"
+ANSWERS = "1. Water turning into vapour when heated.\n2. Water vapour condenses around dust particles.\n3. Water falling from clouds as rain, snow or hail."
+SOURCE_TEXT = "The water cycle describes how water evaporates from the surface, condenses into clouds and returns as precipitation. " * 40
+
+
+def request(base_url: str, method: str, path: str, token: str = None, json_body=None, form=None, files=None, timeout: float = 120):
+    """Minimal HTTP client (stdlib only). Returns (status, body bytes)."""
+    headers, data = {}, None
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if json_body is not None:
+        data = json.dumps(json_body).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    elif files:
+        data, headers["Content-Type"] = multipart(form or {}, files)
+    elif form is not None:
+        data = urllib.parse.urlencode(form).encode("utf-8")
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    req = urllib.request.Request(base_url.rstrip("/") + "/" + path.lstrip("/"), data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except (urllib.error.URLError, OSError) as e:
+        return 0, str(e).encode("utf-8")
+
+
+def multipart(form: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in form.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8"))
+    for name, (filename, content, content_type) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'.encode("utf-8"))
+        body.write(content)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode("utf-8"))
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def sample_source() -> bytes:
+    import fitz
+    document = fitz.open()
+    for start in range(0, len(SOURCE_TEXT), 2500):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), SOURCE_TEXT[start:start + 2500], fontsize=10)
+    return document.tobytes()
+
+
+def sample_sheet() -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (1240, 1754), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(ANSWERS.splitlines()):
+        draw.text((80, 120 + 60 * i), line, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def vary_sheet(sheet: bytes, nonce: str) -> bytes:
+    """The sheet with a nonce line drawn in its bottom margin, so its bytes, hashes and transcription are unique."""
+    from PIL import Image, ImageDraw
+    with Image.open(io.BytesIO(sheet)) as image:
+        image = image.convert("RGB")
+    ImageDraw.Draw(image).text((80, image.height - 60), f"Ref {nonce}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def vary_source(source: bytes, nonce: str) -> bytes:
+    """The source with a nonce line added: as text on the first page of a PDF, appended to a text
+    source, or unchanged for other formats (e.g. DOCX), whose bytes cannot simply be extended."""
+    if not source.startswith(b"%PDF"):
+        try:
+            source.decode("utf-8")
+        except UnicodeDecodeError:
+            return source
+        return source + f"\nRef {nonce}\n".encode("utf-8")
+    import fitz
+    with fitz.open(stream=source, filetype="pdf") as document:
+        document[0].insert_text((50, 30), f"Ref {nonce}", fontsize=8)
+        return document.tobytes()
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.email = args.email or f"loadtest-{uuid.uuid4().hex[:8]}@example.com"
+        self.password = args.password
+        self.token = None
+        self.sheet = open(args.sheet, "rb").read() if args.sheet else sample_sheet()
+        self.source_name = os.path.basename(args.source) if args.source else "source.pdf"
+        self.source = open(args.source, "rb").read() if args.source else sample_source()
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def setup(self):
+        base = self.args.base_url
+        status, body = request(base, "POST", "/users/", json_body={"email": self.email, "password": self.password})
+        if status not in (200, 400):
+            raise SystemExit(f"Could not create load test user ({status}): {body[:200]!r}")
+        status, body = request(base, "POST", "/token", form={"username": self.email, "password": self.password})
+        if status != 200:
+            raise SystemExit(f"Could not log in as {self.email} ({status}): {body[:200]!r}")
+        self.token = json.loads(body)["access_token"]
+        request(base, "POST", "/save-assignment", token=self.token, json_body={"assignment_name": ASSIGNMENT_NAME, "questions": QUESTIONS, "answers": ANSWERS})
+
+    def payload(self, endpoint: str):
+        """Upload for one request: unique per request unless --cached."""
+        if endpoint == "grade-submission":
+            return vary_sheet(self.sheet, uuid.uuid4().hex) if self.args.fresh else self.sheet
+        if endpoint == "generate-assignment":
+            return vary_source(self.source, uuid.uuid4().hex) if self.args.fresh else self.source
+        return None
+
+    def call(self, endpoint: str, payload: bytes = None):
+        base = self.args.base_url
+        if endpoint == "token":
+            return request(base, "POST", "/token", form={"username": self.email, "password": self.password})
+        if endpoint == "grade-submission":
+            form = {"assignment_name": ASSIGNMENT_NAME, "fresh": str(self.args.fresh).lower()}
+            return request(base, "POST", "/grade-submission", token=self.token, form=form, files={"student_sheet": ("sheet.jpg", payload or self.sheet, "image/jpeg")})
+        if endpoint == "generate-assignment":
+            return request(base, "POST", "/generate-assignment", files={"source_file": (self.source_name, payload or self.source, "application/octet-stream")})
+        if endpoint == "me/dashboard":
+            return request(base, "GET", "/me/dashboard", token=self.token)
+        raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+    def _run_one(self, endpoint: str, scheduled: float):
+        prepared = time.perf_counter()
+        payload = self.payload(endpoint)
+        started = time.perf_counter()
+        status, _ = self.call(endpoint, payload)
+        finished = time.perf_counter()
+        # Building the payload is client work, not server latency
+        latency = finished - scheduled - (started - prepared)
+        with self._lock:
+            self.samples.append({"endpoint": endpoint, "status": status, "latency": latency, "service_time": finished - started})
+
+    def run(self) -> dict:
+        endpoints = self.args.endpoints
+        total = int(self.args.rps * self.args.duration)
+        print(f"🚀 {total} requests at {self.args.rps} rps over {self.args.duration}s against {self.args.base_url}: {', '.join(endpoints)}")
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            start = time.perf_counter()
+            for i in range(total):
+                scheduled = start + i / self.args.rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._run_one, endpoints[i % len(endpoints)], scheduled)
+        elapsed = time.perf_counter() - start
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        results = {}
+        for endpoint in self.args.endpoints:
+            samples = [s for s in self.samples if s["endpoint"] == endpoint]
+            ok = [s for s in samples if 200 <= s["status"] < 300]
+            latencies = sorted(s["latency"] for s in ok)
+            statuses = {}
+            for s in samples:
+                statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+            results[endpoint] = {
+                "requests": len(samples),
+                "ok": len(ok),
+                "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+                "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": round(latencies[-1], 4) if latencies else None,
+                "statuses": statuses,
+            }
+        return {
+            "label": self.args.label,
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {"base_url": self.args.base_url, "rps": self.args.rps, "duration": self.args.duration, "concurrency": self.args.concurrency, "fresh": self.args.fresh, "endpoints": self.args.endpoints},
+            "elapsed_seconds": round(elapsed, 2),
+            "endpoints": results,
+        }
+
+
+def percentile(sorted_values: list, pct: float):
+    """Nearest-rank percentile in seconds, or None without samples."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return round(sorted_values[int(rank) - 1], 4)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: dict, baseline: dict = None):
+    print(f"\n📊 {result['label']} @ {result['commit']} ({result['elapsed_seconds']}s)")
+    print(f"{'endpoint':<22}{'reqs':>7}{'ok':>7}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, r in result["endpoints"].items():
+        cells = [f"{r[k]:.3f}" if r[k] is not None else "-" for k in ("p50", "p95", "p99")]
+        print(f"{endpoint:<22}{r['requests']:>7}{r['ok']:>7}{r['error_rate'] * 100:>6.1f}%{r['throughput_rps']:>8.2f}{cells[0]:>9}{cells[1]:>9}{cells[2]:>9}")
+        previous = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if previous:
+            deltas = [delta(r[k], previous.get(k)) for k in ("throughput_rps", "p50", "p95", "p99")]
+            print(f"{'  vs ' + str(baseline.get('label')):<41}{deltas[0]:>8}{deltas[1]:>9}{deltas[2]:>9}{deltas[3]:>9}")
+
+
+def delta(current, previous) -> str:
+    if current is None or not previous:
+        return "-"
+    return f"{(current - previous) / previous * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Nextgen Ed API at a fixed request rate.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=10.0, help="target requests per second across all endpoints")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=256, help="maximum requests in flight")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--cached", action="store_true", help="send identical payloads without fresh=true, measuring the server's caches")
+    parser.add_argument("--email", help="existing account to use (default: a new throwaway account)")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--sheet", help="answer sheet image to upload (default: a generated A4 JPEG)")
+    parser.add_argument("--source", help="source material to upload (default: a generated PDF)")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out-dir", default="loadtest-results")
+    parser.add_argument("--compare", help="previous result JSON to compare against")
+    args = parser.parse_args()
+    args.endpoints = [e.strip().strip("/") for e in args.endpoints.split(",") if e.strip()]
+    args.fresh = not args.cached
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+    test = LoadTest(args)
+    test.setup()
+    result = test.run()
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    path = os.path.join(args.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.label}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=4)
+    print(f"\n💾 Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()